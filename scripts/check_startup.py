@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Check that `import govdemo.cli` stays within its startup budget.
+
+Runs `python -X importtime -c "import govdemo.cli"` a few times in fresh
+interpreters and takes the fastest run. Fails if the cumulative import time
+is over --budget-ms, or if a heavy dependency is imported eagerly (those
+belong inside the command that needs them).
+
+    python scripts/check_startup.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY = ("pyarrow", "duckdb", "yaml", "pydantic")
+
+def import_times(module: str) -> dict[str, int]:
+    """module -> cumulative import time (us) for one fresh interpreter."""
+    src = str(Path(__file__).resolve().parents[1]/"src")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in [src, os.environ.get("PYTHONPATH", "")] if p)}
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, env=env, check=True).stderr
+    times = {}
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--module", default="govdemo.cli")
+    ap.add_argument("--budget-ms", type=float, default=150.0)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    runs = [import_times(args.module) for _ in range(max(args.runs, 1))]
+    best = min(runs, key=lambda t: t[args.module])
+    total_ms = best[args.module] / 1000
+    top_level = sorted(((us, name) for name, us in best.items() if "." not in name and name != args.module),
+                       reverse=True)[:10]
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {len(runs)}, budget {args.budget_ms:.0f} ms)")
+    for us, name in top_level:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    heavy = [m for m in HEAVY if m in best]
+    if heavy:
+        print(f"FAIL: eagerly imported: {', '.join(heavy)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: over budget by {total_ms - args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
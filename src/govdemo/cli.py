@@ -1,77 +1,274 @@
+from pathlib import Path
 import typer
 from rich import print
-from rich.panel import Panel
-
-from govdemo.pipelines.init import run_init
-from govdemo.pipelines.seed import run_seed
-from govdemo.pipelines.ingest import run_ingest
-from govdemo.pipelines.clean import run_clean
-from govdemo.pipelines.curate import run_curate
-from govdemo.pipelines.serve import run_serve
-from govdemo.pipelines.identity import run_build_identity
-from govdemo.pipelines.export import run_export_audience
-from govdemo.pipelines.gdpr import request_delete
+
+# pipelines (pyarrow, duckdb, yaml) are imported inside each command so `--help` and
+# light commands stay fast; scripts/check_startup.py keeps this from regressing
 
 app = typer.Typer(add_completion=False)
 
+@app.callback()
+def global_options(profile: bool = typer.Option(False, "--profile",
+                                                help="Write cProfile + tracemalloc output per run to warehouse/profiles/")):
+    if profile:
+        from govdemo.common.config import load_env_config
+        from govdemo.common.metrics import enable_profiling
+        enable_profiling(load_env_config().profiles_dir)
+
 @app.command("init")
 def init_cmd():
+    from rich.panel import Panel
+    from govdemo.pipelines.init import run_init
     res = run_init()
     print(Panel.fit(f"Initialized lake + audit DB\nlake_root: {res['lake_root']}\nduckdb: {res['duckdb']}\nlineage: {res['lineage']}"))
+    if res["lineage_imported"]:
+        print(f"Imported {res['lineage_imported']} edges from legacy lineage.jsonl")
 
 @app.command("seed")
 def seed_cmd():
+    from govdemo.pipelines.seed import run_seed
     res = run_seed()
     print(f"Seeded landing file {res['landing_file']} ({res['rows']} rows)")
 
 @app.command("ingest")
-def ingest_cmd(source: str = "app", dt: str = typer.Option(None, help="Partition date YYYY-MM-DD")):
-    res = run_ingest(source=source, dt=dt)
-    print(f"Ingest complete run_id={res['run_id']}")
-    print(f"raw: {res['raw_path']} ({res['good']} rows)")
+def ingest_cmd(source: str = "app", dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+               part_mb: int = typer.Option(256, help="Roll raw output into parts of about this size (MB)"),
+               workers: int = typer.Option(1, help="Worker processes splitting landing input"),
+               dedupe: bool = typer.Option(False, "--dedupe",
+                                           help="Skip event_ids already in raw and append to raw instead of replacing")):
+    from govdemo.pipelines.ingest import run_ingest
+    res = run_ingest(source=source, dt=dt, workers=workers, part_bytes=part_mb * 1024 * 1024, dedupe=dedupe)
+    print(f"Ingest complete run_id={res['run_id']} ({res['rows_per_sec']:.0f} rows/sec)")
+    print(f"raw: {res['raw_path']} ({res['good']} {'new ' if dedupe else ''}rows in {len(res['raw_parts'])} parts)")
     print(f"quarantine: {res['quarantine_path']} ({res['bad']} rows)")
+    if dedupe:
+        print(f"duplicates: {res['duplicate_path']} ({res['duplicates']} rows)")
 
 @app.command("clean")
-def clean_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD")):
-    res = run_clean(dt=dt)
-    print(f"Clean complete run_id={res['run_id']}")
-    print(f"clean: {res['clean_path']} ({res['rows']} rows)")
+def clean_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+              workers: int = typer.Option(1, help="Worker processes cleaning raw parts in parallel"),
+              row_group_rows: int = typer.Option(None, help="Rows per parquet row group (default: layout policy)"),
+              compression: str = typer.Option(None, help="Parquet compression codec (default: layout policy)"),
+              force: bool = typer.Option(False, "--force", help="Re-clean parts even if raw is unchanged")):
+    from govdemo.pipelines.clean import run_clean
+    res = run_clean(dt=dt, workers=workers, row_group_size=row_group_rows, compression=compression, force=force)
+    print(f"Clean {'skipped (inputs unchanged)' if res['skipped'] else 'complete'} run_id={res['run_id']}")
+    print(f"clean: {res['clean_path']} ({res['rows']} rows in {len(res['clean_parts'])} parts)")
 
 @app.command("curate")
-def curate_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD")):
-    res = run_curate(dt=dt)
-    print(f"Curate complete run_id={res['run_id']}")
+def curate_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+               engine: str = typer.Option("duckdb", help="Aggregation engine: duckdb or arrow"),
+               force: bool = typer.Option(False, "--force", help="Recompute even if clean inputs are unchanged"),
+               window: list[int] = typer.Option([], "--window", help="Also maintain an N-day rolling window (repeatable)"),
+               rebuild_windows: bool = typer.Option(False, "--rebuild-windows",
+                                                    help="Recompute windows from daily facts instead of updating")):
+    from govdemo.pipelines.curate import run_curate
+    from govdemo.pipelines.windows import run_windows
+    res = run_curate(dt=dt, engine=engine, force=force)
+    print(f"Curate {'skipped (inputs unchanged)' if res['skipped'] else 'complete'} run_id={res['run_id']}")
     print(f"curated: {res['curated_path']} ({res['rows']} rows)")
+    if window:
+        wres = run_windows(dt=dt, windows=window, rebuild=rebuild_windows)
+        for w in wres["windows"]:
+            print(f"window {w['window_days']}d: {w['path']} ({w['rows']} users, {w['mode']})")
 
 @app.command("serve")
-def serve_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD")):
-    res = run_serve(dt=dt)
-    print(f"Serve complete run_id={res['run_id']}")
+def serve_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+              force: bool = typer.Option(False, "--force", help="Rebuild even if curated input is unchanged"),
+              mode: str = typer.Option("stream", help="stream: copy row groups, renaming in the schema; "
+                                                      "link: hard-link curated files plus a column-map sidecar"),
+              window: int = typer.Option(None, help="Publish the N-day rolling window instead of daily metrics")):
+    from govdemo.pipelines.serve import run_serve
+    res = run_serve(dt=dt, force=force, mode=mode, window=window)
+    print(f"Serve {'skipped (inputs unchanged)' if res['skipped'] else 'complete (' + res['mode'] + ')'} run_id={res['run_id']}")
     print(f"serving: {res['serving_path']} ({res['rows']} rows)")
 
 @app.command("build-identity")
 def identity_cmd(dt: str = typer.Option(None, help="Partition date YYYY-MM-DD")):
+    from govdemo.pipelines.identity import run_build_identity
     res = run_build_identity(dt=dt)
     print(f"Identity build complete run_id={res['run_id']}")
     print(f"restricted_pii: {res['identity_path']} ({res['rows']} rows)")
 
 @app.command("export-audience")
 def export_cmd(min_events: int = typer.Option(1, help="Include users with events >= min_events"),
-               dt: str = typer.Option(None, help="Partition date YYYY-MM-DD")):
-    res = run_export_audience(min_events=min_events, dt=dt)
+               dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+               fmt: str = typer.Option("csv", "--format", help="Output format: csv or parquet"),
+               window: int = typer.Option(None, help="Apply min_events to the N-day rolling window ending at dt"),
+               evidence_log: bool = typer.Option(False, "--evidence-log",
+                                                 help="Append evidence to the compressed evidence log, not one file each")):
+    from govdemo.pipelines.export import run_export_audience
+    res = run_export_audience(min_events=min_events, dt=dt, fmt=fmt, window=window, evidence_log=evidence_log)
     print(f"Export complete export_id={res['export_id']} run_id={res['run_id']}")
     print(f"output: {res['output_path']} ({res['rows']} rows)")
     print(f"evidence: {res['evidence']}")
 
+@app.command("export-segments")
+def export_segments_cmd(spec: str = typer.Option(..., "--spec", help="YAML file listing segments (name, min_events)"),
+                        start: str = typer.Option(None, help="First partition date YYYY-MM-DD"),
+                        end: str = typer.Option(None, help="Last partition date YYYY-MM-DD (defaults to --start)"),
+                        fmt: str = typer.Option("csv", "--format", help="Output format: csv or parquet"),
+                        evidence_log: bool = typer.Option(False, "--evidence-log",
+                                                          help="Append evidence to the compressed evidence log, not one file each")):
+    from govdemo.pipelines.export import load_segments, run_export_segments
+    res = run_export_segments(load_segments(spec), start=start, end=end, fmt=fmt, evidence_log=evidence_log)
+    print(f"Segment export complete dt={res['dt']} run_id={res['run_id']}")
+    for seg in res["segments"]:
+        if seg["skipped"]:
+            print(f"{seg['segment']}: skipped, no dt has facts/identity")
+            continue
+        print(f"{seg['segment']}: {seg['output_path']} ({seg['rows']} rows)")
+        if seg["missing_dts"]:
+            print(f"  skipped dt without facts/identity: {', '.join(seg['missing_dts'])}")
+
+@app.command("compact")
+def compact_cmd(layer: list[str] = typer.Option([], "--layer", help="Layer to compact (repeatable, default: all)"),
+                dt: str = typer.Option(None, help="Only this partition date (default: every dt)"),
+                dry_run: bool = typer.Option(False, "--dry-run", help="Only report fragmentation")):
+    from govdemo.pipelines.compact import run_compact
+    res = run_compact(layers=layer or None, dt=dt, dry_run=dry_run)
+    for p in res["partitions"]:
+        mark = "*" if p["fragmented"] else " "
+        print(f"{mark} {p['layer']:<16} {p['path']}: {p['files']} files -> {p['target_files']}, "
+              f"{p['rows']} rows, {p['bytes']} bytes, {p['row_groups']} row groups "
+              f"(avg {p['avg_row_group_rows']} rows), {p['small_files']} small")
+    verb = "would compact" if dry_run else "compacted"
+    print(f"{verb} {res['compacted']} of {len(res['partitions'])} partitions"
+          + (f" run_id={res['run_id']}" if res["run_id"] else ""))
+
+@app.command("run")
+def run_cmd(start: str = typer.Option(None, help="First partition date YYYY-MM-DD"),
+            end: str = typer.Option(None, help="Last partition date YYYY-MM-DD (defaults to --start)"),
+            stages: str = typer.Option(None, help="Comma-separated target stages, upstream stages added (default: all)"),
+            workers: int = typer.Option(2, help="Stage runs executed concurrently"),
+            force: bool = typer.Option(False, "--force", help="Run stages even if audit_runs shows them complete"),
+            source: str = typer.Option("app", help="Ingest source"),
+            dedupe: bool = typer.Option(False, "--dedupe", help="Ingest with --dedupe"),
+            min_events: int = typer.Option(1, help="export-audience threshold")):
+    from govdemo.pipelines.dag import STAGES, run_dag
+    res = run_dag(start=start, end=end, stages=[s.strip() for s in (stages or ",".join(STAGES)).split(",") if s.strip()],
+                  workers=workers, force=force, options={"source": source, "dedupe": dedupe, "min_events": min_events})
+    for stage, dt, status, seconds, error in res["runs"]:
+        print(f"{dt} {stage:<16} {status:<8} {seconds:7.2f}s {error}")
+    chain = " -> ".join(f"{stage}[{dt}] {seconds:.2f}s" for stage, dt, seconds in res["critical_path"])
+    print(f"critical path {res['critical_path_s']:.2f}s of {res['wall_s']:.2f}s wall: {chain or '-'}")
+    print(f"DAG {res['status']} run_id={res['run_id']} done={res['done']} skipped={res['skipped']} "
+          f"failed={res['failed']} blocked={res['blocked']}")
+    if res["status"] != "SUCCESS":
+        raise typer.Exit(1)
+
+@app.command("bench")
+def bench_cmd(rows: int = typer.Option(1_000_000, help="Synthetic events to generate"),
+              users: int = typer.Option(100_000, help="Distinct user_ids"),
+              skew: float = typer.Option(1.1, help="Zipf exponent of events per user (0 = uniform)"),
+              pii_cardinality: int = typer.Option(0, help="Distinct emails/IPs (0 = one per user)"),
+              invalid_rate: float = typer.Option(0.001, help="Share of records missing event_id"),
+              seed: int = typer.Option(42, help="Generator seed"),
+              dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+              stages: str = typer.Option(None, help="Comma-separated stages to time, in order (default: all)"),
+              workers: int = typer.Option(1, help="--workers passed to ingest and clean"),
+              workdir: str = typer.Option(None, help="Scratch project dir (default: temp dir, removed after)"),
+              keep: bool = typer.Option(False, "--keep", help="Keep the temp scratch dir"),
+              out: str = typer.Option(None, help="Also write the JSON report to this file")):
+    import json
+    from govdemo.pipelines.bench import BENCH_STAGES, GeneratorSpec, run_bench
+    spec = GeneratorSpec(rows=rows, users=users, skew=skew, pii_cardinality=pii_cardinality,
+                         invalid_rate=invalid_rate, seed=seed, dt=dt or "")
+    res = run_bench(spec, workdir=Path(workdir) if workdir else None,
+                    stages=[s.strip() for s in (stages or ",".join(BENCH_STAGES)).split(",") if s.strip()], workers=workers, keep=keep)
+    report = json.dumps(res, indent=2)
+    if out:
+        Path(out).write_text(report + "\n", encoding="utf-8")
+    typer.echo(report)
+    if any(r["exit_code"] for r in res["stages"]):
+        raise typer.Exit(1)
+
 gdpr_app = typer.Typer()
 app.add_typer(gdpr_app, name="gdpr")
 
 @gdpr_app.command("request")
-def gdpr_request_cmd(user_id: str = typer.Option(..., "--user-id"), mode: str = typer.Option("delete"), dt: str = typer.Option(None)):
-    res = request_delete(user_id=user_id, mode=mode, dt=dt)
+def gdpr_request_cmd(user_id: str = typer.Option(..., "--user-id"), mode: str = typer.Option("delete"), dt: str = typer.Option(None),
+                     evidence_log: bool = typer.Option(False, "--evidence-log",
+                                                       help="Append evidence to the compressed evidence log, not one file each")):
+    if not user_id.strip():
+        raise typer.BadParameter("user_id is required", param_hint="--user-id")
+    from govdemo.pipelines.gdpr import request_delete
+    res = request_delete(user_id=user_id, mode=mode, dt=dt, evidence_log=evidence_log)
     print(f"GDPR request fulfilled: request_id={res.request_id} run_id={res.run_id}")
     print(f"evidence: {res.evidence_path}")
 
+@gdpr_app.command("request-batch")
+def gdpr_request_batch_cmd(file: str = typer.Option(..., "--file", help="Text file with one user_id per line"),
+                           mode: str = typer.Option("delete"), dt: str = typer.Option(None),
+                           evidence_log: bool = typer.Option(False, "--evidence-log",
+                                                             help="Append evidence to the compressed evidence log, not one file each")):
+    from govdemo.pipelines.gdpr import request_delete_batch
+    with open(file, encoding="utf-8") as f:
+        user_ids = [line.strip() for line in f]
+    results = request_delete_batch(user_ids, mode=mode, dt=dt, evidence_log=evidence_log)
+    if not results:
+        print("No user_ids in file; nothing to do.")
+        return
+    touched = sum(1 for r in results if r.cleaned_files or r.curated_files or r.serving_files or r.identity_files)
+    print(f"GDPR batch fulfilled: {len(results)} requests ({touched} users found) run_id={results[0].run_id}")
+    print(f"evidence: {Path(results[0].evidence_path).parent}")
+
+serving_app = typer.Typer()
+app.add_typer(serving_app, name="serving")
+
+@serving_app.command("get")
+def serving_get_cmd(user_id: list[str] = typer.Option([], "--user-id", help="Repeat for a batched lookup"),
+                    start: str = typer.Option(None, help="Range lookup: user_id >= start"),
+                    end: str = typer.Option(None, help="Range lookup: user_id <= end"),
+                    dt: str = typer.Option(None, help="Partition date YYYY-MM-DD"),
+                    window: int = typer.Option(None, help="Read the N-day rolling window (served with serve --window)")):
+    from govdemo.serving.reader import UserMetricsReader
+    reader = UserMetricsReader(dt, window)
+    table = reader.get(user_id) if user_id else reader.range(start, end)
+    for row in table.to_pylist():
+        print(row)
+    total = sum(reader._file(p).num_row_groups for p in reader.files)
+    print(f"{table.num_rows} rows; read {reader.row_groups_read} of {total} row groups in {len(reader.files)} files")
+
+@serving_app.command("http")
+def serving_http_cmd(host: str = typer.Option("127.0.0.1", help="Bind address"),
+                     port: int = typer.Option(8765, help="Bind port")):
+    from govdemo.serving.server import make_server
+    server = make_server(host, port)
+    print(f"Serving user_metrics lookups on http://{host}:{port} (GET /users/<user_id>, /users?user_id=..., /healthz)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+lineage_app = typer.Typer()
+app.add_typer(lineage_app, name="lineage")
+
+def _print_lineage(ref: str, direction: str, depth: int | None):
+    from govdemo.common.acl import check_read
+    from govdemo.common.lineage import lineage_graph
+    check_read("warehouse")
+    graph = lineage_graph()
+    if ref not in graph and Path(ref).exists():
+        ref = str(Path(ref).absolute())
+    if ref not in graph:
+        print(f"No lineage recorded for {ref}")
+        raise typer.Exit(1)
+    hits = graph.upstream(ref, depth) if direction == "upstream" else graph.downstream(ref, depth)
+    print(f"{direction} of {ref}: {len(hits)} refs")
+    for d, r in hits:
+        print(f"{'  ' * d}{r}")
+
+@lineage_app.command("upstream")
+def lineage_upstream_cmd(ref: str, depth: int = typer.Option(None, help="Stop after this many hops")):
+    _print_lineage(ref, "upstream", depth)
+
+@lineage_app.command("downstream")
+def lineage_downstream_cmd(ref: str, depth: int = typer.Option(None, help="Stop after this many hops")):
+    _print_lineage(ref, "downstream", depth)
+
 def main():
     app()
 
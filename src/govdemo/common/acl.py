@@ -1,7 +1,12 @@
 from dataclasses import dataclass
+import hashlib
 import os
+import threading
+import time
 import yaml
-from .config import load_env_config
+from .context import run_context
+
+RECHECK_S = float(os.environ.get("GOVDEMO_ACL_RECHECK_S", "2"))
 
 class AccessDenied(RuntimeError):
     pass
@@ -10,27 +15,87 @@ class AccessDenied(RuntimeError):
 class RolePerms:
     read: set[str]
     write: set[str]
+    read_mask: int = 0
+    write_mask: int = 0
+
+class _RoleCache:
+    """Compiled roles.local.yaml: role -> (read bitmask, write bitmask) over layer bits.
+
+    Checks are answered from memory. The file is re-stat'ed at most every
+    RECHECK_S seconds and only re-parsed when its mtime/size and content hash
+    change; `reload_roles()` forces a reload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.layer_bits: dict[str, int] = {}
+        self.roles: dict[str, RolePerms] = {}
+        self._stat_key: tuple | None = None
+        self._digest: str | None = None
+        self._checked_at = float("-inf")
+
+    def _bit(self, layer: str) -> int:
+        bit = self.layer_bits.get(layer)
+        if bit is None:
+            bit = self.layer_bits[layer] = 1 << len(self.layer_bits)
+        return bit
+
+    def _compile(self, text: str) -> dict[str, RolePerms]:
+        data = yaml.safe_load(text) or {}
+        out: dict[str, RolePerms] = {}
+        for name, perms in data.get("roles", {}).items():
+            read = set(perms.get("read", []))
+            write = set(perms.get("write", []))
+            out[name] = RolePerms(
+                read=read,
+                write=write,
+                read_mask=sum(self._bit(layer) for layer in read),
+                write_mask=sum(self._bit(layer) for layer in write),
+            )
+        return out
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            path = run_context().config.roles_path
+            st = path.stat()
+            stat_key = (str(path), st.st_mtime_ns, st.st_size)
+            self._checked_at = time.monotonic()
+            if not force and stat_key == self._stat_key:
+                return
+            raw = path.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            if force or digest != self._digest:
+                self.roles = self._compile(raw.decode("utf-8"))
+                self._digest = digest
+            self._stat_key = stat_key
+
+    def get(self) -> "_RoleCache":
+        if time.monotonic() - self._checked_at >= RECHECK_S:
+            self.refresh()
+        return self
+
+_CACHE = _RoleCache()
+
+def reload_roles() -> None:
+    """Re-read roles.local.yaml now (e.g. after editing it, or between tests)."""
+    _CACHE.refresh(force=True)
 
 def _load_roles() -> dict[str, RolePerms]:
-    cfg = load_env_config()
-    data = yaml.safe_load(cfg.roles_path.read_text(encoding="utf-8"))
-    roles = data.get("roles", {})
-    out: dict[str, RolePerms] = {}
-    for name, perms in roles.items():
-        out[name] = RolePerms(read=set(perms.get("read", [])), write=set(perms.get("write", [])))
-    return out
+    return _CACHE.get().roles
 
 def current_role() -> str:
-    return os.environ.get("GOVDEMO_ROLE", "analyst")
+    return run_context().role
 
 def check_read(layer: str) -> None:
     role = current_role()
-    roles = _load_roles()
-    if role not in roles or layer not in roles[role].read:
+    cache = _CACHE.get()
+    perms = cache.roles.get(role)
+    if perms is None or not perms.read_mask & cache.layer_bits.get(layer, 0):
         raise AccessDenied(f"AccessDenied: role '{role}' cannot read layer '{layer}'")
 
 def check_write(layer: str) -> None:
     role = current_role()
-    roles = _load_roles()
-    if role not in roles or layer not in roles[role].write:
+    cache = _CACHE.get()
+    perms = cache.roles.get(role)
+    if perms is None or not perms.write_mask & cache.layer_bits.get(layer, 0):
         raise AccessDenied(f"AccessDenied: role '{role}' cannot write layer '{layer}'")
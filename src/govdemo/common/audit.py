@@ -1,12 +1,19 @@
+import atexit
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from uuid import uuid4
 import duckdb
-from .config import load_env_config
+import pyarrow as pa
+from . import metrics
+from .context import run_context
 from .time import now_iso
-from uuid import uuid4
 
-def init_audit() -> None:
-    cfg = load_env_config()
-    con = duckdb.connect(str(cfg.duckdb_path))
-    con.execute("""
+SCHEMA = [
+    """
       create table if not exists audit_runs (
         run_id varchar,
         pipeline varchar,
@@ -17,8 +24,8 @@ def init_audit() -> None:
         output_ref varchar,
         details varchar
       );
-    """)
-    con.execute("""
+    """,
+    """
       create table if not exists gdpr_requests (
         request_id varchar,
         user_id varchar,
@@ -27,8 +34,8 @@ def init_audit() -> None:
         status varchar,
         details varchar
       );
-    """)
-    con.execute("""
+    """,
+    """
       create table if not exists activation_exports (
         export_id varchar,
         requested_by_role varchar,
@@ -38,26 +45,336 @@ def init_audit() -> None:
         created_at varchar,
         rows integer
       );
-    """)
-    con.close()
+    """,
+    """
+      create table if not exists stage_inputs (
+        stage varchar,
+        dt varchar,
+        input_path varchar,
+        fingerprint varchar,
+        run_id varchar,
+        recorded_at varchar
+      );
+    """,
+    """
+      create table if not exists user_locator (
+        layer varchar,
+        path varchar,
+        row_group integer,
+        user_id varchar
+      );
+    """,
+    """
+      create table if not exists locator_files (
+        layer varchar,
+        path varchar,
+        stat_key varchar,
+        indexed_at varchar
+      );
+    """,
+    """
+      create table if not exists lineage_edges (
+        run_id varchar,
+        pipeline varchar,
+        from_ref varchar,
+        to_ref varchar,
+        emitted_at varchar
+      );
+    """,
+    "create index if not exists lineage_edges_from on lineage_edges(from_ref);",
+    "create index if not exists lineage_edges_to on lineage_edges(to_ref);",
+    "create index if not exists lineage_edges_run on lineage_edges(run_id);",
+    """
+      create table if not exists evidence_log (
+        record_id varchar,
+        kind varchar,
+        run_id varchar,
+        log_path varchar,
+        byte_offset bigint,
+        byte_length bigint,
+        written_at varchar
+      );
+    """,
+    """
+      create table if not exists run_metrics (
+        run_id varchar,
+        pipeline varchar,
+        phase varchar,
+        wall_s double,
+        cpu_s double,
+        rows_in bigint,
+        rows_out bigint,
+        bytes_read bigint,
+        bytes_written bigint,
+        peak_rss_mb double,
+        peak_traced_mb double
+      );
+    """,
+]
+
+FLUSH_EVERY = 512
+LOCK_TIMEOUT_S = float(os.environ.get("GOVDEMO_AUDIT_LOCK_TIMEOUT", "5"))
+READ_LOCK_TIMEOUT_S = float(os.environ.get("GOVDEMO_AUDIT_READ_LOCK_TIMEOUT", "60"))
+
+class AuditUnavailable(RuntimeError):
+    pass
+
+def _is_lock_error(e: Exception) -> bool:
+    return "lock" in str(e).lower()
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class AuditSession:
+    """Process-wide writer for governance.duckdb.
+
+    - the schema is created once per process
+    - writes are buffered and applied in one transaction per flush (at
+      `finish_run`, every FLUSH_EVERY writes, before reads, and at exit)
+    - the DuckDB file lock is only held while flushing/querying, or for the
+      duration of a `hold()` block, so concurrent pipeline processes interleave
+    - if another process keeps the lock past LOCK_TIMEOUT_S, pending writes go to
+      a local spool (warehouse/audit_spool) that the next successful flush
+      replays, so no process has to wait on or drop its audit rows; spool files
+      a failed flush had claimed are handed back, and those claimed by a process
+      that died mid-flush are re-adopted
+    - reads cannot be spooled; they wait up to READ_LOCK_TIMEOUT_S and then
+      raise AuditUnavailable, which callers treat as "nothing recorded"
+    - `start_run` rows are flushed at once, so a killed stage leaves a RUNNING row
+    """
+
+    def __init__(self, db_path: Path, spool_dir: Path):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self._pid = os.getpid()
+        self._pending: list[dict] = []
+        self._con: duckdb.DuckDBPyConnection | None = None
+        self._schema_ready = False
+        atexit.register(self.close)
+
+    # -- writes ---------------------------------------------------------------
+
+    def execute(self, sql: str, params: list | None = None, tables: dict[str, pa.Table] | None = None) -> None:
+        """Buffer a write. `tables` are Arrow tables registered under their key for the statement."""
+        self._pending.append({"sql": sql, "params": params or [], "tables": tables or {}})
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Apply buffered writes (and any spooled ones); spool them if the DB stays locked."""
+        if not self._pending and not self._spooled():
+            return True
+        spooled = self._claim_spool()
+        try:
+            ops = [op for path in spooled for op in self._read_spool(path)] + self._pending
+            if not ops:
+                for path in spooled:
+                    path.unlink(missing_ok=True)
+                return True
+            with self._connection() as con:
+                con.execute("begin")
+                try:
+                    for op in ops:
+                        self._apply(con, op)
+                    con.execute("commit")
+                except Exception:
+                    con.execute("rollback")
+                    raise
+        except AuditUnavailable:
+            self._spool(ops)
+            for path in spooled:
+                path.unlink(missing_ok=True)
+            self._pending = []
+            return False
+        except BaseException:
+            # hand the claimed files back so a later flush replays them
+            for path in spooled:
+                path.rename(path.with_suffix(".jsonl"))
+            raise
+        for path in spooled:
+            path.unlink(missing_ok=True)
+        self._pending = []
+        return True
+
+    # -- reads ----------------------------------------------------------------
+
+    def query(self, sql: str, params: list | None = None, tables: dict[str, pa.Table] | None = None) -> list[tuple]:
+        """Run a read after flushing pending writes, so callers read their own writes."""
+        with self.hold():
+            self.flush()
+            con = self._con
+            for name, t in (tables or {}).items():
+                con.register(name, t)
+            try:
+                return con.execute(sql, params or []).fetchall()
+            finally:
+                for name in tables or {}:
+                    con.unregister(name)
+
+    # -- connection -----------------------------------------------------------
+
+    @contextmanager
+    def hold(self) -> Iterator["AuditSession"]:
+        """Keep one connection open for a block of many audit reads/writes."""
+        if self._con is not None:
+            yield self
+            return
+        self._con = self._connect(READ_LOCK_TIMEOUT_S)
+        try:
+            yield self
+            self.flush()
+        finally:
+            con, self._con = self._con, None
+            con.close()
+
+    @contextmanager
+    def _connection(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        if self._con is not None:
+            yield self._con
+            return
+        con = self._connect()
+        try:
+            yield con
+        finally:
+            con.close()
+
+    def _connect(self, timeout_s: float = LOCK_TIMEOUT_S) -> duckdb.DuckDBPyConnection:
+        deadline = time.monotonic() + timeout_s
+        delay = 0.01
+        while True:
+            try:
+                con = duckdb.connect(str(self.db_path))
+                break
+            except duckdb.IOException as e:
+                if not _is_lock_error(e):
+                    raise
+                if time.monotonic() >= deadline:
+                    raise AuditUnavailable(f"Audit DB {self.db_path} is locked by another process") from e
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
+        if not self._schema_ready:
+            for ddl in SCHEMA:
+                con.execute(ddl)
+            self._schema_ready = True
+        return con
+
+    def ensure_schema(self) -> None:
+        with self._connection():
+            pass
+
+    def close(self) -> None:
+        if os.getpid() != self._pid:
+            return
+        try:
+            self.flush()
+        finally:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    # -- spool ----------------------------------------------------------------
+
+    @staticmethod
+    def _apply(con: duckdb.DuckDBPyConnection, op: dict) -> None:
+        for name, t in op["tables"].items():
+            con.register(name, t)
+        try:
+            con.execute(op["sql"], op["params"])
+        finally:
+            for name in op["tables"]:
+                con.unregister(name)
+
+    def _spooled(self) -> bool:
+        return self.spool_dir.exists() and any(self._spool_files())
+
+    def _spool_files(self) -> list[Path]:
+        """Spool files plus claimed ones, oldest first; a claim outlives its process only if it died mid-flush."""
+        files = []
+        for path in [*self.spool_dir.glob("*.jsonl"), *self.spool_dir.glob("*.claimed")]:
+            try:
+                files.append((path.stat().st_mtime_ns, path))
+            except FileNotFoundError:
+                continue  # claimed or replayed by another process meanwhile
+        return [path for _, path in sorted(files)]
+
+    def _spool(self, ops: list[dict]) -> None:
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spool_dir/f"{os.getpid()}-{uuid4().hex}.jsonl"
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps({"sql": op["sql"], "params": op["params"],
+                                    "tables": {k: t.to_pydict() for k, t in op["tables"].items()}}) + "\n")
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read_spool(path: Path) -> list[dict]:
+        ops = []
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                op = json.loads(line)
+                op["tables"] = {k: pa.table(v) for k, v in op["tables"].items()}
+                ops.append(op)
+        return ops
+
+    def _claim_spool(self) -> list[Path]:
+        """Take ownership of our own spool files and those (spooled or claimed) left by exited processes."""
+        if not self.spool_dir.exists():
+            return []
+        claimed = []
+        for path in self._spool_files():
+            pid = int(path.name.split("-", 1)[0])
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            target = path.with_name(f"{os.getpid()}-{uuid4().hex}.claimed")
+            try:
+                path.rename(target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+        return claimed
+
+_SESSIONS: dict[Path, AuditSession] = {}
+
+def _reset_after_fork() -> None:
+    _SESSIONS.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def audit_session() -> AuditSession:
+    cfg = run_context().config
+    session = _SESSIONS.get(cfg.duckdb_path)
+    if session is None:
+        session = _SESSIONS[cfg.duckdb_path] = AuditSession(cfg.duckdb_path, cfg.audit_spool_dir)
+    return session
+
+def init_audit() -> None:
+    audit_session().ensure_schema()
 
 def start_run(pipeline: str, input_ref: str = "") -> str:
-    init_audit()
-    cfg = load_env_config()
     run_id = str(uuid4())
-    con = duckdb.connect(str(cfg.duckdb_path))
-    con.execute(
+    audit_session().execute(
         "insert into audit_runs values (?, ?, ?, ?, ?, ?, ?, ?)",
         [run_id, pipeline, "RUNNING", now_iso(), "", input_ref, "", ""],
     )
-    con.close()
+    audit_session().flush()
+    metrics.begin(run_id, pipeline)
     return run_id
 
 def finish_run(run_id: str, status: str, output_ref: str = "", details: str = "") -> None:
-    cfg = load_env_config()
-    con = duckdb.connect(str(cfg.duckdb_path))
-    con.execute(
+    session = audit_session()
+    session.execute(
         "update audit_runs set status=?, finished_at=?, output_ref=?, details=? where run_id=?",
         [status, now_iso(), output_ref, details, run_id],
     )
-    con.close()
+    recorded = metrics.end(run_id)
+    if recorded is not None:
+        session.execute("insert into run_metrics select * from recorded", tables={"recorded": recorded})
+    session.flush()
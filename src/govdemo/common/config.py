@@ -10,9 +10,15 @@ class EnvConfig:
     gdpr_evidence_dir: Path
     export_evidence_dir: Path
     roles_path: Path
+    layout_path: Path
     pii_secret: str
+    spill_dir: Path
+    audit_spool_dir: Path
+    profiles_dir: Path
+    event_index_path: Path
 
-def load_env_config() -> EnvConfig:
+def resolve_env_config() -> EnvConfig:
+    """Build the config from the current directory and environment (uncached)."""
     project_root = Path.cwd()
     lake_root = project_root / "data_lake"
     wh_root = project_root / "warehouse"
@@ -28,5 +34,15 @@ def load_env_config() -> EnvConfig:
         gdpr_evidence_dir=wh_root / "gdpr_evidence",
         export_evidence_dir=wh_root / "export_evidence",
         roles_path=roles_path,
+        layout_path=project_root / "configs" / "layout.yaml",
         pii_secret=pii_secret,
+        spill_dir=wh_root / "spill",
+        audit_spool_dir=wh_root / "audit_spool",
+        profiles_dir=wh_root / "profiles",
+        event_index_path=wh_root / "event_index.duckdb",
     )
+
+def load_env_config() -> EnvConfig:
+    """Config of the active run context (resolved once per process; see context.reset_context)."""
+    from .context import run_context
+    return run_context().config
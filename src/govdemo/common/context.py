@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Iterator
+import os
+from .config import EnvConfig, resolve_env_config
+
+if TYPE_CHECKING:
+    from .audit import AuditSession
+    from .lineage import LineageGraph
+
+@dataclass(frozen=True)
+class RunContext:
+    """What every stage and helper needs, resolved once: config, role, PII secret.
+
+    The audit session and lineage graph are per-process singletons already;
+    they are reachable from here so callers can hold one object.
+    """
+    config: EnvConfig
+    role: str
+    pii_secret: str
+
+    @property
+    def audit(self) -> "AuditSession":
+        from .audit import audit_session
+        return audit_session()
+
+    @property
+    def lineage(self) -> "LineageGraph":
+        from .lineage import lineage_graph
+        return lineage_graph()
+
+def build_context() -> RunContext:
+    """Resolve a context from the current directory and environment."""
+    config = resolve_env_config()
+    return RunContext(config=config, role=os.environ.get("GOVDEMO_ROLE", "analyst"), pii_secret=config.pii_secret)
+
+# a scoped override (use_context) wins over the process-wide context
+_SCOPED: ContextVar[RunContext | None] = ContextVar("govdemo_run_context", default=None)
+_PROCESS: RunContext | None = None
+
+def run_context() -> RunContext:
+    """The active RunContext; built on first use and then reused for the process."""
+    global _PROCESS
+    ctx = _SCOPED.get()
+    if ctx is not None:
+        return ctx
+    if _PROCESS is None:
+        _PROCESS = build_context()
+    return _PROCESS
+
+def reset_context() -> None:
+    """Forget the process-wide context, e.g. after chdir or changing GOVDEMO_ROLE / PII_TOKEN_SECRET."""
+    global _PROCESS
+    _PROCESS = None
+
+@contextmanager
+def use_context(ctx: RunContext | None = None, **overrides) -> Iterator[RunContext]:
+    """Run a block under `ctx` (default: a fresh one), with fields like role= replaced."""
+    ctx = replace(ctx or build_context(), **overrides)
+    token = _SCOPED.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _SCOPED.reset(token)
@@ -0,0 +1,26 @@
+import os
+import duckdb
+import pyarrow as pa
+from .config import load_env_config
+
+def compute_connection() -> duckdb.DuckDBPyConnection:
+    """In-memory DuckDB for heavy scans/aggregations, spilling to warehouse/spill.
+
+    Kept separate from governance.duckdb so compute never holds the audit DB lock.
+    GOVDEMO_DUCKDB_MEMORY (e.g. "4GB") caps memory before DuckDB spills to disk.
+    """
+    cfg = load_env_config()
+    cfg.spill_dir.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    spill_dir = cfg.spill_dir.as_posix().replace("'", "''")
+    con.execute(f"set temp_directory = '{spill_dir}'")
+    memory_limit = os.environ.get("GOVDEMO_DUCKDB_MEMORY")
+    if memory_limit:
+        memory_limit = memory_limit.replace("'", "''")
+        con.execute(f"set memory_limit = '{memory_limit}'")
+    return con
+
+def fetch_table(result) -> pa.Table:
+    """`.arrow()` returns a Table on older DuckDB and a RecordBatchReader on newer ones."""
+    out = result.arrow()
+    return out.read_all() if isinstance(out, pa.RecordBatchReader) else out
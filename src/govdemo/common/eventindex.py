@@ -0,0 +1,146 @@
+import os
+import time
+from collections.abc import Iterable
+from pathlib import Path
+import duckdb
+import pyarrow as pa
+from .time import now_iso
+
+LOCK_TIMEOUT_S = float(os.environ.get("GOVDEMO_EVENT_INDEX_LOCK_TIMEOUT", "600"))
+
+SCHEMA = """
+  create table if not exists event_ids (
+    event_id varchar,
+    dt varchar,
+    source varchar,
+    run_id varchar,
+    ingested_at varchar
+  );
+  create table if not exists indexed_raw (
+    dt varchar,
+    source varchar,
+    fingerprint varchar
+  );
+"""
+
+# A run's ids are (task, pos, event_id); pos orders the good records of a task.
+# An id is a duplicate if an earlier record of the run or any earlier run has it.
+_DUPLICATES = """
+create or replace temp table dups as
+select task, pos from (
+  select task, pos, row_number() over (partition by event_id order by task, pos) as rn from run_ids
+) where rn > 1
+union
+select r.task, r.pos from run_ids r join event_ids i using (event_id)
+"""
+
+class EventIndexLocked(RuntimeError):
+    pass
+
+class EventIndex:
+    """Exact, persistent set of every event_id in raw.
+
+    The index is one DuckDB table in warehouse/event_index.duckdb. A run's ids
+    are checked with a single join against it (DuckDB compresses and scans the
+    column in parallel), so the cost per run is one pass over the index and no
+    false positives are possible.
+
+    Ids are kept per raw partition (dt, source) together with a fingerprint of
+    its parts. Partitions written or replaced by a plain ingest no longer match
+    their fingerprint and are reloaded from raw with `load` before checking.
+
+    The DuckDB file lock is held from `open` to `close`, which serializes
+    concurrent dedupe ingests: the second one checks against the ids the first
+    one committed.
+    """
+
+    def __init__(self, path: Path, timeout_s: float = LOCK_TIMEOUT_S):
+        self.path = path
+        deadline = time.monotonic() + timeout_s
+        delay = 0.05
+        while True:
+            try:
+                self.con = duckdb.connect(str(path))
+                break
+            except duckdb.IOException as e:
+                if "lock" not in str(e).lower():
+                    raise
+                if time.monotonic() >= deadline:
+                    raise EventIndexLocked(f"Event index {path} is locked by another ingest") from e
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        self.con.execute(SCHEMA)
+
+    def check(self, ids: dict[int, pa.Table]) -> dict[int, int]:
+        """Stage a run's (pos, event_id) tables by task; returns task -> duplicate count."""
+        if not ids:
+            self.con.execute("create or replace temp table run_ids (task integer, pos bigint, event_id varchar)")
+        else:
+            for task, table in ids.items():
+                self.con.register(f"ids_{task}", table)
+            self.con.execute("create or replace temp table run_ids as " + " union all ".join(
+                f"select {task}::integer as task, pos, event_id from ids_{task}" for task in ids))
+            for task in ids:
+                self.con.unregister(f"ids_{task}")
+        self.con.execute(_DUPLICATES)
+        return dict(self.con.execute("select task, count(*) from dups group by task").fetchall())
+
+    def write_duplicates(self, task: int, path: Path) -> None:
+        """Sorted positions of `task`'s duplicate records, as a one-column parquet file."""
+        quoted = str(path).replace("'", "''")
+        self.con.execute(f"copy (select pos from dups where task = {int(task)} order by pos) to '{quoted}' (format parquet)")
+
+    def commit(self, dt: str, source: str, run_id: str, fingerprint: str) -> int:
+        """Add the run's non-duplicate ids to the index; returns how many.
+
+        `fingerprint` is that of the raw partition once the run's parts are published.
+        """
+        self.con.execute("begin")
+        n = self.con.execute(
+            "insert into event_ids select event_id, $dt, $source, $run_id, $at from run_ids anti join dups using (task, pos)",
+            {"dt": dt, "source": source, "run_id": run_id, "at": now_iso()},
+        ).fetchone()[0]
+        self._set_fingerprint(dt, source, fingerprint)
+        self.con.execute("commit")
+        return n
+
+    def fingerprints(self) -> dict[tuple[str, str], str | None]:
+        """(dt, source) -> fingerprint of every partition with ids in the index (None if never loaded)."""
+        rows = self.con.execute(
+            "select dt, source, fingerprint from indexed_raw "
+            "union all select distinct dt, source, null from event_ids "
+            "where (dt, source) not in (select (dt, source) from indexed_raw)"
+        ).fetchall()
+        return {(dt, source): fp for dt, source, fp in rows}
+
+    def load(self, dt: str, source: str, ids: Iterable[pa.Table], fingerprint: str | None) -> None:
+        """Replace the ids of one raw partition with the `event_id` columns of `ids`.
+
+        A None `fingerprint` drops the partition from the index.
+        """
+        self.con.execute("begin")
+        self.con.execute("delete from event_ids where dt = ? and source = ?", [dt, source])
+        for table in ids:
+            self.con.register("loaded", table)
+            self.con.execute("insert into event_ids select event_id, $dt, $source, '', $at from loaded",
+                             {"dt": dt, "source": source, "at": now_iso()})
+            self.con.unregister("loaded")
+        self._set_fingerprint(dt, source, fingerprint)
+        self.con.execute("commit")
+
+    def _set_fingerprint(self, dt: str, source: str, fingerprint: str | None) -> None:
+        self.con.execute("delete from indexed_raw where dt = ? and source = ?", [dt, source])
+        if fingerprint is not None:
+            self.con.execute("insert into indexed_raw values (?, ?, ?)", [dt, source, fingerprint])
+
+    def size(self) -> int:
+        return self.con.execute("select count(*) from event_ids").fetchone()[0]
+
+    def close(self) -> None:
+        self.con.close()
+
+    def __enter__(self) -> "EventIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
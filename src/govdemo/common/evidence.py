@@ -0,0 +1,143 @@
+import fcntl
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import pyarrow as pa
+from .audit import audit_session
+from .time import now_iso
+
+WORKERS = int(os.environ.get("GOVDEMO_EVIDENCE_WORKERS", "4"))
+LOG_NAME = "evidence.log.gz"
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _gzip_member(data: bytes) -> bytes:
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: one self-contained gzip member
+    return c.compress(data) + c.flush()
+
+class EvidenceWriter:
+    """Writes evidence records off the critical path, with a durability barrier.
+
+    Records are serialized and written by a small thread pool while the caller
+    carries on; at most 2 * `workers` are in flight, so submitting blocks rather
+    than queueing without bound. `barrier()` waits for every write, fsyncs, and
+    re-raises the first failure: call it before reporting success.
+
+    By default every record is its own <dir>/<record_id>.json (written to a temp
+    file, fsynced and renamed into place). With `log=True`, records are appended
+    as separate gzip members to <dir>/evidence.log.gz, so the file stays a valid
+    gzip stream (`zcat` reads it), and their byte offsets go into the
+    `evidence_log` audit table. A record's ref is then "<log>#<offset>"; see
+    `read_evidence`. Refs are known once the barrier has passed.
+    """
+
+    def __init__(self, out_dir: Path, kind: str, run_id: str, log: bool = False, workers: int = WORKERS):
+        self.out_dir = out_dir
+        self.kind = kind
+        self.run_id = run_id
+        self.log = log
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix=f"evidence-{kind}")
+        self._slots = threading.BoundedSemaphore(2 * max(workers, 1))
+        self._futures: list[Future] = []
+        self._indexed: list[tuple[str, int, int]] = []
+        self._refs: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._log = None
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if log:
+            self.log_path = out_dir/LOG_NAME
+            self._log = self.log_path.open("ab")
+
+    def submit(self, record_id: str, record: dict) -> None:
+        """Queue one record for writing."""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._append if self.log else self._write_file, record_id, record)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _write_file(self, record_id: str, record: dict) -> None:
+        path = self.out_dir/f"{record_id}.json"
+        tmp = path.with_name(f".{path.name}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        with self._lock:
+            self._refs[record_id] = str(path)
+
+    def _append(self, record_id: str, record: dict) -> None:
+        blob = _gzip_member(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        with self._lock:
+            # other processes may append to the same log; the flock keeps members whole
+            fcntl.flock(self._log.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = self._log.seek(0, os.SEEK_END)
+                self._log.write(blob)
+                self._log.flush()
+            finally:
+                fcntl.flock(self._log.fileno(), fcntl.LOCK_UN)
+            self._indexed.append((record_id, offset, len(blob)))
+            self._refs[record_id] = f"{self.log_path}#{offset}"
+
+    def barrier(self) -> dict[str, str]:
+        """Wait until every submitted record is durable; returns record_id -> ref of all records so far."""
+        futures, self._futures = self._futures, []
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise errors[0]
+        if self._log is not None:
+            os.fsync(self._log.fileno())
+        _fsync_dir(self.out_dir)
+        indexed, self._indexed = self._indexed, []
+        if indexed:
+            audit_session().execute("insert into evidence_log select * from indexed", tables={"indexed": pa.table({
+                "record_id": [r for r, _, _ in indexed],
+                "kind": [self.kind] * len(indexed),
+                "run_id": [self.run_id] * len(indexed),
+                "log_path": [str(self.log_path)] * len(indexed),
+                "byte_offset": pa.array([o for _, o, _ in indexed], pa.int64()),
+                "byte_length": pa.array([n for _, _, n in indexed], pa.int64()),
+                "written_at": [now_iso()] * len(indexed),
+            })})
+        return dict(self._refs)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def __enter__(self) -> "EvidenceWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def read_evidence(ref: str) -> dict:
+    """Load one evidence record from a JSON file path or an "<evidence.log.gz>#<offset>" ref."""
+    path, _, offset = ref.partition("#")
+    if not offset:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    d = zlib.decompressobj(31)
+    out = b""
+    with open(path, "rb") as f:
+        f.seek(int(offset))
+        while not d.eof:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                raise ValueError(f"Truncated evidence record at {ref}")
+            out += d.decompress(chunk)
+    return json.loads(out)
@@ -0,0 +1,136 @@
+import io
+import json
+from pathlib import Path
+from typing import Iterator
+import pyarrow as pa
+import pyarrow.json as pj
+
+CHUNK_BYTES = 16 * 1024 * 1024
+PART_BYTES = 256 * 1024 * 1024
+
+def split_ranges(path: Path, n: int) -> list[tuple[int, int]]:
+    """Split `path` into up to `n` byte ranges that start and end on line boundaries."""
+    size = path.stat().st_size
+    bounds = [0]
+    with path.open("rb") as f:
+        for i in range(1, n):
+            f.seek(max(size * i // n, bounds[-1]))
+            f.readline()
+            pos = min(f.tell(), size)
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    if bounds[-1] < size or size == 0:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def iter_line_chunks(path: Path, chunk_bytes: int = CHUNK_BYTES,
+                     start: int = 0, end: int | None = None) -> Iterator[list[bytes]]:
+    """Yield lists of complete, non-blank lines read from `path` in large byte blocks.
+
+    `start`/`end` restrict reading to a byte range as produced by `split_ranges`.
+    Memory is bounded by `chunk_bytes` plus the longest single line.
+    """
+    carry = b""
+    with path.open("rb") as f:
+        f.seek(start)
+        remaining = end - start if end is not None else None
+        while True:
+            size = chunk_bytes if remaining is None else min(chunk_bytes, remaining)
+            block = f.read(size) if size > 0 else b""
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            block = carry + block
+            cut = block.rfind(b"\n") + 1
+            if cut == 0:
+                carry = block
+                continue
+            carry = block[cut:]
+            lines = [ln for ln in block[:cut].splitlines(keepends=True) if ln.strip()]
+            if lines:
+                yield lines
+    if carry.strip():
+        yield [carry if carry.endswith(b"\n") else carry + b"\n"]
+
+def read_columns(lines: list[bytes], columns: list[str]) -> pa.Table:
+    """Parse the given top-level string columns out of a block of JSON lines.
+
+    Uses pyarrow's multi-threaded JSON reader; falls back to `json.loads` per line
+    when the block has values that are not strings (e.g. numeric ids).
+    Falsy non-string values come back as null, matching `not rec.get(k)`.
+    """
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    buf = b"".join(lines)
+    try:
+        return pj.read_json(
+            io.BytesIO(buf),
+            read_options=pj.ReadOptions(block_size=max(len(buf), 1 << 20)),
+            parse_options=pj.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore"),
+        )
+    except pa.ArrowInvalid:
+        pass
+    cols: dict[str, list] = {c: [] for c in columns}
+    for line in lines:
+        rec = json.loads(line)
+        for c in columns:
+            v = rec.get(c)
+            cols[c].append(v if isinstance(v, str) else (str(v) if v else None))
+    return pa.table(cols, schema=schema)
+
+class RollingPartWriter:
+    """Writes complete JSONL lines into size-bounded {prefix}NNNNN.jsonl files.
+
+    Parts are opened lazily, so a writer that receives no data creates no files.
+    """
+
+    def __init__(self, out_dir: Path, max_bytes: int = PART_BYTES, first_part: int = 1, prefix: str = "part-"):
+        self.out_dir = out_dir
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.parts: list[Path] = []
+        self._next = first_part
+        self._f = None
+        self._size = 0
+
+    def _roll(self) -> None:
+        if self._f is not None:
+            self._f.close()
+        path = self.out_dir/f"{self.prefix}{self._next:05d}.jsonl"
+        self._next += 1
+        self.parts.append(path)
+        self._f = path.open("wb")
+        self._size = 0
+
+    def write(self, data: bytes) -> None:
+        """Write a block of complete lines, split at line ends across as many parts as it takes."""
+        view = memoryview(data)
+        start = 0
+        while start < len(data):
+            if self._f is None:
+                self._roll()
+            end = len(data)
+            if self._size + end - start > self.max_bytes:
+                end = data.rfind(b"\n", start, start + self.max_bytes - self._size) + 1
+                if end <= start:
+                    if self._size:
+                        self._roll()
+                        continue
+                    # a single line longer than a part gets a part of its own
+                    end = data.find(b"\n", start) + 1 or len(data)
+            self._f.write(view[start:end])
+            self._size += end - start
+            start = end
+            if start < len(data):
+                self._roll()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self) -> "RollingPartWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,141 @@
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+import inspect
+import os
+import zlib
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import yaml
+from .config import load_env_config
+
+@dataclass(frozen=True)
+class LayoutPolicy:
+    """How a layer's parquet files are laid out on disk."""
+    sort_by: tuple[str, ...] = ("user_id",)
+    buckets: int = 1                       # files per dt, by crc32(bucket_by) % buckets
+    bucket_by: str = "user_id"
+    row_group_size: int = 128 * 1024
+    compression: str = "snappy"
+    dictionary: tuple[str, ...] = ()       # columns to dictionary-encode
+    page_index: bool = True
+    bloom_filter: tuple[str, ...] = ("user_id",)
+    bloom_fpp: float = 0.01
+    target_file_mb: int = 128              # `govdemo compact` merges smaller multi-part files up to this
+
+DEFAULT_LAYOUTS = {
+    # clean parts are streamed in raw order, so no sort and no buckets
+    "clean": LayoutPolicy(sort_by=(), row_group_size=256 * 1024, dictionary=("user_id", "email_token", "ip_token")),
+    "curated": LayoutPolicy(),
+    "serving": LayoutPolicy(),
+    "restricted_pii": LayoutPolicy(),
+    "curated_windows": LayoutPolicy(),
+    "serving_windows": LayoutPolicy(),
+}
+
+_WRITER_PARAMS = set(inspect.signature(pq.ParquetWriter.__init__).parameters)
+
+def layout_policy(layer: str) -> LayoutPolicy:
+    """Default policy for `layer`, overridden by `layers.<layer>` in configs/layout.yaml if present."""
+    policy = DEFAULT_LAYOUTS.get(layer, LayoutPolicy())
+    path = load_env_config().layout_path
+    if path.exists():
+        overrides = ((yaml.safe_load(path.read_text(encoding="utf-8")) or {}).get("layers") or {}).get(layer) or {}
+        unknown = set(overrides) - {f.name for f in fields(LayoutPolicy)}
+        if unknown:
+            raise ValueError(f"Unknown layout option(s) for '{layer}' in {path}: {', '.join(sorted(unknown))}")
+        policy = replace(policy, **{k: tuple(v) if isinstance(v, list) else v for k, v in overrides.items()})
+    if policy.buckets < 1:
+        raise ValueError(f"Layout for '{layer}': buckets must be >= 1")
+    return policy
+
+def writer_options(policy: LayoutPolicy, schema: pa.Schema, expected_rows: int | None = None) -> dict:
+    """ParquetWriter kwargs for `policy`; page index / bloom filters only where pyarrow supports them."""
+    names = set(schema.names)
+    opts = {
+        "compression": policy.compression,
+        "use_dictionary": [c for c in policy.dictionary if c in names] or False,
+        "write_statistics": True,
+    }
+    if policy.page_index and "write_page_index" in _WRITER_PARAMS:
+        opts["write_page_index"] = True
+    blooms = [c for c in policy.bloom_filter if c in names]
+    if blooms and "bloom_filter_options" in _WRITER_PARAMS:
+        # bloom filters are per column chunk, i.e. per row group
+        ndv = max(min(expected_rows or policy.row_group_size, policy.row_group_size), 1)
+        opts["bloom_filter_options"] = {c: {"ndv": ndv, "fpp": policy.bloom_fpp} for c in blooms}
+    sort_by = [c for c in policy.sort_by if c in names]
+    if sort_by and hasattr(pq, "SortingColumn"):
+        opts["sorting_columns"] = [pq.SortingColumn(schema.get_field_index(c)) for c in sort_by]
+    return opts
+
+def open_writer(path: Path, schema: pa.Schema, policy: LayoutPolicy, expected_rows: int | None = None) -> pq.ParquetWriter:
+    return pq.ParquetWriter(path, schema, **writer_options(policy, schema, expected_rows))
+
+def bucket_for(value: str, buckets: int) -> int:
+    return zlib.crc32(value.encode("utf-8")) % buckets if buckets > 1 else 0
+
+def bucket_ids(values: pa.Array | pa.ChunkedArray, buckets: int) -> pa.Array:
+    """Bucket of every value, hashing each distinct value once; nulls go to bucket 0."""
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    encoded = pc.dictionary_encode(values.cast(pa.string()))
+    per_value = pa.array([bucket_for(v, buckets) for v in encoded.dictionary.to_pylist()], pa.int32())
+    return pc.fill_null(pc.take(per_value, encoded.indices), 0)
+
+def file_names(stem: str, buckets: int) -> list[str]:
+    if buckets == 1:
+        return [f"{stem}.parquet"]
+    return [f"{stem}-b{b:03d}.parquet" for b in range(buckets)]
+
+def layer_files(out_dir: Path, stem: str) -> list[Path]:
+    """Files of one layer output in `out_dir`, bucketed or not, in bucket order."""
+    return sorted(out_dir.glob(f"{stem}.parquet")) + sorted(out_dir.glob(f"{stem}-b[0-9][0-9][0-9].parquet"))
+
+def write_layout(table: pa.Table, out_dir: Path, stem: str, policy: LayoutPolicy) -> list[Path]:
+    """Sort, bucket and write `table` per `policy`; returns the files now making up the output.
+
+    Each file is written to a temp name and swapped in with os.replace. Every
+    bucket gets a file (possibly empty) so bucket -> file stays fixed; files of
+    an older layout of the same output are removed.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sort_by = [c for c in policy.sort_by if c in table.column_names]
+    if sort_by:
+        table = table.sort_by([(c, "ascending") for c in sort_by])
+    names = file_names(stem, policy.buckets)
+    if policy.buckets > 1:
+        ids = bucket_ids(table[policy.bucket_by], policy.buckets)
+        parts = [table.filter(pc.equal(ids, b)) for b in range(policy.buckets)]
+    else:
+        parts = [table]
+
+    paths = []
+    for name, part in zip(names, parts):
+        path = out_dir/name
+        tmp = out_dir/f".{name}.tmp"
+        with open_writer(tmp, part.schema, policy, expected_rows=part.num_rows) as w:
+            w.write_table(part, row_group_size=policy.row_group_size)
+        os.replace(tmp, path)
+        paths.append(path)
+    for stale in set(layer_files(out_dir, stem)) - set(paths):
+        stale.unlink()
+    return paths
+
+def stats_row_groups(pf: pq.ParquetFile, column: str, lo: str | None = None, hi: str | None = None,
+                     values: set[str] | None = None) -> list[int]:
+    """Row groups whose min/max statistics on `column` may hold `values` or overlap [lo, hi]."""
+    col = pf.schema_arrow.get_field_index(column)
+    if values is not None:
+        if not values:
+            return []
+        lo, hi = min(values), max(values)
+    out = []
+    for rg in range(pf.num_row_groups):
+        stats = pf.metadata.row_group(rg).column(col).statistics
+        if stats is None or not stats.has_min_max:
+            out.append(rg)
+        elif (hi is None or stats.min <= hi) and (lo is None or stats.max >= lo) and (
+                values is None or any(stats.min <= v <= stats.max for v in values)):
+            out.append(rg)
+    return out
@@ -1,16 +1,128 @@
-import json
+from collections import deque
+from pathlib import Path
+from typing import Iterable
+import pyarrow as pa
+from .audit import audit_session
 from .config import load_env_config
 from .time import now_iso
 
+EDGE_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("pipeline", pa.string()),
+    ("from_ref", pa.string()),
+    ("to_ref", pa.string()),
+    ("emitted_at", pa.string()),
+])
+
+def emit_edges(run_id: str, pipeline: str, edges: Iterable[tuple[str, str]]) -> None:
+    """Buffer many (from_ref, to_ref) edges of one run as a single audit-session write."""
+    edges = list(edges)
+    if not edges:
+        return
+    at = now_iso()
+    audit_session().execute("insert into lineage_edges select * from edges", tables={"edges": pa.table({
+        "run_id": [run_id] * len(edges),
+        "pipeline": [pipeline] * len(edges),
+        "from_ref": [str(f) for f, _ in edges],
+        "to_ref": [str(t) for _, t in edges],
+        "emitted_at": [at] * len(edges),
+    }, schema=EDGE_SCHEMA)})
+
 def emit_edge(run_id: str, pipeline: str, from_ref: str, to_ref: str) -> None:
-    cfg = load_env_config()
-    rec = {
-        "run_id": run_id,
-        "pipeline": pipeline,
-        "from_ref": from_ref,
-        "to_ref": to_ref,
-        "at": now_iso(),
-    }
-    cfg.lineage_path.parent.mkdir(exist_ok=True)
-    with cfg.lineage_path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(rec) + "\n")
+    emit_edges(run_id, pipeline, [(from_ref, to_ref)])
+
+_LEGACY_JSONL = (
+    "read_json(?, format = 'newline_delimited', columns = {run_id: 'varchar', pipeline: 'varchar', "
+    "from_ref: 'varchar', to_ref: 'varchar', \"at\": 'varchar'})"
+)
+
+def import_legacy_jsonl() -> int:
+    """Move edges from the old warehouse/lineage.jsonl into lineage_edges (once)."""
+    path = load_env_config().lineage_path
+    if not path.exists():
+        return 0
+    session = audit_session()
+    rows = session.query(f"select count(*) from {_LEGACY_JSONL}", [str(path)])[0][0]
+    session.execute(f"insert into lineage_edges select run_id, pipeline, from_ref, to_ref, \"at\" from {_LEGACY_JSONL}",
+                    [str(path)])
+    session.flush()
+    path.rename(path.with_name(path.name + ".imported"))
+    return rows
+
+class LineageGraph:
+    """In-memory adjacency over lineage_edges for upstream/downstream traversal.
+
+    Refs are interned to ints and edges kept as per-node lists, so a BFS over
+    millions of edges never goes back to the database. The graph reloads when
+    the edge count or the latest emitted_at changes.
+    """
+
+    def __init__(self):
+        self._version: tuple | None = None
+        self._ids: dict[str, int] = {}
+        self._refs: list[str] = []
+        self._down: list[list[int]] = []
+        self._up: list[list[int]] = []
+
+    def _intern(self, ref: str) -> int:
+        i = self._ids.get(ref)
+        if i is None:
+            i = self._ids[ref] = len(self._refs)
+            self._refs.append(ref)
+            self._down.append([])
+            self._up.append([])
+        return i
+
+    def refresh(self) -> "LineageGraph":
+        session = audit_session()
+        with session.hold():
+            version = session.query("select count(*), max(emitted_at) from lineage_edges")[0]
+            if version == self._version:
+                return self
+            edges = session.query("select distinct from_ref, to_ref from lineage_edges")
+        self.__init__()
+        for from_ref, to_ref in edges:
+            f, t = self._intern(from_ref), self._intern(to_ref)
+            self._down[f].append(t)
+            self._up[t].append(f)
+        self._version = version
+        return self
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self._ids
+
+    def _walk(self, ref: str, adjacency: list[list[int]], max_depth: int | None) -> list[tuple[int, str]]:
+        start = self._ids.get(ref)
+        if start is None:
+            return []
+        seen = {start}
+        out = []
+        queue = deque([(start, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for nxt in adjacency[node]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    out.append((depth + 1, self._refs[nxt]))
+                    queue.append((nxt, depth + 1))
+        return out
+
+    def upstream(self, ref: str, max_depth: int | None = None) -> list[tuple[int, str]]:
+        """(depth, ref) of everything `ref` was derived from, nearest first."""
+        return self._walk(ref, self._up, max_depth)
+
+    def downstream(self, ref: str, max_depth: int | None = None) -> list[tuple[int, str]]:
+        """(depth, ref) of everything derived from `ref`, nearest first."""
+        return self._walk(ref, self._down, max_depth)
+
+_GRAPHS: dict[Path, LineageGraph] = {}
+
+def lineage_graph() -> LineageGraph:
+    """Graph of the active audit DB, refreshed if its edges changed."""
+    path = load_env_config().duckdb_path
+    graph = _GRAPHS.get(path)
+    if graph is None:
+        graph = _GRAPHS[path] = LineageGraph()
+    return graph.refresh()
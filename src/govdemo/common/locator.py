@@ -0,0 +1,74 @@
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from .audit import AuditUnavailable, audit_session
+from .layout import stats_row_groups
+from .time import now_iso
+
+def _stat_key(path: Path) -> str:
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def index_files(layer: str, paths: list[Path]) -> None:
+    """(Re)index which user_ids live in which row group of each parquet file."""
+    if not paths:
+        return
+    session = audit_session()
+    forget_files(paths)
+    for path in paths:
+        pf = pq.ParquetFile(path)
+        if "user_id" not in pf.schema_arrow.names:
+            continue
+        chunks = []
+        for rg in range(pf.num_row_groups):
+            users = pc.drop_null(pc.unique(pf.read_row_group(rg, columns=["user_id"])["user_id"]))
+            chunks.append(pa.table({"row_group": pa.array([rg] * len(users), pa.int32()), "user_id": users.cast(pa.string())}))
+        if chunks:
+            session.execute("insert into user_locator select ?, ?, row_group, user_id from located",
+                            [layer, str(path)], tables={"located": pa.concat_tables(chunks)})
+        session.execute("insert into locator_files values (?, ?, ?, ?)", [layer, str(path), _stat_key(path), now_iso()])
+
+def forget_files(paths: list[Path]) -> None:
+    if not paths:
+        return
+    forgotten = {"forgotten": pa.table({"path": [str(p) for p in paths]})}
+    session = audit_session()
+    session.execute("delete from user_locator where path in (select path from forgotten)", tables=forgotten)
+    session.execute("delete from locator_files where path in (select path from forgotten)", tables=forgotten)
+
+class UserLocator:
+    """Answers "which row groups of which files may hold these users?".
+
+    Files whose locator entry is current are answered from the index without
+    being opened; anything else falls back to parquet min/max statistics.
+    """
+
+    def __init__(self, user_ids: set[str]):
+        self.user_ids = set(user_ids)
+        self._indexed: dict[str, str] = {}
+        self._hits: dict[str, list[int]] = {}
+        session = audit_session()
+        ids = pa.table({"user_id": pa.array(sorted(self.user_ids), pa.string())})
+        try:
+            with session.hold():
+                indexed = dict(session.query("select path, stat_key from locator_files"))
+                hits = session.query(
+                    "select distinct l.path, l.row_group from user_locator l join wanted w using (user_id) order by 1, 2",
+                    tables={"wanted": ids},
+                )
+        except AuditUnavailable:
+            return  # audit DB locked: every file falls back to statistics
+        self._indexed = indexed
+        for path, rg in hits:
+            self._hits.setdefault(path, []).append(rg)
+
+    def row_groups(self, path: Path) -> list[int]:
+        if not path.exists() or not self.user_ids:
+            return []
+        if self._indexed.get(str(path)) == _stat_key(path):
+            return self._hits.get(str(path), [])
+        pf = pq.ParquetFile(path)
+        if "user_id" not in pf.schema_arrow.names:
+            return []
+        return stats_row_groups(pf, "user_id", values=self.user_ids)
@@ -0,0 +1,144 @@
+import cProfile
+import io
+import os
+import pstats
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+import pyarrow as pa
+
+PHASE_COLUMNS = ["wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read", "bytes_written"]
+
+METRICS_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("pipeline", pa.string()),
+    ("phase", pa.string()),
+    ("wall_s", pa.float64()),
+    ("cpu_s", pa.float64()),
+    ("rows_in", pa.int64()),
+    ("rows_out", pa.int64()),
+    ("bytes_read", pa.int64()),
+    ("bytes_written", pa.int64()),
+    ("peak_rss_mb", pa.float64()),
+    ("peak_traced_mb", pa.float64()),
+])
+
+def _cpu() -> float:
+    """CPU seconds of this process plus its reaped children (pool workers)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+def _peak_rss_mb() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, kids) / 1024
+
+@dataclass
+class RunMetrics:
+    run_id: str
+    pipeline: str
+    started: float = field(default_factory=time.perf_counter)
+    started_cpu: float = field(default_factory=_cpu)
+    phases: dict[str, dict[str, float]] = field(default_factory=dict)
+    totals: dict[str, float] = field(default_factory=lambda: dict.fromkeys(PHASE_COLUMNS[2:], 0))
+    profiler: cProfile.Profile | None = None
+    traced: bool = False
+
+    def add(self, phase: str | None = None, **counts: int) -> None:
+        for key, value in counts.items():
+            self.totals[key] += value
+            if phase is not None:
+                row = self.phases.setdefault(phase, dict.fromkeys(PHASE_COLUMNS, 0))
+                row[key] += value
+
+    def rows(self) -> list[dict]:
+        peak_rss = _peak_rss_mb()
+        peak_traced = tracemalloc.get_traced_memory()[1] / 2**20 if self.traced else None
+        base = {"run_id": self.run_id, "pipeline": self.pipeline, "peak_rss_mb": None, "peak_traced_mb": None}
+        out = [{**base, "phase": name, **values} for name, values in self.phases.items()]
+        out.append({**base, "phase": "total", "wall_s": time.perf_counter() - self.started,
+                    "cpu_s": _cpu() - self.started_cpu, **self.totals,
+                    "peak_rss_mb": peak_rss, "peak_traced_mb": peak_traced})
+        return out
+
+_ACTIVE: dict[str, RunMetrics] = {}
+_PROFILE_DIR: Path | None = None
+
+def _reset_after_fork() -> None:
+    # runs of the parent (e.g. a DAG) are not ours; drop them and their profilers
+    for m in _ACTIVE.values():
+        if m.profiler is not None:
+            m.profiler.disable()
+        if m.traced:
+            tracemalloc.stop()
+    _ACTIVE.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def enable_profiling(out_dir: Path) -> None:
+    """Capture cProfile stats and tracemalloc peaks for every run started from now on."""
+    global _PROFILE_DIR
+    _PROFILE_DIR = out_dir
+
+def begin(run_id: str, pipeline: str) -> None:
+    m = _ACTIVE[run_id] = RunMetrics(run_id, pipeline)
+    if _PROFILE_DIR is not None and not any(a.profiler for a in _ACTIVE.values() if a is not m):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            m.traced = True
+        m.profiler = cProfile.Profile()
+        m.profiler.enable()
+
+def count(run_id: str, phase: str | None = None, **counts: int) -> None:
+    """Add to rows_in/rows_out/bytes_read/bytes_written of a run (and of `phase`)."""
+    m = _ACTIVE.get(run_id)
+    if m is not None:
+        m.add(phase, **counts)
+
+@contextmanager
+def phase(run_id: str, name: str) -> Iterator[None]:
+    """Time a phase (read/transform/write/...) of a run; repeated phases accumulate."""
+    m = _ACTIVE.get(run_id)
+    if m is None:
+        yield
+        return
+    t0, c0 = time.perf_counter(), _cpu()
+    try:
+        yield
+    finally:
+        row = m.phases.setdefault(name, dict.fromkeys(PHASE_COLUMNS, 0))
+        row["wall_s"] += time.perf_counter() - t0
+        row["cpu_s"] += _cpu() - c0
+
+def end(run_id: str) -> pa.Table | None:
+    """Stop tracking a run; returns its metrics rows and writes profiles if enabled."""
+    m = _ACTIVE.pop(run_id, None)
+    if m is None:
+        return None
+    table = pa.Table.from_pylist(m.rows(), schema=METRICS_SCHEMA)
+    if m.profiler is not None:
+        m.profiler.disable()
+        _write_profile(m)
+    if m.traced:
+        tracemalloc.stop()
+    return table
+
+def _write_profile(m: RunMetrics) -> None:
+    _PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stem = _PROFILE_DIR/f"{m.pipeline}-{m.run_id}"
+    m.profiler.dump_stats(f"{stem}.prof")
+    buf = io.StringIO()
+    pstats.Stats(m.profiler, stream=buf).sort_stats("cumulative").print_stats(40)
+    lines = [buf.getvalue()]
+    if m.traced:
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"tracemalloc current={current / 2**20:.1f}MB peak={peak / 2**20:.1f}MB\n")
+        for stat in tracemalloc.take_snapshot().statistics("lineno")[:25]:
+            lines.append(f"{stat}\n")
+    Path(f"{stem}.txt").write_text("".join(lines), encoding="utf-8")
@@ -1,8 +1,26 @@
 import hashlib
-from .config import load_env_config
+import pyarrow as pa
+from .context import run_context
 
-def token(value: str) -> str:
-    cfg = load_env_config()
-    h = hashlib.sha256()
-    h.update((value + cfg.pii_secret).encode("utf-8"))
-    return h.hexdigest()
+def _digest(value: str, suffix: bytes) -> str:
+    return hashlib.sha256(value.encode("utf-8") + suffix).hexdigest()
+
+def token(value: str, secret: str | None = None) -> str:
+    if secret is None:
+        secret = run_context().pii_secret
+    return _digest(value, secret.encode("utf-8"))
+
+def token_batch(values: pa.Array | pa.ChunkedArray, secret: str | None = None) -> pa.Array:
+    """Tokenize a string array; equivalent to `token()` element-wise.
+
+    The secret is resolved once per call and each distinct value is hashed once
+    (values are dictionary-encoded first). Nulls stay null.
+    """
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if secret is None:
+        secret = run_context().pii_secret
+    suffix = secret.encode("utf-8")
+    encoded = values.dictionary_encode()
+    digests = [_digest(v, suffix) for v in encoded.dictionary.to_pylist()]
+    return pa.array(digests, pa.string()).take(encoded.indices)
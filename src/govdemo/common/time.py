@@ -1,7 +1,25 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 def today_utc() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+def check_dt(dt: str) -> str:
+    """`dt` if it is a YYYY-MM-DD date; anything else (e.g. a path) raises ValueError."""
+    try:
+        ok = datetime.strptime(dt, "%Y-%m-%d").date().isoformat() == dt
+    except (TypeError, ValueError):
+        ok = False
+    if not ok:
+        raise ValueError(f"Invalid dt {dt!r}: expected YYYY-MM-DD")
+    return dt
+
+def date_range(start: str, end: str | None = None) -> list[str]:
+    """Inclusive list of YYYY-MM-DD dates from `start` to `end` (defaults to `start`)."""
+    lo = datetime.strptime(start, "%Y-%m-%d").date()
+    hi = datetime.strptime(end or start, "%Y-%m-%d").date()
+    if hi < lo:
+        raise ValueError(f"End date {end} is before start date {start}")
+    return [(lo + timedelta(days=i)).isoformat() for i in range((hi - lo).days + 1)]
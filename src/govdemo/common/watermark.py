@@ -0,0 +1,44 @@
+import zlib
+from pathlib import Path
+import pyarrow as pa
+from .audit import AuditUnavailable, audit_session
+from .time import now_iso
+
+def fingerprint(path: Path) -> str:
+    """size:mtime_ns[:crc32 of the parquet footer] for a stage input file."""
+    st = path.stat()
+    fp = f"{st.st_size}:{st.st_mtime_ns}"
+    if path.suffix == ".parquet" and st.st_size >= 12:
+        with path.open("rb") as f:
+            f.seek(-8, 2)
+            tail = f.read(8)
+            footer_len = int.from_bytes(tail[:4], "little")
+            if tail[4:] == b"PAR1" and footer_len + 8 <= st.st_size:
+                f.seek(-(footer_len + 8), 2)
+                fp += f":{zlib.crc32(f.read(footer_len)):08x}"
+    return fp
+
+def fingerprints(paths: list[Path]) -> dict[str, str]:
+    return {str(p): fingerprint(p) for p in paths}
+
+def recorded_inputs(stage: str, dt: str) -> dict[str, str]:
+    """Input fingerprints recorded by the last successful `stage` run for `dt`.
+
+    If the audit DB stays locked, nothing is reported as recorded and the stage recomputes.
+    """
+    try:
+        return dict(audit_session().query(
+            "select input_path, fingerprint from stage_inputs where stage=? and dt=?", [stage, dt]
+        ))
+    except AuditUnavailable:
+        return {}
+
+def record_inputs(stage: str, dt: str, run_id: str, inputs: dict[str, str]) -> None:
+    session = audit_session()
+    session.execute("delete from stage_inputs where stage=? and dt=?", [stage, dt])
+    if inputs:
+        session.execute(
+            "insert into stage_inputs select ?, ?, input_path, fingerprint, ?, ? from recorded",
+            [stage, dt, run_id, now_iso()],
+            tables={"recorded": pa.table({"input_path": list(inputs), "fingerprint": list(inputs.values())})},
+        )
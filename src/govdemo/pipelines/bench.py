@@ -0,0 +1,206 @@
+from bisect import bisect_left
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from itertools import accumulate
+from pathlib import Path
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from ..common.config import load_env_config
+from ..common.time import now_iso, today_utc
+
+BENCH_STAGES = ["ingest", "clean", "curate", "serve", "build-identity", "export-audience"]
+WRITE_BATCH = 65536
+RSS_SAMPLE_S = 0.1
+
+@dataclass(frozen=True)
+class GeneratorSpec:
+    rows: int = 1_000_000
+    users: int = 100_000
+    skew: float = 1.1            # zipf exponent for events per user; 0 = uniform
+    pii_cardinality: int = 0     # distinct emails/IPs; 0 = one per user
+    invalid_rate: float = 0.001  # share of records missing event_id
+    seed: int = 42
+    dt: str = ""
+
+class _UserSampler:
+    """Draw user indexes 0..users-1 with P(k) ~ 1/(k+1)^skew."""
+
+    def __init__(self, rng: random.Random, users: int, skew: float):
+        self.rng = rng
+        self.users = users
+        self.cum = None if skew <= 0 else list(accumulate(1.0 / (k + 1) ** skew for k in range(users)))
+
+    def __call__(self) -> int:
+        if self.cum is None:
+            return self.rng.randrange(self.users)
+        return min(bisect_left(self.cum, self.rng.random() * self.cum[-1]), self.users - 1)
+
+def generate_landing(path: Path, spec: GeneratorSpec) -> dict:
+    """Stream `spec.rows` synthetic events to `path` as JSONL; same spec, same bytes."""
+    rng = random.Random(spec.seed)
+    sample = _UserSampler(rng, max(spec.users, 1), spec.skew)
+    pii = spec.pii_cardinality or spec.users
+    day = datetime.strptime(spec.dt or today_utc(), "%Y-%m-%d").strftime("%Y-%m-%d")
+    step_us = 86_400_000_000 // max(spec.rows, 1)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    invalid = 0
+    t0 = time.perf_counter()
+    with path.open("w", encoding="utf-8") as f:
+        batch = []
+        for i in range(spec.rows):
+            u = sample()
+            p = u % pii
+            s, us = divmod(i * step_us, 1_000_000)
+            m, s = divmod(s, 60)
+            at = f"{day}T{m // 60:02d}:{m % 60:02d}:{s:02d}.{us:06d}Z"
+            head = ""
+            if rng.random() >= spec.invalid_rate:
+                head = f'"event_id":"e{i}",'
+            else:
+                invalid += 1
+            batch.append(
+                f'{{{head}"user_id":"u{u}","event_time":"{at}","email":"p{p}@example.com",'
+                f'"ip_address":"10.{p >> 16 & 255}.{p >> 8 & 255}.{p & 255}","source":"app"}}\n'
+            )
+            if len(batch) >= WRITE_BATCH:
+                f.write("".join(batch))
+                batch = []
+        f.write("".join(batch))
+    return {"path": str(path), "rows": spec.rows, "invalid": invalid, "bytes": path.stat().st_size,
+            "seconds": time.perf_counter() - t0}
+
+def _stage_args(stage: str, dt: str, workers: int) -> list[str]:
+    args = [stage, "--dt", dt]
+    if stage in ("ingest", "clean"):
+        args += ["--workers", str(workers)]
+    if stage in ("clean", "curate", "serve"):
+        args += ["--force"]
+    return args
+
+def _tree_rss(pid: int) -> int:
+    """Summed RSS in bytes of `pid` and its descendants, from /proc (0 where there is none)."""
+    children: dict[int, list[int]] = {}
+    rss: dict[int, int] = {}
+    for d in Path("/proc").glob("[0-9]*"):
+        try:
+            stat = (d/"stat").read_text()
+        except OSError:
+            continue
+        fields = stat[stat.rindex(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(d.name))
+        rss[int(d.name)] = int(fields[21])
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        total += rss.get(p, 0)
+        todo += children.get(p, [])
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+def _run_measured(args: list[str], cwd: Path, env: dict) -> dict:
+    """Run `govdemo <args>` in a child process and collect wall time, CPU and peak RSS.
+
+    Both cover the child's whole process tree: the kernel adds the CPU time of
+    reaped workers (ingest/clean --workers) to the child's, and the RSS of the
+    tree is sampled every RSS_SAMPLE_S while it runs.
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "govdemo.cli", *args], cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    peak = [0]
+    done = threading.Event()
+
+    def sample() -> None:
+        while not done.wait(RSS_SAMPLE_S):
+            peak[0] = max(peak[0], _tree_rss(proc.pid))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    stderr = proc.stderr.read()
+    done.set()
+    sampler.join()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t0
+    return {
+        "exit_code": proc.returncode,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_mb": round(max(peak[0] / 1024, usage.ru_maxrss) / 1024, 1),
+        "error": stderr.decode("utf-8", "replace")[-2000:] if proc.returncode else "",
+    }
+
+def run_bench(spec: GeneratorSpec, workdir: Path | None = None, stages: list[str] | None = None,
+              workers: int = 1, keep: bool = False) -> dict:
+    """Generate a landing file per `spec` in a scratch project and time each stage.
+
+    The project's roles and layout configs are copied into the scratch project.
+
+    Each stage runs as its own `govdemo` process (role data_engineer) so peak
+    RSS and CPU are per stage, worker processes included. The result is
+    JSON-serializable and meant to be diffed across commits.
+    """
+    stages = stages or BENCH_STAGES
+    unknown = [s for s in stages if s not in BENCH_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown bench stage(s): {', '.join(unknown)}. Expected: {', '.join(BENCH_STAGES)}")
+    spec = GeneratorSpec(**{**asdict(spec), "dt": spec.dt or today_utc()})
+
+    cfg = load_env_config()
+    if not cfg.roles_path.exists():
+        raise FileNotFoundError(f"Missing roles config: {cfg.roles_path}. "
+                                "Run `govdemo bench` from a project directory that has configs/roles.local.yaml.")
+    scratch = Path(workdir) if workdir else Path(tempfile.mkdtemp(prefix="govdemo-bench-"))
+    (scratch/"configs").mkdir(parents=True, exist_ok=True)
+    for config in (cfg.roles_path, cfg.layout_path):
+        target = scratch/"configs"/config.name
+        if config.exists() and config.resolve() != target.resolve():
+            shutil.copy(config, target)
+
+    # children import the same govdemo as this process, whatever their cwd
+    package_root = str(Path(__file__).resolve().parents[2])
+    env = {**os.environ, "GOVDEMO_ROLE": "data_engineer",
+           "PII_TOKEN_SECRET": os.environ.get("PII_TOKEN_SECRET", "bench-secret"),
+           "PYTHONPATH": os.pathsep.join(p for p in [package_root, os.environ.get("PYTHONPATH", "")] if p)}
+    try:
+        init = _run_measured(["init"], scratch, env)
+        if init["exit_code"]:
+            raise RuntimeError(f"govdemo init failed in {scratch}: {init['error']}")
+        generated = generate_landing(scratch/"data_lake"/"landing"/"events.jsonl", spec)
+        results = []
+        for stage in stages:
+            r = _run_measured(_stage_args(stage, spec.dt, workers), scratch, env)
+            r = {"stage": stage, **r, "rows_per_s": round(spec.rows / r["wall_s"]) if r["wall_s"] else 0}
+            results.append(r)
+            if r["exit_code"]:
+                break
+    finally:
+        if not keep and not workdir:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "at": now_iso(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "spec": asdict(spec),
+        "workers": workers,
+        "generated": {k: generated[k] for k in ("rows", "invalid", "bytes")} | {"seconds": round(generated["seconds"], 3)},
+        "stages": results,
+        "total_wall_s": round(sum(r["wall_s"] for r in results), 3),
+        "workdir": str(scratch) if keep or workdir else "",
+    }
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parent, timeout=5)
+        return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
@@ -1,13 +1,22 @@
-import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
 from pathlib import Path
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 from ..common.acl import check_read, check_write
 from ..common.config import load_env_config
 from ..common.audit import start_run, finish_run
-from ..common.lineage import emit_edge
-from ..common.pii import token
+from ..common.jsonl import CHUNK_BYTES, iter_line_chunks, read_columns
+from ..common.layout import LayoutPolicy, layout_policy, open_writer
+from ..common.lineage import emit_edges
+from ..common.metrics import count, phase
+from ..common.locator import forget_files, index_files
+from ..common.pii import token_batch
 from ..common.time import today_utc
+from ..common.watermark import fingerprints, record_inputs, recorded_inputs
+from .ingest import raw_parts
 
 SCHEMA = pa.schema([
     ("event_id", pa.string()),
@@ -17,37 +26,155 @@ SCHEMA = pa.schema([
     ("ip_token", pa.string()),
 ])
 
-def run_clean(dt: str | None = None) -> dict:
+RAW_COLUMNS = ["event_id", "user_id", "event_time", "email", "ip_address"]
+
+def clean_parts(root: Path, dt: str) -> list[Path]:
+    return uncovered_parts(sorted((root/"clean"/"events"/f"dt={dt}").glob("part-*.parquet")))
+
+def uncovered_parts(parts: list[Path]) -> list[Path]:
+    """`parts` without those a merged part among them already covers.
+
+    `govdemo compact` publishes a merged part before it unlinks its members, so
+    a reader listing the partition in between must not count both.
+    """
+    merged = [r for r in map(clean_part_range, parts) if r is not None and r[1] != r[2]]
+
+    def covered(part: Path) -> bool:
+        key = clean_part_range(part)
+        return key is not None and any(key != m and key[0] == m[0] and m[1] <= key[1] and key[2] <= m[2]
+                                       for m in merged)
+
+    return [p for p in parts if not covered(p)]
+
+def _raw_key(raw_path: Path) -> tuple[str, int]:
+    return raw_path.parent.name.split("=", 1)[-1], int(raw_path.stem.split("-", 1)[-1])
+
+def clean_part_name(raw_path: Path) -> str:
+    """raw .../source=app/part-00003.jsonl -> clean part-app-00003.parquet (stable across reruns)."""
+    source, n = _raw_key(raw_path)
+    return f"part-{source}-{n:05d}.parquet"
+
+def merged_part_name(source: str, first: int, last: int) -> str:
+    """Clean part standing in for the raw parts first..last of `source` (see `govdemo compact`)."""
+    return f"part-{source}-{first:05d}-{last:05d}.parquet"
+
+_PART_NAME = re.compile(r"part-(?P<source>.+?)-(?P<first>\d{5})(?:-(?P<last>\d{5}))?\.parquet")
+
+def clean_part_range(path: Path) -> tuple[str, int, int] | None:
+    """(source, first, last) raw part numbers a clean part was cleaned from."""
+    m = _PART_NAME.fullmatch(path.name)
+    if m is None:
+        return None
+    return m["source"], int(m["first"]), int(m["last"] or m["first"])
+
+def _merged_outputs(out_dir: Path, parts: list[Path], inputs: dict[str, str],
+                    previous: dict[str, str]) -> dict[Path, Path]:
+    """raw part -> merged clean part, for merged parts whose raw parts are all unchanged."""
+    out = {}
+    for merged in out_dir.glob("part-*-*-*.parquet"):
+        key = clean_part_range(merged)
+        if key is None or key[1] == key[2]:
+            continue
+        source, first, last = key
+
+        def covered(raw: str | Path) -> bool:
+            s, n = _raw_key(Path(raw))
+            return s == source and first <= n <= last
+
+        members = [p for p in parts if covered(p)]
+        recorded = [p for p in previous if covered(p)]
+        if members and len(recorded) == len(members) and all(previous.get(str(p)) == inputs[str(p)] for p in members):
+            out.update((p, merged) for p in members)
+    return out
+
+def _clean_batch(cols: pa.Table) -> pa.Table:
+    return pa.table({
+        "event_id": cols["event_id"],
+        "user_id": cols["user_id"],
+        "event_time": cols["event_time"],
+        "email_token": token_batch(pc.fill_null(cols["email"], "")),
+        "ip_token": token_batch(pc.fill_null(cols["ip_address"], "")),
+    }, schema=SCHEMA)
+
+def _clean_part(raw_path: str, out_path: str, policy: LayoutPolicy, chunk_bytes: int = CHUNK_BYTES) -> int:
+    """Tokenize one raw part into one clean parquet part. Runs inside pool workers.
+
+    Raw JSON is parsed straight into Arrow a `chunk_bytes` block at a time and
+    streamed out in row groups of `policy.row_group_size`, so memory stays per-batch.
+    """
+    row_group_size = policy.row_group_size
+    rows = 0
+    pending: list[pa.Table] = []
+    pending_rows = 0
+    with open_writer(Path(out_path), SCHEMA, policy) as writer:
+        for lines in iter_line_chunks(Path(raw_path), chunk_bytes):
+            batch = _clean_batch(read_columns(lines, RAW_COLUMNS))
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                table = pa.concat_tables(pending)
+                full = pending_rows - pending_rows % row_group_size
+                writer.write_table(table.slice(0, full), row_group_size=row_group_size)
+                pending, pending_rows = [table.slice(full)], pending_rows - full
+        if pending_rows:
+            writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+    return rows
+
+def run_clean(dt: str | None = None, workers: int = 1, row_group_size: int | None = None,
+              compression: str | None = None, force: bool = False) -> dict:
+    """Tokenize every raw part of `dt` (all sources) into one clean parquet part each.
+
+    Raw parts whose fingerprint matches the last successful run are not re-cleaned
+    unless `force`. With `workers > 1` parts are cleaned by a process pool.
+    Files follow the "clean" layout policy; `row_group_size`/`compression` override it.
+    """
     check_read("raw")
     check_write("clean")
     check_write("warehouse")
 
     cfg = load_env_config()
     dt = dt or today_utc()
-    raw_path = cfg.root/"raw"/"events"/f"dt={dt}"/"source=app"/"part-00001.jsonl"
-    if not raw_path.exists():
-        raise FileNotFoundError(f"Missing raw file: {raw_path}. Run `govdemo ingest` first.")
-
-    run_id = start_run("clean", input_ref=str(raw_path))
-
-    rows = []
-    with raw_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            r = json.loads(line)
-            rows.append({
-                "event_id": str(r.get("event_id")),
-                "user_id": str(r.get("user_id")),
-                "event_time": str(r.get("event_time")),
-                "email_token": token(str(r.get("email",""))),
-                "ip_token": token(str(r.get("ip_address",""))),
-            })
-
-    table = pa.Table.from_pylist(rows, schema=SCHEMA)
+    raw_dir = cfg.root/"raw"/"events"/f"dt={dt}"
+    parts = raw_parts(cfg.root, dt)
+    if not parts:
+        raise FileNotFoundError(f"Missing raw files in: {raw_dir}. Run `govdemo ingest` first.")
+
+    run_id = start_run("clean", input_ref=str(raw_dir))
+
     out_dir = cfg.root/"clean"/"events"/f"dt={dt}"
     out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir/"part-00001.parquet"
-    pq.write_table(table, out_path, use_dictionary=False)
+    inputs = fingerprints(parts)
+    previous = {} if force else recorded_inputs("clean", dt)
+    merged = _merged_outputs(out_dir, parts, inputs, previous)
+    out_paths = [merged.get(p) or out_dir/clean_part_name(p) for p in parts]
+    stale = sorted(set(out_dir.glob("part-*.parquet")) - set(out_paths))
+    for p in stale:
+        p.unlink()
+    forget_files(stale)
+
+    todo = [(p, o) for p, o in zip(parts, out_paths) if previous.get(str(p)) != inputs[str(p)] or not o.exists()]
+
+    policy = layout_policy("clean")
+    policy = replace(policy, row_group_size=row_group_size or policy.row_group_size,
+                     compression=compression or policy.compression)
+    with phase(run_id, "tokenize_write"):
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                cleaned = list(pool.map(_clean_part, *zip(*((str(p), str(o), policy) for p, o in todo))))
+        else:
+            cleaned = [_clean_part(str(p), str(o), policy) for p, o in todo]
+    out_paths = list(dict.fromkeys(out_paths))
+    rows = sum(pq.ParquetFile(o).metadata.num_rows for o in out_paths)
+    with phase(run_id, "index"):
+        index_files("clean", [o for _, o in todo])
+    count(run_id, rows_in=sum(cleaned), rows_out=sum(cleaned),
+          bytes_read=sum(p.stat().st_size for p, _ in todo), bytes_written=sum(o.stat().st_size for _, o in todo))
 
-    emit_edge(run_id, "clean", from_ref=str(raw_path), to_ref=str(out_path))
-    finish_run(run_id, "SUCCESS", output_ref=str(out_path), details=f"rows={len(rows)}")
-    return {"run_id": run_id, "clean_path": str(out_path), "rows": len(rows)}
+    emit_edges(run_id, "clean", todo)
+    record_inputs("clean", dt, run_id, inputs)
+    status = "SUCCESS" if todo else "SKIPPED"
+    finish_run(run_id, status, output_ref=str(out_dir),
+               details=f"rows={rows},parts={len(out_paths)},cleaned={len(todo)},workers={workers}")
+    return {"run_id": run_id, "clean_path": str(out_dir), "clean_parts": [str(p) for p in out_paths],
+            "rows": rows, "skipped": not todo}
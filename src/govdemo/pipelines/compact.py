@@ -0,0 +1,183 @@
+import math
+import os
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ..common.acl import check_read, check_write
+from ..common.config import load_env_config
+from ..common.audit import start_run, finish_run
+from ..common.layout import LayoutPolicy, layer_files, layout_policy, open_writer, write_layout
+from ..common.lineage import emit_edges
+from ..common.locator import forget_files, index_files
+from ..common.metrics import count, phase
+from .clean import clean_part_range, merged_part_name, uncovered_parts
+from .curate import FACTS_STEM
+from .identity import IDENTITY_STEM
+from .serve import SERVING_STEM
+from .windows import WINDOW_STEM
+
+# layer -> (partition dirs under the lake root, file stem or None for clean's parts, ACL layer)
+LAYERS = {
+    "clean": ("clean/events/dt={dt}", None, "clean"),
+    "curated": ("curated/facts/dt={dt}", FACTS_STEM, "curated"),
+    "curated_windows": ("curated/windows/window=*/dt={dt}", WINDOW_STEM, "curated"),
+    "serving": ("serving/user_metrics/dt={dt}", SERVING_STEM, "serving"),
+    "serving_windows": ("serving/user_activity_window/window=*/dt={dt}", WINDOW_STEM, "serving"),
+    "restricted_pii": ("restricted_pii/identity/dt={dt}", IDENTITY_STEM, "restricted_pii"),
+}
+
+def _file_stats(files: list[Path]) -> dict:
+    rows = row_groups = 0
+    for p in files:
+        meta = pq.ParquetFile(p).metadata
+        rows += meta.num_rows
+        row_groups += meta.num_row_groups
+    return {"files": len(files), "rows": rows, "bytes": sum(p.stat().st_size for p in files), "row_groups": row_groups}
+
+def _clean_groups(files: list[Path], target_bytes: int) -> list[list[Path]]:
+    """Runs of consecutive parts of one source, packed up to `target_bytes` each."""
+    by_source: dict[str, list[tuple[int, int, Path]]] = {}
+    for p in files:
+        key = clean_part_range(p)
+        if key is not None:
+            by_source.setdefault(key[0], []).append((key[1], key[2], p))
+    groups = []
+    for parts in by_source.values():
+        group, size = [], 0
+        for _, _, p in sorted(parts):
+            if group and size + p.stat().st_size > target_bytes:
+                groups.append(group)
+                group, size = [], 0
+            group.append(p)
+            size += p.stat().st_size
+        if group:
+            groups.append(group)
+    return groups
+
+def _plan_partition(layer: str, part_dir: Path, stem: str | None, policy: LayoutPolicy) -> dict | None:
+    """Fragmentation stats of one partition and what compacting it would write."""
+    files = layer_files(part_dir, stem) if stem else uncovered_parts(sorted(part_dir.glob("part-*.parquet")))
+    if not files:
+        return None
+    stats = _file_stats(files)
+    target_bytes = policy.target_file_mb * 1024 * 1024
+    if stem is None:
+        groups = [g for g in _clean_groups(files, target_bytes) if len(g) > 1]
+        target_files = stats["files"] - sum(len(g) - 1 for g in groups)
+        fragmented = bool(groups)
+    else:
+        # a partition written by write_layout has one file per bucket and full row groups
+        groups = []
+        target_files = policy.buckets
+        full = sum(max(1, math.ceil(pq.ParquetFile(p).metadata.num_rows / policy.row_group_size)) for p in files)
+        fragmented = stats["files"] != policy.buckets or stats["row_groups"] > full
+    return {"layer": layer, "path": str(part_dir), **stats,
+            "small_files": sum(1 for p in files if p.stat().st_size < target_bytes // 2),
+            "avg_row_group_rows": stats["rows"] // max(stats["row_groups"], 1),
+            "target_files": target_files, "fragmented": fragmented,
+            "_files": files, "_groups": groups}
+
+def _merge_parts(members: list[Path], dst: Path, policy: LayoutPolicy) -> int:
+    """Stream the row groups of `members` into `dst` in order, re-chunked to full row groups."""
+    row_group_size = policy.row_group_size
+    schema = pq.ParquetFile(members[0]).schema_arrow
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    rows = 0
+    pending: list[pa.Table] = []
+    pending_rows = 0
+    with open_writer(tmp, schema, policy) as writer:
+        for p in members:
+            pf = pq.ParquetFile(p)
+            for rg in range(pf.num_row_groups):
+                batch = pf.read_row_group(rg).cast(schema)
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                rows += batch.num_rows
+                if pending_rows >= row_group_size:
+                    table = pa.concat_tables(pending)
+                    full = pending_rows - pending_rows % row_group_size
+                    writer.write_table(table.slice(0, full), row_group_size=row_group_size)
+                    pending, pending_rows = [table.slice(full)], pending_rows - full
+        if pending_rows:
+            writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+    os.replace(tmp, dst)
+    return rows
+
+def _compact_partition(plan: dict, stem: str | None, policy: LayoutPolicy) -> list[tuple[Path, Path]]:
+    """Rewrite one partition; returns (old file, new file) edges."""
+    part_dir = Path(plan["path"])
+    if stem is not None:
+        files = plan["_files"]
+        table = pa.concat_tables([pq.ParquetFile(p).read() for p in files])
+        out_files = write_layout(table, part_dir, stem, policy)
+        forget_files(sorted(set(files) - set(out_files)))
+        index_files(plan["layer"], out_files)
+        return [(o, n) for o in files for n in out_files]
+    edges = []
+    for members in plan["_groups"]:
+        source, first, _ = clean_part_range(members[0])
+        dst = part_dir/merged_part_name(source, first, clean_part_range(members[-1])[2])
+        _merge_parts(members, dst, policy)
+        # the merged file is in place before its members go, so a reader never misses rows;
+        # clean_parts() leaves out members a merged part covers, so none counts them twice either
+        for p in members:
+            p.unlink()
+        forget_files(members)
+        index_files(plan["layer"], [dst])
+        edges += [(p, dst) for p in members]
+    return edges
+
+def run_compact(layers: list[str] | None = None, dt: str | None = None, dry_run: bool = False) -> dict:
+    """Merge fragmented partitions of the lake layers back into their tuned layout.
+
+    Curated, serving, window and identity partitions are fragmented when their
+    files no longer match the layer's layout policy (bucket count, undersized
+    row groups); they are rewritten with write_layout. Clean partitions are
+    fragmented when consecutive parts of a source fit in one file of
+    `target_file_mb`; those parts are merged into one part named after the
+    raw parts it covers, which `govdemo clean` then keeps while they are unchanged.
+    Files are swapped in with os.replace, so serving files hard-linked by
+    `serve --mode link` are replaced, never modified. With `dry_run` only the
+    fragmentation report is returned.
+    """
+    layers = layers or list(LAYERS)
+    unknown = sorted(set(layers) - set(LAYERS))
+    if unknown:
+        raise ValueError(f"Unknown layer(s): {', '.join(unknown)}. Choose from: {', '.join(LAYERS)}")
+    for layer in layers:
+        check_read(LAYERS[layer][2])
+        if not dry_run:
+            check_write(LAYERS[layer][2])
+    if not dry_run:
+        check_write("warehouse")
+
+    cfg = load_env_config()
+    plans = []
+    for layer in layers:
+        pattern, stem, _ = LAYERS[layer]
+        policy = layout_policy(layer)
+        for part_dir in sorted(d for d in cfg.root.glob(pattern.format(dt=dt or "*")) if d.is_dir()):
+            plan = _plan_partition(layer, part_dir, stem, policy)
+            if plan is not None:
+                plans.append(plan)
+    todo = [p for p in plans if p["fragmented"]]
+    report = [{k: v for k, v in p.items() if not k.startswith("_")} for p in plans]
+    if dry_run:
+        return {"run_id": None, "dry_run": True, "partitions": report, "compacted": len(todo)}
+
+    run_id = start_run("compact", input_ref=f"layers={','.join(layers)},dt={dt or '*'}")
+    edges = []
+    rows = 0
+    with phase(run_id, "compact"):
+        for plan in todo:
+            _, stem, _ = LAYERS[plan["layer"]]
+            edges += _compact_partition(plan, stem, layout_policy(plan["layer"]))
+            rows += plan["rows"]
+    written = sorted({n for _, n in edges})
+    count(run_id, rows_in=rows, rows_out=rows, bytes_read=sum(p["bytes"] for p in todo),
+          bytes_written=sum(p.stat().st_size for p in written))
+    emit_edges(run_id, "compact", edges)
+    finish_run(run_id, "SUCCESS", output_ref=",".join(p["path"] for p in todo),
+               details=f"partitions={len(plans)},compacted={len(todo)},"
+                       f"files_before={sum(p['files'] for p in todo)},files_after={len(written)}")
+    return {"run_id": run_id, "dry_run": False, "partitions": report, "compacted": len(todo)}
@@ -1,11 +1,18 @@
+from pathlib import Path
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 from ..common.acl import check_read, check_write
 from ..common.config import load_env_config
 from ..common.audit import start_run, finish_run
-from ..common.lineage import emit_edge
+from ..common.engine import compute_connection, fetch_table
+from ..common.lineage import emit_edges
+from ..common.layout import layer_files, layout_policy, write_layout
+from ..common.locator import forget_files, index_files
+from ..common.metrics import count, phase
 from ..common.time import today_utc
-import collections
+from ..common.watermark import fingerprints, record_inputs, recorded_inputs
+from .clean import clean_parts
 
 FACT_SCHEMA = pa.schema([
     ("dt", pa.string()),
@@ -14,39 +21,115 @@ FACT_SCHEMA = pa.schema([
     ("last_event_time", pa.string()),
 ])
 
-def run_curate(dt: str | None = None) -> dict:
+ENGINES = ("duckdb", "arrow")
+BATCH_ROWS = 1024 * 1024
+FACTS_STEM = "fact_user_activity_daily"
+
+def curated_dir(root: Path, dt: str) -> Path:
+    return root/"curated"/"facts"/f"dt={dt}"
+
+def curated_files(root: Path, dt: str) -> list[Path]:
+    """Curated fact files of `dt` (one, or one per bucket under the curated layout)."""
+    return layer_files(curated_dir(root, dt), FACTS_STEM)
+
+def _merge_partials(tables: list[pa.Table]) -> pa.Table:
+    agg = pa.concat_tables(tables).group_by("user_id").aggregate([("events", "sum"), ("last_event_time", "max")])
+    return pa.table({"user_id": agg["user_id"], "events": agg["events_sum"], "last_event_time": agg["last_event_time_max"]})
+
+def _aggregate_arrow(parts: list[Path]) -> pa.Table:
+    """Stream row groups through Table.group_by, folding partial aggregates as they pile up."""
+    partials: list[pa.Table] = []
+    partial_rows = 0
+    for p in parts:
+        for batch in pq.ParquetFile(p).iter_batches(batch_size=BATCH_ROWS, columns=["user_id", "event_time"]):
+            t = pa.Table.from_batches([batch])
+            t = t.filter(pc.is_valid(t["user_id"]))
+            agg = t.group_by("user_id").aggregate([("user_id", "count"), ("event_time", "max")])
+            partials.append(pa.table({"user_id": agg["user_id"], "events": agg["user_id_count"],
+                                      "last_event_time": agg["event_time_max"]}))
+            partial_rows += agg.num_rows
+            if partial_rows >= BATCH_ROWS and len(partials) > 1:
+                partials = [_merge_partials(partials)]
+                partial_rows = partials[0].num_rows
+    if not partials:
+        return pa.table({"user_id": pa.array([], pa.string()), "events": pa.array([], pa.int64()),
+                         "last_event_time": pa.array([], pa.string())})
+    return _merge_partials(partials) if len(partials) > 1 else partials[0]
+
+def _aggregate_duckdb(parts: list[Path]) -> pa.Table:
+    """Push the group-by into DuckDB, which streams row groups and spills past its memory limit."""
+    con = compute_connection()
+    try:
+        return fetch_table(con.execute(
+            "select user_id, count(*) as events, max(event_time) as last_event_time "
+            "from read_parquet(?) where user_id is not null group by user_id",
+            [[str(p) for p in parts]],
+        ))
+    finally:
+        con.close()
+
+def run_curate(dt: str | None = None, engine: str = "duckdb", force: bool = False) -> dict:
+    """Aggregate clean events into per-user daily facts.
+
+    Skips the run when the clean parts are unchanged since the last successful
+    curate, and folds only new parts into the existing facts when nothing else
+    changed. `force` always recomputes from every part.
+    """
     check_read("clean")
     check_write("curated")
     check_write("warehouse")
 
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown curate engine '{engine}'. Expected one of: {', '.join(ENGINES)}")
+
     cfg = load_env_config()
     dt = dt or today_utc()
-    clean_path = cfg.root/"clean"/"events"/f"dt={dt}"/"part-00001.parquet"
-    if not clean_path.exists():
-        raise FileNotFoundError(f"Missing clean parquet: {clean_path}. Run `govdemo clean` first.")
+    clean_path = cfg.root/"clean"/"events"/f"dt={dt}"
+    parts = clean_parts(cfg.root, dt)
+    if not parts:
+        raise FileNotFoundError(f"Missing clean parquet in: {clean_path}. Run `govdemo clean` first.")
 
     run_id = start_run("curate", input_ref=str(clean_path))
 
-    table = pq.ParquetFile(clean_path).read()
+    out_dir = curated_dir(cfg.root, dt)
+    existing_files = curated_files(cfg.root, dt)
+
+    inputs = fingerprints(parts)
+    previous = {} if force or not existing_files else recorded_inputs("curate", dt)
+    if previous and inputs == previous:
+        finish_run(run_id, "SKIPPED", output_ref=str(out_dir), details="inputs unchanged")
+        return {"run_id": run_id, "curated_path": str(out_dir), "curated_files": [str(p) for p in existing_files],
+                "rows": sum(pq.ParquetFile(p).metadata.num_rows for p in existing_files), "skipped": True}
+    incremental = bool(previous) and all(inputs.get(k) == fp for k, fp in previous.items())
+    todo = [p for p in parts if str(p) not in previous] if incremental else parts
+
     # compute per-user counts and last seen
-    counts = collections.Counter()
-    last = {}
-    user_ids = table.column("user_id").to_pylist()
-    times = table.column("event_time").to_pylist()
-    for uid, t in zip(user_ids, times):
-        if uid is None:
-            continue
-        counts[uid] += 1
-        last[uid] = max(last.get(uid, ""), t)
-
-    rows = [{"dt": dt, "user_id": str(uid), "events": int(cnt), "last_event_time": str(last.get(uid,""))}
-            for uid, cnt in sorted(counts.items())]
-
-    out_dir = cfg.root/"curated"/"facts"/f"dt={dt}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir/"fact_user_activity_daily.parquet"
-    pq.write_table(pa.Table.from_pylist(rows, schema=FACT_SCHEMA), out_path, use_dictionary=False)
-
-    emit_edge(run_id, "curate", from_ref=str(clean_path), to_ref=str(out_path))
-    finish_run(run_id, "SUCCESS", output_ref=str(out_path), details=f"rows={len(rows)}")
-    return {"run_id": run_id, "curated_path": str(out_path), "rows": len(rows)}
+    with phase(run_id, "aggregate"):
+        agg = _aggregate_duckdb(todo) if engine == "duckdb" else _aggregate_arrow(todo)
+    if incremental:
+        with phase(run_id, "merge"):
+            existing = pa.concat_tables([pq.read_table(p, columns=["user_id", "events", "last_event_time"])
+                                         for p in existing_files])
+            agg = _merge_partials([existing, agg.cast(existing.schema)])
+    facts = pa.table({
+        "dt": pa.array([dt] * agg.num_rows, pa.string()),
+        "user_id": agg["user_id"],
+        "events": agg["events"],
+        "last_event_time": pc.fill_null(agg["last_event_time"], ""),
+    }, schema=FACT_SCHEMA)
+
+    with phase(run_id, "write"):
+        out_files = write_layout(facts, out_dir, FACTS_STEM, layout_policy("curated"))
+    with phase(run_id, "index"):
+        forget_files(sorted(set(existing_files) - set(out_files)))
+        index_files("curated", out_files)
+    count(run_id, rows_in=sum(pq.ParquetFile(p).metadata.num_rows for p in todo), rows_out=facts.num_rows,
+          bytes_read=sum(p.stat().st_size for p in todo), bytes_written=sum(p.stat().st_size for p in out_files))
+
+    emit_edges(run_id, "curate", [(p, o) for p in todo for o in out_files])
+    record_inputs("curate", dt, run_id, inputs)
+    finish_run(run_id, "SUCCESS", output_ref=str(out_dir),
+               details=f"rows={facts.num_rows},files={len(out_files)},engine={engine},"
+                       f"mode={'incremental' if incremental else 'full'}")
+    return {"run_id": run_id, "curated_path": str(out_dir), "curated_files": [str(p) for p in out_files],
+            "rows": facts.num_rows, "skipped": False}
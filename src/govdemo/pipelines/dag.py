@@ -0,0 +1,196 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+import json
+import re
+import time
+from ..common.acl import check_read
+from ..common.audit import AuditUnavailable, audit_session, start_run, finish_run
+from ..common.time import date_range, today_utc
+
+# stage -> (audit pipeline name, upstream stages)
+STAGES = {
+    "ingest": ("ingest", []),
+    "clean": ("clean", ["ingest"]),
+    "curate": ("curate", ["clean"]),
+    "serve": ("serve", ["curate"]),
+    "build-identity": ("build_identity", ["ingest"]),
+    "export-audience": ("export_audience", ["curate", "build-identity"]),
+}
+
+_DT = re.compile(r"dt=(\d{4}-\d{2}-\d{2})")
+
+@dataclass
+class StageRun:
+    stage: str
+    dt: str
+    status: str = "PENDING"  # PENDING | RUNNING | DONE | SKIPPED | FAILED | BLOCKED
+    started: float = 0.0
+    finished: float = 0.0
+    error: str = ""
+    deps: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return max(self.finished - self.started, 0.0)
+
+def _run_stage(stage: str, dt: str, options: dict) -> dict:
+    """Worker entry point: run one stage for one dt in a pool process."""
+    from .ingest import run_ingest
+    from .clean import run_clean
+    from .curate import run_curate
+    from .serve import run_serve
+    from .identity import run_build_identity
+    from .export import run_export_audience
+
+    if stage == "ingest":
+        return run_ingest(source=options.get("source", "app"), dt=dt, dedupe=options.get("dedupe", False))
+    if stage == "clean":
+        return run_clean(dt=dt)
+    if stage == "curate":
+        return run_curate(dt=dt)
+    if stage == "serve":
+        return run_serve(dt=dt)
+    if stage == "build-identity":
+        return run_build_identity(dt=dt)
+    if stage == "export-audience":
+        return run_export_audience(min_events=options.get("min_events", 1), dt=dt)
+    raise ValueError(f"Unknown stage '{stage}'")
+
+def _completed(dts: list[str]) -> dict[tuple[str, str], str]:
+    """Latest finished_at of SUCCESS/SKIPPED runs per (pipeline, dt), from audit_runs.
+
+    If the audit DB stays locked nothing counts as completed, so every stage runs.
+    """
+    try:
+        rows = audit_session().query(
+            "select pipeline, output_ref, max(finished_at) from audit_runs "
+            "where status in ('SUCCESS', 'SKIPPED') and pipeline in (select unnest(?)) group by 1, 2",
+            [[p for p, _ in STAGES.values()]],
+        )
+    except AuditUnavailable:
+        return {}
+    wanted = set(dts)
+    out: dict[tuple[str, str], str] = {}
+    for pipeline, output_ref, finished_at in rows:
+        m = _DT.search(output_ref or "")
+        if m and m.group(1) in wanted:
+            key = (pipeline, m.group(1))
+            out[key] = max(out.get(key, ""), finished_at or "")
+    return out
+
+def _with_upstream(stages: list[str]) -> list[str]:
+    out: list[str] = []
+    def visit(s: str) -> None:
+        if s not in STAGES:
+            raise ValueError(f"Unknown stage '{s}'. Expected one of: {', '.join(STAGES)}")
+        for dep in STAGES[s][1]:
+            visit(dep)
+        if s not in out:
+            out.append(s)
+    for s in stages:
+        visit(s)
+    return out
+
+def critical_path(runs: dict[tuple[str, str], StageRun]) -> tuple[float, list[StageRun]]:
+    """Longest chain of dependent stage runs by wall time."""
+    best: dict[tuple[str, str], tuple[float, tuple[str, str] | None]] = {}
+    def cost(key: tuple[str, str]) -> float:
+        if key not in best:
+            run = runs[key]
+            prev = max(((cost(d), d) for d in run.deps if d in runs), default=(0.0, None))
+            best[key] = (run.seconds + prev[0], prev[1])
+        return best[key][0]
+    if not runs:
+        return 0.0, []
+    end = max(runs, key=cost)
+    chain, key = [], end
+    while key is not None:
+        chain.append(runs[key])
+        key = best[key][1]
+    return best[end][0], list(reversed(chain))
+
+def run_dag(start: str | None = None, end: str | None = None, stages: list[str] | None = None,
+            workers: int = 2, force: bool = False, options: dict | None = None) -> dict:
+    """Run pipeline stages as a DAG over a dt range.
+
+    Independent stages (e.g. serve and build-identity) and independent dt
+    partitions run concurrently on a process pool of `workers`. A (stage, dt)
+    is skipped when audit_runs already has a SUCCESS/SKIPPED run for it that
+    finished after its upstream stages and none of them ran again here.
+    """
+    check_read("warehouse")
+    start = start or today_utc()
+    dts = date_range(start, end)
+    order = _with_upstream(stages or list(STAGES))
+    options = options or {}
+
+    runs: dict[tuple[str, str], StageRun] = {}
+    for dt in dts:
+        for s in order:
+            runs[(s, dt)] = StageRun(s, dt, deps=[(d, dt) for d in STAGES[s][1] if d in order])
+
+    done = {} if force else _completed(dts)
+    run_id = start_run("dag", input_ref=f"dt={start}..{dts[-1]} stages={','.join(order)}")
+
+    def skippable(run: StageRun) -> bool:
+        finished_at = done.get((STAGES[run.stage][0], run.dt))
+        if finished_at is None:
+            return False
+        for d in run.deps:
+            if runs[d].status != "SKIPPED" or done.get((STAGES[d[0]][0], d[1]), "") > finished_at:
+                return False
+        return True
+
+    def schedule(pool: ProcessPoolExecutor, running: dict) -> None:
+        progressed = True
+        while progressed:
+            progressed = False
+            for key, run in runs.items():
+                if run.status != "PENDING":
+                    continue
+                dep_status = {runs[d].status for d in run.deps}
+                if dep_status & {"FAILED", "BLOCKED"}:
+                    run.status = "BLOCKED"
+                elif dep_status <= {"DONE", "SKIPPED"}:
+                    run.started = time.monotonic()
+                    if skippable(run):
+                        run.status, run.finished = "SKIPPED", run.started
+                    else:
+                        run.status = "RUNNING"
+                        running[pool.submit(_run_stage, run.stage, run.dt, options)] = key
+                else:
+                    continue
+                progressed = True
+
+    t0 = time.monotonic()
+    running: dict = {}
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        schedule(pool, running)
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                run = runs[running.pop(fut)]
+                run.finished = time.monotonic()
+                try:
+                    fut.result()
+                    run.status = "DONE"
+                except Exception as e:
+                    run.status = "FAILED"
+                    run.error = f"{type(e).__name__}: {e}"
+            schedule(pool, running)
+    wall = time.monotonic() - t0
+
+    path_seconds, path = critical_path({k: r for k, r in runs.items() if r.status in ("DONE", "FAILED")})
+    counts = {s: sum(1 for r in runs.values() if r.status == s) for s in ("DONE", "SKIPPED", "FAILED", "BLOCKED")}
+    status = "FAILED" if counts["FAILED"] or counts["BLOCKED"] else "SUCCESS"
+    finish_run(run_id, status, output_ref=f"dt={start}..{dts[-1]}",
+               details=json.dumps({**counts, "wall_s": round(wall, 3), "critical_path_s": round(path_seconds, 3)}))
+    return {
+        "run_id": run_id,
+        "status": status,
+        "wall_s": wall,
+        "critical_path_s": path_seconds,
+        "critical_path": [(r.stage, r.dt, r.seconds) for r in path],
+        "runs": [(r.stage, r.dt, r.status, r.seconds, r.error) for r in runs.values()],
+        **{k.lower(): v for k, v in counts.items()},
+    }
@@ -1,27 +1,94 @@
-import csv
+from dataclasses import dataclass
 import json
+import re
 from pathlib import Path
 from uuid import uuid4
-import duckdb
-import pyarrow.parquet as pq
-import pyarrow as pa
+import yaml
 
 from ..common.acl import check_read, check_write, current_role
 from ..common.config import load_env_config
-from ..common.audit import start_run, finish_run, init_audit
-from ..common.lineage import emit_edge
-from ..common.time import today_utc, now_iso
+from ..common.engine import compute_connection
+from ..common.audit import audit_session, start_run, finish_run
+from ..common.evidence import EvidenceWriter
+from ..common.lineage import emit_edges
+from ..common.metrics import count, phase
+from ..common.time import date_range, today_utc, now_iso
+from .curate import curated_dir, curated_files
+from .identity import identity_dir, identity_files
+from .windows import window_dir, window_files
 
-def run_export_audience(min_events: int = 1, dt: str | None = None) -> dict:
+FORMATS = ("csv", "parquet")
+
+SEGMENT_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+@dataclass(frozen=True)
+class ExportSegment:
+    name: str
+    min_events: int = 1
+    window: int | None = None  # count events over this many days (rolling window) instead of one dt
+
+def load_segments(path: str | Path) -> list[ExportSegment]:
+    """Read a segment spec: `segments: [{name: engaged, min_events: 5, window: 30}, ...]`."""
+    data = yaml.safe_load(Path(path).read_text(encoding="utf-8")) or {}
+    return [ExportSegment(name=str(s["name"]), min_events=int(s.get("min_events", 1)),
+                          window=int(s["window"]) if s.get("window") else None)
+            for s in data.get("segments", [])]
+
+def _facts(root: Path, dt: str, window: int | None) -> tuple[list[Path], Path]:
+    """Audience source for `dt`: daily facts, or the `window`-day rolling window ending at dt."""
+    if window:
+        return window_files(root, window, dt), window_dir(root, window, dt)
+    return curated_files(root, dt), curated_dir(root, dt)
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def _copy_options(fmt: str) -> str:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Expected one of: {', '.join(FORMATS)}")
+    return "format csv, header" if fmt == "csv" else "format parquet"
+
+def _record_export(evidence: EvidenceWriter, run_id: str, dt: str, min_events: int, out_path: Path, rows: int,
+                   extra: dict | None = None) -> str:
+    """Queue the evidence record and buffer the activation_exports row for one output file."""
+    export_id = str(uuid4())
+    evidence.submit(export_id, {
+        "export_id": export_id,
+        "run_id": run_id,
+        "requested_by_role": current_role(),
+        "dt": dt,
+        "min_events": int(min_events),
+        "rows": rows,
+        "output_path": str(out_path),
+        "created_at": now_iso(),
+        **(extra or {}),
+        "notes": "Activation export joins curated audience with restricted identity (PII).",
+    })
+    audit_session().execute(
+        "insert into activation_exports values (?, ?, ?, ?, ?, ?, ?)",
+        [export_id, current_role(), dt, int(min_events), str(out_path), now_iso(), rows],
+    )
+    return export_id
+
+def run_export_audience(min_events: int = 1, dt: str | None = None, fmt: str = "csv",
+                        window: int | None = None, evidence_log: bool = False) -> dict:
     """Controlled export that resolves PII for operational needs.
 
     Reads:
       - curated facts (audience definition)
       - restricted identity (PII resolution)
     Writes:
-      - exports/audience/*.csv
-      - audit row + evidence json
+      - exports/audience/*.csv (or .parquet)
+      - audit row + evidence json (or a record in the evidence log with `evidence_log`)
+
+    The join runs in DuckDB: the `events >= min_events` filter is pushed into
+    the facts scan, identity is only probed for matching users, and rows
+    stream straight into the output file, spilling to disk if needed.
+
+    With `window`, `min_events` applies to events over the N-day rolling
+    window ending at dt (`govdemo curate --window N`) instead of dt alone.
     """
+    options = _copy_options(fmt)
     check_read("curated")
     check_read("restricted_pii")
     check_write("exports")
@@ -30,65 +97,164 @@ def run_export_audience(min_events: int = 1, dt: str | None = None) -> dict:
     cfg = load_env_config()
     dt = dt or today_utc()
 
-    curated_path = cfg.root/"curated"/"facts"/f"dt={dt}"/"fact_user_activity_daily.parquet"
-    identity_path = cfg.root/"restricted_pii"/"identity"/f"dt={dt}"/"identity.parquet"
-    if not curated_path.exists():
-        raise FileNotFoundError(f"Missing curated fact: {curated_path}. Run `govdemo curate` first.")
-    if not identity_path.exists():
-        raise FileNotFoundError(f"Missing identity table: {identity_path}. Run `govdemo build-identity` first.")
+    facts, facts_dir = _facts(cfg.root, dt, window)
+    identity = identity_files(cfg.root, dt)
+    if not facts:
+        hint = f"govdemo curate --window {window}" if window else "govdemo curate"
+        raise FileNotFoundError(f"Missing curated facts in: {facts_dir}. Run `{hint}` first.")
+    if not identity:
+        raise FileNotFoundError(f"Missing identity table in: {identity_dir(cfg.root, dt)}. Run `govdemo build-identity` first.")
 
-    export_id = str(uuid4())
-    run_id = start_run("export_audience", input_ref=f"{curated_path} + {identity_path}")
+    run_id = start_run("export_audience", input_ref=f"{facts_dir} + {identity_dir(cfg.root, dt)}")
 
-    facts = pq.ParquetFile(curated_path).read()
-    ids = pq.ParquetFile(identity_path).read()
+    out_dir = cfg.root/"exports"/"audience"
+    if window:
+        out_dir = out_dir/f"window={window}d"
+    out_dir = out_dir/f"dt={dt}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir/f"audience.{fmt}"
 
-    # Build identity map (small demo scale)
-    id_map = {u: e for u, e in zip(ids["user_id"].to_pylist(), ids["email"].to_pylist())}
+    con = compute_connection()
+    try:
+        with phase(run_id, "join_write"):
+            rows = con.execute(
+                f"""
+                copy (
+                  select ? as dt, ?::integer as min_events, f.user_id, i.email
+                  from read_parquet(?) f
+                  left join read_parquet(?) i using (user_id)
+                  where f.events >= ?
+                  order by f.user_id
+                ) to {_sql_literal(str(out_path))} ({options})
+                """,
+                [dt, int(min_events), [str(p) for p in facts], [str(p) for p in identity], int(min_events)],
+            ).fetchone()[0]
+    finally:
+        con.close()
+    count(run_id, "join_write", rows_out=rows, bytes_read=sum(p.stat().st_size for p in facts + identity),
+          bytes_written=out_path.stat().st_size)
 
-    # Filter audience by min_events
-    rows = []
-    for uid, ev in zip(facts["user_id"].to_pylist(), facts["events"].to_pylist()):
-        if int(ev) >= int(min_events):
-            email = id_map.get(uid, "")
-            rows.append({"user_id": uid, "email": email, "min_events": int(min_events), "dt": dt})
+    with EvidenceWriter(cfg.export_evidence_dir, "export", run_id, log=evidence_log) as evidence:
+        export_id = _record_export(evidence, run_id, dt, min_events, out_path, rows,
+                                   extra={"window_days": window} if window else None)
+        emit_edges(run_id, "export_audience", [(p, out_path) for p in facts + identity])
+        refs = evidence.barrier()
+    finish_run(run_id, "SUCCESS", output_ref=str(out_path), details=f"rows={rows}")
 
-    out_dir = cfg.root/"exports"/"audience"/f"dt={dt}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir/"audience.csv"
-
-    with out_path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["dt","min_events","user_id","email"])
-        w.writeheader()
-        for r in rows:
-            w.writerow({"dt": r["dt"], "min_events": r["min_events"], "user_id": r["user_id"], "email": r["email"]})
-
-    # evidence
-    cfg.export_evidence_dir.mkdir(parents=True, exist_ok=True)
-    evidence_path = cfg.export_evidence_dir/f"{export_id}.json"
-    evidence = {
-        "export_id": export_id,
-        "run_id": run_id,
-        "requested_by_role": current_role(),
-        "dt": dt,
-        "min_events": int(min_events),
-        "rows": len(rows),
-        "output_path": str(out_path),
-        "created_at": now_iso(),
-        "notes": "Activation export joins curated audience with restricted identity (PII).",
-    }
-    evidence_path.write_text(json.dumps(evidence, indent=2), encoding="utf-8")
+    return {"export_id": export_id, "run_id": run_id, "output_path": str(out_path), "rows": rows, "evidence": refs[export_id]}
 
-    # store export in audit db
-    init_audit()
-    con = duckdb.connect(str(cfg.duckdb_path))
-    con.execute(
-        "insert into activation_exports values (?, ?, ?, ?, ?, ?, ?)",
-        [export_id, current_role(), dt, int(min_events), str(out_path), now_iso(), len(rows)],
-    )
-    con.close()
+def run_export_segments(segments: list[ExportSegment], start: str | None = None, end: str | None = None,
+                        fmt: str = "csv", evidence_log: bool = False) -> dict:
+    """Export many audience segments over a dt range in one pass over facts and identity.
+
+    Facts for every dt in [start, end] are joined to the identity of the same
+    dt once, keeping only users that reach the lowest threshold; each segment
+    is then written from that shared result to
+    exports/audience/segments/<name>/<start>_<end>/audience.<fmt>.
+    Segments with a `window` read that rolling window's state per dt instead
+    of daily facts, one shared join per window length.
+    Every segment gets its own activation_exports row and evidence record,
+    written in the background while the next segment is exported.
+    Days without facts or identity are skipped and listed per segment in the
+    result; a segment with no such day at all is reported as skipped and
+    writes nothing.
+    """
+    options = _copy_options(fmt)
+    if not segments:
+        raise ValueError("No segments to export.")
+    names = [s.name for s in segments]
+    bad = [n for n in names if not SEGMENT_NAME.match(n)]
+    if bad:
+        raise ValueError(f"Invalid segment name(s): {', '.join(bad)}. Use letters, digits, '_' or '-'.")
+    if len(set(names)) != len(names):
+        raise ValueError("Segment names must be unique.")
+
+    check_read("curated")
+    check_read("restricted_pii")
+    check_write("exports")
+    check_write("warehouse")
+
+    cfg = load_env_config()
+    start = start or today_utc()
+    dts = date_range(start, end)
+    end = dts[-1]
+
+    by_window: dict[int | None, list[ExportSegment]] = {}
+    for seg in segments:
+        by_window.setdefault(seg.window, []).append(seg)
+    sources: dict[int | None, tuple[list[str], list[str], list[str]]] = {}
+    for window in by_window:
+        facts, identity, missing = [], [], []
+        for dt in dts:
+            dt_facts, dt_identity = _facts(cfg.root, dt, window)[0], identity_files(cfg.root, dt)
+            if dt_facts and dt_identity:
+                facts += [str(p) for p in dt_facts]
+                identity += [str(p) for p in dt_identity]
+            else:
+                missing.append(dt)
+        sources[window] = facts, identity, missing
+    if not any(facts for facts, _, _ in sources.values()):
+        raise FileNotFoundError(f"No dt in {start}..{end} has both curated facts and identity. "
+                                "Run `govdemo curate` and `govdemo build-identity` first.")
+
+    dt_ref = start if start == end else f"{start}..{end}"
+    run_id = start_run("export_segments", input_ref=f"curated+identity dt={dt_ref}")
 
-    emit_edge(run_id, "export_audience", from_ref=f"{curated_path} + {identity_path}", to_ref=str(out_path))
-    finish_run(run_id, "SUCCESS", output_ref=str(out_path), details=f"rows={len(rows)}")
+    results = []
+    con = compute_connection()
+    evidence = EvidenceWriter(cfg.export_evidence_dir, "export", run_id, log=evidence_log)
+    try:
+        for window, group in by_window.items():
+            facts, identity, missing = sources[window]
+            if not facts:
+                results += [{"segment": seg.name, "skipped": True, "missing_dts": missing} for seg in group]
+                continue
+            with phase(run_id, "join"):
+                con.execute(
+                    """
+                    create or replace temp table audience as
+                    select f.dt, f.user_id, f.events, i.email
+                    from read_parquet(?, hive_partitioning = false) f
+                    left join read_parquet(?, hive_partitioning = false) i using (dt, user_id)
+                    where f.events >= ?
+                    """,
+                    [facts, identity, min(s.min_events for s in group)],
+                )
+            count(run_id, "join", rows_in=con.execute("select count(*) from audience").fetchone()[0],
+                  bytes_read=sum(Path(p).stat().st_size for p in facts + identity))
+            for seg in group:
+                out_dir = cfg.root/"exports"/"audience"/"segments"/seg.name/f"{start}_{end}"
+                out_dir.mkdir(parents=True, exist_ok=True)
+                out_path = out_dir/f"audience.{fmt}"
+                with phase(run_id, "write"):
+                    rows = con.execute(
+                        f"""
+                        copy (
+                          select dt, ?::integer as min_events, user_id, email
+                          from audience where events >= ?
+                          order by dt, user_id
+                        ) to {_sql_literal(str(out_path))} ({options})
+                        """,
+                        [seg.min_events, seg.min_events],
+                    ).fetchone()[0]
+                count(run_id, "write", rows_out=rows, bytes_written=out_path.stat().st_size)
+                extra = {"segment": seg.name, "missing_dts": missing}
+                if window:
+                    extra["window_days"] = window
+                export_id = _record_export(evidence, run_id, dt_ref, seg.min_events, out_path, rows, extra=extra)
+                emit_edges(run_id, "export_segments", [(p, out_path) for p in facts + identity])
+                results.append({"segment": seg.name, "skipped": False, "missing_dts": missing,
+                                "export_id": export_id, "output_path": str(out_path), "rows": rows})
+        refs = evidence.barrier()
+    finally:
+        con.close()
+        evidence.close()
+    for r in results:
+        if not r["skipped"]:
+            r["evidence"] = refs[r["export_id"]]
 
-    return {"export_id": export_id, "run_id": run_id, "output_path": str(out_path), "rows": len(rows), "evidence": str(evidence_path)}
+    skipped = [r["segment"] for r in results if r["skipped"]]
+    finish_run(run_id, "SUCCESS", output_ref=str(cfg.root/"exports"/"audience"/"segments"),
+               details=json.dumps({"dt": dt_ref, "segments": len(results) - len(skipped), "skipped": skipped,
+                                   "missing_dts": {r["segment"]: r["missing_dts"] for r in results if r["missing_dts"]}}))
+    return {"run_id": run_id, "dt": dt_ref, "segments": results, "skipped": skipped}
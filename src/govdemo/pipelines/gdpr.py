@@ -1,17 +1,22 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Iterable
 from pathlib import Path
 from uuid import uuid4
 from datetime import datetime
 import json
-import duckdb
+import os
 import pyarrow.parquet as pq
 import pyarrow as pa
 import pyarrow.compute as pc
 
 from ..common.config import load_env_config
 from ..common.acl import check_write
-from ..common.audit import init_audit, start_run, finish_run
-from ..common.lineage import emit_edge
+from ..common.audit import audit_session, start_run, finish_run
+from ..common.evidence import EvidenceWriter
+from ..common.layout import LayoutPolicy, layout_policy, open_writer
+from ..common.lineage import emit_edges
+from ..common.locator import UserLocator, index_files
+from ..common.metrics import phase
 
 @dataclass(frozen=True)
 class GDPRResult:
@@ -25,86 +30,177 @@ class GDPRResult:
     identity_files: int
     evidence_path: str
 
-def _rewrite_parquet_excluding_user(path: Path, user_id: str) -> bool:
-    if not path.exists():
-        return False
-    table = pq.ParquetFile(path).read()
-    if "user_id" not in table.column_names:
-        return False
-    before = table.num_rows
-    mask = pc.not_equal(table["user_id"], pa.scalar(user_id))
-    table2 = table.filter(mask)
-    if table2.num_rows == before:
-        return False
-    pq.write_table(table2, path, use_dictionary=False)
-    return True
-
-def request_delete(user_id: str, mode: str = "delete", dt: str | None = None) -> GDPRResult:
+def _dictionary_columns(pf: pq.ParquetFile) -> list[str]:
+    if pf.num_row_groups == 0:
+        return []
+    rg = pf.metadata.row_group(0)
+    return [rg.column(i).path_in_schema for i in range(rg.num_columns)
+            if any("DICTIONARY" in e for e in rg.column(i).encodings)]
+
+# parquet metadata codec name -> pyarrow writer codec
+_CODECS = {"UNCOMPRESSED": "none", "SNAPPY": "snappy", "GZIP": "gzip", "BROTLI": "brotli",
+           "LZ4": "lz4", "LZ4_RAW": "lz4", "ZSTD": "zstd"}
+
+def _writer_codec(pf: pq.ParquetFile, default: str) -> str:
+    if pf.num_row_groups == 0 or pf.metadata.num_columns == 0:
+        return default
+    return _CODECS.get(pf.metadata.row_group(0).column(0).compression.upper(), default)
+
+def _rewrite_parquet_excluding_users(path: Path, user_ids: set[str], row_groups: list[int],
+                                     policy: LayoutPolicy | None = None) -> set[str]:
+    """Drop `user_ids` from the candidate `row_groups` of `path`, leaving the rest as-is.
+
+    Only candidate row groups are filtered; the file is rewritten to a temp file
+    and swapped in with os.replace so readers never see a partial file. The
+    file keeps its codec and dictionary columns, plus the layer's `policy`
+    (statistics, page index, bloom filters, sort order).
+    Returns the user_ids that were actually removed.
+    """
+    if not row_groups:
+        return set()
+    pf = pq.ParquetFile(path)
+    value_set = pa.array(sorted(user_ids), pa.string())
+    filtered = {}
+    removed: set[str] = set()
+    for rg in row_groups:
+        t = pf.read_row_group(rg)
+        hit = pc.fill_null(pc.is_in(t["user_id"], value_set=value_set), False)
+        if pc.any(hit).as_py():
+            removed.update(pc.unique(t["user_id"].filter(hit)).to_pylist())
+            filtered[rg] = t.filter(pc.invert(hit))
+    if not filtered:
+        return set()
+    tmp = path.with_name(f".{path.name}.tmp")
+    policy = policy or LayoutPolicy(sort_by=(), bloom_filter=())
+    policy = replace(policy, compression=_writer_codec(pf, policy.compression),
+                     dictionary=tuple(_dictionary_columns(pf)))
+    with open_writer(tmp, pf.schema_arrow, policy, expected_rows=pf.metadata.num_rows) as w:
+        for rg in range(pf.num_row_groups):
+            t = filtered.get(rg)
+            if t is None:
+                t = pf.read_row_group(rg)
+            if t.num_rows:
+                w.write_table(t, row_group_size=max(t.num_rows, 1))
+    os.replace(tmp, path)
+    return removed
+
+LAYER_FILES = {
+    "clean": ("clean_files", "clean/events", "part-*.parquet"),
+    "curated": ("curated_files", "curated/facts", "fact_user_activity_daily*.parquet"),
+    "serving": ("serving_files", "serving/user_metrics", "user_metrics*.parquet"),
+    "restricted_pii": ("identity_files", "restricted_pii/identity", "identity*.parquet"),
+    # rolling windows (pipelines.windows) count towards their layer's files
+    "curated_windows": ("curated_files", "curated/windows/window=*", "user_activity_window*.parquet"),
+    "serving_windows": ("serving_files", "serving/user_activity_window/window=*", "user_activity_window*.parquet"),
+}
+
+def _erase(root: Path, user_ids: set[str], dt: str | None) -> tuple[dict[str, dict[str, int]], dict[str, int]]:
+    """One pass over every layer for the whole set of users.
+
+    Returns per-user counts of the files each user was removed from, and the
+    number of files rewritten per layer.
+    """
+    locator = UserLocator(user_ids)
+    changed = {u: {key: 0 for key, _, _ in LAYER_FILES.values()} for u in user_ids}
+    rewritten_files = {}
+    for layer, (key, prefix, name) in LAYER_FILES.items():
+        files = sorted(root.glob(f"{prefix}/dt={dt or '*'}/{name}"))
+        policy = layout_policy(layer)
+        rewritten = []
+        for p in files:
+            removed = _rewrite_parquet_excluding_users(p, user_ids, locator.row_groups(p), policy)
+            if removed:
+                rewritten.append(p)
+            for u in removed:
+                changed[u][key] += 1
+        index_files(layer, rewritten)
+        rewritten_files[key] = rewritten_files.get(key, 0) + len(rewritten)
+    return changed, rewritten_files
+
+def request_delete(user_id: str, mode: str = "delete", dt: str | None = None,
+                   evidence_log: bool = False) -> GDPRResult:
+    if not user_id:
+        raise ValueError("user_id is required")
+    return request_delete_batch([user_id], mode=mode, dt=dt, evidence_log=evidence_log)[0]
+
+def request_delete_batch(user_ids: Iterable[str], mode: str = "delete", dt: str | None = None,
+                         evidence_log: bool = False) -> list[GDPRResult]:
+    """Fulfil many erasure requests with a single rewrite of each affected file.
+
+    Every user still gets its own gdpr_requests row and evidence record; the
+    rewrite itself is one `gdpr_delete` run. Evidence is written concurrently
+    (see EvidenceWriter), to one file per request or, with `evidence_log`, to
+    the shared compressed evidence log.
+    """
     check_write("warehouse")
     check_write("clean")
     check_write("curated")
     check_write("serving")
     check_write("restricted_pii")
 
+    users = list(dict.fromkeys(u for u in user_ids if u))
+    if not users:
+        return []
+
     cfg = load_env_config()
-    init_audit()
+    session = audit_session()
 
-    request_id = str(uuid4())
-    con = duckdb.connect(str(cfg.duckdb_path))
-    con.execute(
-        "insert into gdpr_requests values (?, ?, ?, ?, ?, ?)",
-        [request_id, user_id, mode, datetime.utcnow().isoformat()+"Z", "RECEIVED", ""],
-    )
-    con.close()
-
-    run_id = start_run("gdpr_delete", input_ref=f"user_id={user_id}")
-
-    clean_files = sorted((cfg.root/"clean"/"events").glob("dt=*/part-00001.parquet")) if dt is None else [cfg.root/"clean"/"events"/f"dt={dt}"/"part-00001.parquet"]
-    curated_files = sorted((cfg.root/"curated"/"facts").glob("dt=*/fact_user_activity_daily.parquet")) if dt is None else [cfg.root/"curated"/"facts"/f"dt={dt}"/"fact_user_activity_daily.parquet"]
-    serving_files = sorted((cfg.root/"serving"/"user_metrics").glob("dt=*/user_metrics.parquet")) if dt is None else [cfg.root/"serving"/"user_metrics"/f"dt={dt}"/"user_metrics.parquet"]
-    identity_files = sorted((cfg.root/"restricted_pii"/"identity").glob("dt=*/identity.parquet")) if dt is None else [cfg.root/"restricted_pii"/"identity"/f"dt={dt}"/"identity.parquet"]
-
-    changed_clean = sum(1 for p in clean_files if _rewrite_parquet_excluding_user(p, user_id))
-    changed_curated = sum(1 for p in curated_files if _rewrite_parquet_excluding_user(p, user_id))
-    changed_serving = sum(1 for p in serving_files if _rewrite_parquet_excluding_user(p, user_id))
-    changed_identity = sum(1 for p in identity_files if _rewrite_parquet_excluding_user(p, user_id))
-
-    cfg.gdpr_evidence_dir.mkdir(parents=True, exist_ok=True)
-    evidence_path = cfg.gdpr_evidence_dir / f"{request_id}.json"
-    evidence = {
-        "request_id": request_id,
-        "run_id": run_id,
-        "user_id": user_id,
-        "mode": mode,
-        "changed": {
-            "clean_files": changed_clean,
-            "curated_files": changed_curated,
-            "serving_files": changed_serving,
-            "identity_files": changed_identity,
-        },
-        "at": datetime.utcnow().isoformat()+"Z",
-        "notes": "Raw is immutable; deletes propagate to clean/curated/serving/restricted_pii.",
-    }
-    evidence_path.write_text(json.dumps(evidence, indent=2), encoding="utf-8")
-
-    emit_edge(run_id, "gdpr_delete", from_ref=f"user_id={user_id}", to_ref=str(evidence_path))
-    finish_run(run_id, "SUCCESS", output_ref=str(evidence_path), details=json.dumps(evidence["changed"]))
-
-    con = duckdb.connect(str(cfg.duckdb_path))
-    con.execute(
-        "update gdpr_requests set status=?, details=? where request_id=?",
-        ["FULFILLED", json.dumps(evidence["changed"]), request_id],
-    )
-    con.close()
+    request_ids = {u: str(uuid4()) for u in users}
+    received_at = datetime.utcnow().isoformat()+"Z"
+    session.execute("insert into gdpr_requests select * from received", tables={"received": pa.table({
+        "request_id": [request_ids[u] for u in users],
+        "user_id": users,
+        "mode": [mode] * len(users),
+        "requested_at": [received_at] * len(users),
+        "status": ["RECEIVED"] * len(users),
+        "details": [""] * len(users),
+    })})
+
+    input_ref = f"user_id={users[0]}" if len(users) == 1 else f"user_ids={len(users)}"
+    run_id = start_run("gdpr_delete", input_ref=input_ref)
 
-    return GDPRResult(
-        request_id=request_id,
+    with phase(run_id, "erase"):
+        changed, rewritten_files = _erase(cfg.root, set(users), dt)
+
+    at = datetime.utcnow().isoformat()+"Z"
+    with EvidenceWriter(cfg.gdpr_evidence_dir, "gdpr", run_id, log=evidence_log) as evidence:
+        with phase(run_id, "evidence"):
+            for u in users:
+                evidence.submit(request_ids[u], {
+                    "request_id": request_ids[u],
+                    "run_id": run_id,
+                    "user_id": u,
+                    "mode": mode,
+                    "changed": changed[u],
+                    "at": at,
+                    "notes": "Raw is immutable; deletes propagate to clean/curated/serving/restricted_pii.",
+                })
+            # audit rows below are only buffered; success is reported once the evidence is durable
+            refs = evidence.barrier()
+
+    results = [GDPRResult(
+        request_id=request_ids[u],
         run_id=run_id,
-        user_id=user_id,
+        user_id=u,
         mode=mode,
-        cleaned_files=changed_clean,
-        curated_files=changed_curated,
-        serving_files=changed_serving,
-        identity_files=changed_identity,
-        evidence_path=str(evidence_path),
+        cleaned_files=changed[u]["clean_files"],
+        curated_files=changed[u]["curated_files"],
+        serving_files=changed[u]["serving_files"],
+        identity_files=changed[u]["identity_files"],
+        evidence_path=refs[request_ids[u]],
+    ) for u in users]
+
+    emit_edges(run_id, "gdpr_delete", [(f"user_id={r.user_id}", r.evidence_path) for r in results])
+    session.execute(
+        "update gdpr_requests set status='FULFILLED', details=f.details "
+        "from fulfilled f where gdpr_requests.request_id = f.request_id",
+        tables={"fulfilled": pa.table({
+            "request_id": [request_ids[u] for u in users],
+            "details": [json.dumps(changed[u]) for u in users],
+        })},
     )
+    output_ref = results[0].evidence_path if len(results) == 1 else str(cfg.gdpr_evidence_dir)
+    # one audit transaction for the run row, request statuses, lineage and evidence index
+    finish_run(run_id, "SUCCESS", output_ref=output_ref, details=json.dumps({"users": len(users), **rewritten_files}))
+
+    return results
@@ -1,11 +1,15 @@
 import json
+from pathlib import Path
 import pyarrow as pa
-import pyarrow.parquet as pq
 from ..common.acl import check_read, check_write
 from ..common.config import load_env_config
 from ..common.audit import start_run, finish_run
-from ..common.lineage import emit_edge
+from ..common.lineage import emit_edges
+from ..common.layout import layer_files, layout_policy, write_layout
+from ..common.locator import forget_files, index_files
+from ..common.metrics import count, phase
 from ..common.time import today_utc
+from .ingest import raw_parts
 
 IDENTITY_SCHEMA = pa.schema([
     ("dt", pa.string()),
@@ -13,6 +17,15 @@ IDENTITY_SCHEMA = pa.schema([
     ("email", pa.string()),
 ])
 
+IDENTITY_STEM = "identity"
+
+def identity_dir(root: Path, dt: str) -> Path:
+    return root/"restricted_pii"/"identity"/f"dt={dt}"
+
+def identity_files(root: Path, dt: str) -> list[Path]:
+    """Identity files of `dt` (one, or one per bucket under the restricted_pii layout)."""
+    return layer_files(identity_dir(root, dt), IDENTITY_STEM)
+
 def run_build_identity(dt: str | None = None) -> dict:
     """Build a restricted identity table from raw (PII zone).
 
@@ -26,28 +39,40 @@ def run_build_identity(dt: str | None = None) -> dict:
 
     cfg = load_env_config()
     dt = dt or today_utc()
-    raw_path = cfg.root/"raw"/"events"/f"dt={dt}"/"source=app"/"part-00001.jsonl"
-    if not raw_path.exists():
-        raise FileNotFoundError(f"Missing raw file: {raw_path}. Run `govdemo ingest` first.")
+    raw_dir = cfg.root/"raw"/"events"/f"dt={dt}"
+    parts = raw_parts(cfg.root, dt)
+    if not parts:
+        raise FileNotFoundError(f"Missing raw files in: {raw_dir}. Run `govdemo ingest` first.")
 
-    run_id = start_run("build_identity", input_ref=str(raw_path))
+    run_id = start_run("build_identity", input_ref=str(raw_dir))
 
     latest_email = {}
-    with raw_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            r = json.loads(line)
-            uid = str(r.get("user_id"))
-            email = str(r.get("email",""))
-            if uid and email:
-                latest_email[uid] = email
+    rows_in = 0
+    with phase(run_id, "read"):
+        for raw_path in parts:
+            with raw_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    rows_in += 1
+                    r = json.loads(line)
+                    uid = str(r.get("user_id"))
+                    email = str(r.get("email",""))
+                    if uid and email:
+                        latest_email[uid] = email
 
     rows = [{"dt": dt, "user_id": uid, "email": email} for uid, email in sorted(latest_email.items())]
 
-    out_dir = cfg.root/"restricted_pii"/"identity"/f"dt={dt}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir/"identity.parquet"
-    pq.write_table(pa.Table.from_pylist(rows, schema=IDENTITY_SCHEMA), out_path, use_dictionary=False)
+    out_dir = identity_dir(cfg.root, dt)
+    existing = identity_files(cfg.root, dt)
+    with phase(run_id, "write"):
+        out_files = write_layout(pa.Table.from_pylist(rows, schema=IDENTITY_SCHEMA), out_dir, IDENTITY_STEM,
+                                 layout_policy("restricted_pii"))
+    with phase(run_id, "index"):
+        forget_files(sorted(set(existing) - set(out_files)))
+        index_files("restricted_pii", out_files)
+    count(run_id, rows_in=rows_in, rows_out=len(rows),
+          bytes_read=sum(p.stat().st_size for p in parts), bytes_written=sum(p.stat().st_size for p in out_files))
 
-    emit_edge(run_id, "build_identity", from_ref=str(raw_path), to_ref=str(out_path))
-    finish_run(run_id, "SUCCESS", output_ref=str(out_path), details=f"rows={len(rows)}")
-    return {"run_id": run_id, "identity_path": str(out_path), "rows": len(rows)}
+    emit_edges(run_id, "build_identity", [(p, o) for p in parts for o in out_files])
+    finish_run(run_id, "SUCCESS", output_ref=str(out_dir), details=f"rows={len(rows)},files={len(out_files)}")
+    return {"run_id": run_id, "identity_path": str(out_dir), "identity_files": [str(p) for p in out_files],
+            "rows": len(rows)}
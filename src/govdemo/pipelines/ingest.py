@@ -1,14 +1,208 @@
+import hashlib
 import json
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from ..common.acl import check_read, check_write
 from ..common.config import load_env_config
+from ..common.eventindex import EventIndex
 from ..common.audit import start_run, finish_run
-from ..common.lineage import emit_edge
+from ..common.lineage import emit_edges
+from ..common.metrics import count, phase
+from ..common.jsonl import CHUNK_BYTES, PART_BYTES, RollingPartWriter, iter_line_chunks, read_columns, split_ranges
 from ..common.time import today_utc, now_iso
+from ..common.watermark import fingerprint
 
 REQUIRED = ["event_id", "user_id", "event_time"]
+IDS_SCHEMA = pa.schema([("pos", pa.int64()), ("event_id", pa.string())])
 
-def run_ingest(source: str = "app", dt: str | None = None) -> dict:
+def raw_parts(root: Path, dt: str, source: str | None = None) -> list[Path]:
+    """Raw JSONL parts for `dt`, across every source unless one is given."""
+    return sorted((root/"raw"/"events"/f"dt={dt}").glob(f"source={source or '*'}/part-*.jsonl"))
+
+def raw_fingerprint(parts: list[Path]) -> str:
+    """One fingerprint for the parts of a raw partition."""
+    return hashlib.sha1("\n".join(f"{p.name}={fingerprint(p)}" for p in parts).encode("utf-8")).hexdigest()
+
+def landing_files(root: Path) -> list[Path]:
+    return sorted((root/"landing").glob("events*.jsonl"))
+
+def _clear_parts(d: Path, keep_published: bool = False) -> None:
+    for p in [*([] if keep_published else d.glob("part-*.jsonl")), *d.glob(".w*-*")]:
+        p.unlink()
+
+def _next_part(d: Path) -> int:
+    return max((int(p.stem[len("part-"):]) for p in d.glob("part-*.jsonl")), default=0) + 1
+
+def _ingest_range(landing_file: str, start: int, end: int, source: str, raw_dir: str, q_dir: str,
+                  prefix: str, chunk_bytes: int, part_bytes: int, ids_path: str | None = None) -> dict:
+    """Validate and stamp one byte range of a landing file. Runs inside pool workers.
+
+    With `ids_path`, the event_id of every good record is also written there
+    (Arrow IPC, with its position among the range's good records) for dedupe.
+    """
+    landing = Path(landing_file)
+    stamp_tail = (f', "_source": {json.dumps(source)}, "_raw_file": {json.dumps(landing_file)}}}\n').encode("utf-8")
+    good = bad = 0
+    with RollingPartWriter(Path(raw_dir), part_bytes, prefix=prefix) as fgood, \
+         RollingPartWriter(Path(q_dir), part_bytes, prefix=prefix) as fbad, \
+         (pa.ipc.new_file(ids_path, IDS_SCHEMA) if ids_path else nullcontext()) as fids:
+        for lines in iter_line_chunks(landing, chunk_bytes, start, end):
+            cols = read_columns(lines, REQUIRED)
+            ok = None
+            for k in REQUIRED:
+                present = pc.fill_null(pc.not_equal(cols[k], ""), False)
+                ok = present if ok is None else pc.and_(ok, present)
+            stamp = f', "_ingested_at": "{now_iso()}"'.encode("utf-8") + stamp_tail
+            out, rejected = [], []
+            for line, keep in zip(lines, ok.to_pylist()):
+                if keep:
+                    out.append(line.rstrip()[:-1] + stamp)
+                else:
+                    rejected.append(line if line.endswith(b"\n") else line + b"\n")
+            if out:
+                fgood.write(b"".join(out))
+                if fids is not None:
+                    fids.write_batch(pa.record_batch([pa.array(range(good, good + len(out)), pa.int64()),
+                                                      cols["event_id"].filter(ok).combine_chunks()], schema=IDS_SCHEMA))
+            if rejected:
+                fbad.write(b"".join(rejected))
+            good += len(out)
+            bad += len(rejected)
+    return {"landing_file": landing_file, "good": good, "bad": bad,
+            "parts": [str(p) for p in fgood.parts], "q_parts": [str(p) for p in fbad.parts]}
+
+def _drop_duplicates(parts: list[str], dups_file: str, dup_dir: str, prefix: str, part_bytes: int) -> dict:
+    """Move the records at the positions in `dups_file` out of a task's parts. Runs inside pool workers."""
+    positions = chain.from_iterable(b.column(0).to_pylist() for b in pq.ParquetFile(dups_file).iter_batches())
+    next_dup = next(positions, None)
+    pos, kept = 0, []
+    with RollingPartWriter(Path(dup_dir), part_bytes, prefix=prefix) as fdup:
+        for part in map(Path, parts):
+            tmp = part.with_name(part.name + ".dedupe")
+            keep = 0
+            with part.open("rb") as src, tmp.open("wb") as dst:
+                for line in src:
+                    if pos == next_dup:
+                        fdup.write(line)
+                        next_dup = next(positions, None)
+                    else:
+                        dst.write(line)
+                        keep += 1
+                    pos += 1
+            if keep:
+                os.replace(tmp, part)
+                kept.append(str(part))
+            else:
+                tmp.unlink()
+                part.unlink()
+    Path(dups_file).unlink()
+    return {"parts": kept, "dup_parts": [str(p) for p in fdup.parts]}
+
+def _publish(tmp_parts: list[str], first: int = 1) -> list[Path]:
+    """Rename worker-local parts to a single part-NNNNN sequence from `first`, in task order."""
+    out = []
+    for i, tmp in enumerate(tmp_parts, start=first):
+        src = Path(tmp)
+        dst = src.with_name(f"part-{i:05d}.jsonl")
+        src.rename(dst)
+        out.append(dst)
+    return out
+
+def _map(fn, tasks: list[tuple], workers: int) -> list[dict]:
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, *zip(*tasks)))
+    return [fn(*t) for t in tasks]
+
+def _raw_ids(parts: list[Path]) -> Iterator[pa.Table]:
+    for part in parts:
+        for lines in iter_line_chunks(part):
+            yield read_columns(lines, ["event_id"])
+
+def _sync_index(index: EventIndex, root: Path) -> int:
+    """Reload the index entries of raw partitions changed since it last saw them; returns how many."""
+    on_disk = {}
+    for d in (root/"raw"/"events").glob("dt=*/source=*"):
+        parts = sorted(d.glob("part-*.jsonl"))
+        if parts:
+            on_disk[(d.parent.name[len("dt="):], d.name[len("source="):])] = parts
+    known = index.fingerprints()
+    stale = 0
+    for key in sorted(set(on_disk) | set(known)):
+        parts = on_disk.get(key, [])
+        fp = raw_fingerprint(parts) if parts else None
+        if fp != known.get(key):
+            index.load(*key, _raw_ids(parts), fp)
+            stale += 1
+    return stale
+
+def _drop_requarantined(results: list[dict], q_dir: Path) -> int:
+    """Remove invalid records already quarantined for this dt from the run's new quarantine parts."""
+    known = set()
+    for p in q_dir.glob("part-*.jsonl"):
+        with p.open("rb") as f:
+            known.update(f)
+    if not known:
+        return 0
+    dropped = 0
+    for r in results:
+        kept = []
+        for part in map(Path, r["q_parts"]):
+            lines = part.read_bytes().splitlines(keepends=True)
+            new = [line for line in lines if line not in known]
+            dropped += len(lines) - len(new)
+            if not new:
+                part.unlink()
+                continue
+            if len(new) < len(lines):
+                part.write_bytes(b"".join(new))
+            kept.append(str(part))
+        r["q_parts"] = kept
+    return dropped
+
+def _dedupe(index: EventIndex, results: list[dict], ids_paths: list[str], dup_dir: Path,
+            workers: int, part_bytes: int) -> int:
+    """Check the run's event_ids against the index and move duplicates out of its parts."""
+    ids = {}
+    for task, path in enumerate(ids_paths):
+        if Path(path).exists():
+            ids[task] = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    counts = index.check(ids)
+    drops = []
+    for task, n in sorted(counts.items()):
+        dups_file = str(Path(ids_paths[task]).with_suffix(".dups.parquet"))
+        index.write_duplicates(task, Path(dups_file))
+        drops.append((results[task]["parts"], dups_file, str(dup_dir), f".w{task:05d}-", part_bytes))
+    for (task, _), dropped in zip(sorted(counts.items()), _map(_drop_duplicates, drops, workers)):
+        results[task] = {**results[task], **dropped}
+    for path in ids_paths:
+        Path(path).unlink(missing_ok=True)
+    return sum(counts.values())
+
+def run_ingest(source: str = "app", dt: str | None = None, workers: int = 1,
+               chunk_bytes: int = CHUNK_BYTES, part_bytes: int = PART_BYTES, dedupe: bool = False) -> dict:
+    """Stream landing JSONL into raw, quarantining records missing REQUIRED fields.
+
+    Landing is read in `chunk_bytes` blocks and validated a block at a time; good
+    records are stamped without re-serializing and rolled into `part_bytes` parts.
+    With `workers > 1` landing files are split into line-aligned byte ranges that
+    are processed by a process pool, each worker writing its own parts.
+
+    With `dedupe`, records whose event_id is already in raw (in any dt, or
+    earlier in this run) go to quarantine reason=DUPLICATE, and new parts are
+    appended to raw instead of replacing it. Raw partitions changed by plain
+    ingests are first reloaded into the warehouse event index, and the event_ids
+    of the published records are then added to it. Invalid records already
+    quarantined for `dt` are not quarantined again.
+    """
     check_read("landing")
     check_write("raw")
     check_write("quarantine")
@@ -17,36 +211,79 @@ def run_ingest(source: str = "app", dt: str | None = None) -> dict:
     cfg = load_env_config()
     dt = dt or today_utc()
 
-    landing_file = cfg.root/"landing"/"events.jsonl"
-    if not landing_file.exists():
-        raise FileNotFoundError(f"Missing landing file: {landing_file}. Run `govdemo seed` first.")
+    files = landing_files(cfg.root)
+    if not files:
+        raise FileNotFoundError(f"Missing landing file: {cfg.root/'landing'/'events.jsonl'}. Run `govdemo seed` first.")
 
-    run_id = start_run("ingest", input_ref=str(landing_file))
+    run_id = start_run("ingest", input_ref=",".join(str(p) for p in files))
 
     out_raw_dir = cfg.root/"raw"/"events"/f"dt={dt}"/f"source={source}"
     out_raw_dir.mkdir(parents=True, exist_ok=True)
-    out_raw = out_raw_dir/"part-00001.jsonl"
+    _clear_parts(out_raw_dir, keep_published=dedupe)
 
     q_dir = cfg.root/"quarantine"/"events"/f"dt={dt}"/"reason=MISSING_EVENT_ID"
     q_dir.mkdir(parents=True, exist_ok=True)
-    out_q = q_dir/"part-00001.jsonl"
+    _clear_parts(q_dir, keep_published=dedupe)
 
-    good = bad = 0
-    with landing_file.open("r", encoding="utf-8") as fin, out_raw.open("w", encoding="utf-8") as fgood, out_q.open("w", encoding="utf-8") as fbad:
-        for line in fin:
-            rec = json.loads(line)
-            missing = [k for k in REQUIRED if not rec.get(k)]
-            if missing:
-                bad += 1
-                fbad.write(json.dumps(rec)+"\n")
-                continue
-            rec["_ingested_at"] = now_iso()
-            rec["_source"] = source
-            rec["_raw_file"] = str(landing_file)
-            good += 1
-            fgood.write(json.dumps(rec)+"\n")
+    dup_dir = cfg.root/"quarantine"/"events"/f"dt={dt}"/"reason=DUPLICATE"
+    if dedupe:
+        dup_dir.mkdir(parents=True, exist_ok=True)
+        _clear_parts(dup_dir, keep_published=True)
+
+    total = sum(p.stat().st_size for p in files) or 1
+    tasks = []
+    for p in files:
+        n = max(1, round(workers * p.stat().st_size / total)) if workers > 1 else 1
+        for start, end in split_ranges(p, n):
+            prefix = f".w{len(tasks):05d}-"
+            ids_path = str(out_raw_dir/f"{prefix}ids.arrow") if dedupe else None
+            tasks.append((str(p), start, end, source, str(out_raw_dir), str(q_dir), prefix, chunk_bytes, part_bytes, ids_path))
+
+    t0 = time.perf_counter()
+    with phase(run_id, "validate_write"):
+        results = _map(_ingest_range, tasks, workers)
+
+    duplicates = requarantined = 0
+    # the index stays locked until the run's ids are committed, so concurrent dedupe ingests serialize here
+    with (EventIndex(cfg.event_index_path) if dedupe else nullcontext()) as index:
+        if dedupe:
+            with phase(run_id, "dedupe"):
+                _sync_index(index, cfg.root)
+                duplicates = _dedupe(index, results, [t[-1] for t in tasks], dup_dir, workers, part_bytes)
+                requarantined = _drop_requarantined(results, q_dir)
+        elapsed = time.perf_counter() - t0
+
+        good = sum(r["good"] for r in results) - duplicates
+        bad = sum(r["bad"] for r in results) - requarantined
+        rows_per_sec = (good + bad + duplicates + requarantined) / elapsed if elapsed > 0 else 0.0
+        with phase(run_id, "publish"):
+            parts = _publish([p for r in results for p in r["parts"]], _next_part(out_raw_dir))
+            _publish([p for r in results for p in r["q_parts"]], _next_part(q_dir))
+            if dedupe:
+                _publish([p for r in results for p in r.get("dup_parts", [])], _next_part(dup_dir))
+        for d in (out_raw_dir, q_dir, *([dup_dir] if dedupe else [])):
+            if not any(d.glob("part-*.jsonl")):
+                (d/"part-00001.jsonl").touch()
+        # a crash before this commit leaves published records out of the index (the next dedupe
+        # run reloads the partition from raw); committing first could instead lose records
+        if dedupe:
+            index.commit(dt, source, run_id, raw_fingerprint(raw_parts(cfg.root, dt, source)))
+
+    if not parts and not dedupe:
+        parts = [out_raw_dir/"part-00001.jsonl"]
+
+    count(run_id, rows_in=good + bad + duplicates + requarantined, rows_out=good, bytes_read=total if files else 0,
+          bytes_written=sum(p.stat().st_size for p in parts))
 
-    emit_edge(run_id, "ingest", from_ref=str(landing_file), to_ref=str(out_raw))
-    finish_run(run_id, "SUCCESS", output_ref=str(out_raw), details=f"good={good},bad={bad}")
+    edges, i = [], 0
+    for r in results:
+        edges += [(r["landing_file"], str(part)) for part in parts[i:i + len(r["parts"])]]
+        i += len(r["parts"])
+    emit_edges(run_id, "ingest", edges)
+    finish_run(run_id, "SUCCESS", output_ref=str(out_raw_dir),
+               details=f"good={good},bad={bad},duplicates={duplicates},requarantined={requarantined},parts={len(parts)},workers={workers},"
+                       f"rows_per_sec={rows_per_sec:.0f}")
 
-    return {"run_id": run_id, "raw_path": str(out_raw), "quarantine_path": str(out_q), "good": good, "bad": bad}
+    return {"run_id": run_id, "raw_path": str(out_raw_dir), "raw_parts": [str(p) for p in parts],
+            "quarantine_path": str(q_dir), "good": good, "bad": bad, "rows_per_sec": rows_per_sec,
+            "duplicates": duplicates, "duplicate_path": str(dup_dir) if dedupe else None}
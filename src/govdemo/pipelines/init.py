@@ -1,6 +1,7 @@
 from ..common.config import load_env_config
 from ..common.audit import init_audit
 from ..common.acl import check_write
+from ..common.lineage import import_legacy_jsonl
 
 def run_init() -> dict:
     cfg = load_env_config()
@@ -21,4 +22,6 @@ def run_init() -> dict:
     cfg.gdpr_evidence_dir.mkdir(parents=True, exist_ok=True)
     cfg.export_evidence_dir.mkdir(parents=True, exist_ok=True)
     init_audit()
-    return {"lake_root": str(cfg.root), "duckdb": str(cfg.duckdb_path), "lineage": str(cfg.lineage_path)}
+    imported = import_legacy_jsonl()
+    return {"lake_root": str(cfg.root), "duckdb": str(cfg.duckdb_path),
+            "lineage": f"{cfg.duckdb_path} (lineage_edges)", "lineage_imported": imported}
@@ -1,10 +1,19 @@
+from pathlib import Path
+import json
+import os
 import pyarrow as pa
 import pyarrow.parquet as pq
 from ..common.acl import check_read, check_write
 from ..common.config import load_env_config
 from ..common.audit import start_run, finish_run
-from ..common.lineage import emit_edge
-from ..common.time import today_utc
+from ..common.layout import LayoutPolicy, file_names, layer_files, layout_policy, open_writer, write_layout
+from ..common.lineage import emit_edges
+from ..common.locator import forget_files, index_files
+from ..common.metrics import count, phase
+from ..common.time import check_dt, today_utc
+from ..common.watermark import fingerprints, record_inputs, recorded_inputs
+from .curate import curated_dir, curated_files
+from .windows import WINDOW_SCHEMA, WINDOW_STEM, window_dir, window_files
 
 SERVING_SCHEMA = pa.schema([
     ("dt", pa.string()),
@@ -13,31 +22,192 @@ SERVING_SCHEMA = pa.schema([
     ("last_seen", pa.string()),
 ])
 
-def run_serve(dt: str | None = None) -> dict:
+SERVING_STEM = "user_metrics"
+WINDOW_SERVING_COLUMNS = [c for c in WINDOW_SCHEMA.names if c != "active_days_mask"]
+SERVING_RENAMES = {"last_event_time": "last_seen"}
+COLUMN_MAP = "_columns.json"  # sidecar of linked outputs: physical -> serving column names
+MODES = ("stream", "link")
+
+def serving_dir(root: Path, dt: str, window: int | None = None) -> Path:
+    check_dt(dt)
+    if window:
+        return root/"serving"/"user_activity_window"/f"window={window}d"/f"dt={dt}"
+    return root/"serving"/"user_metrics"/f"dt={dt}"
+
+def serving_files(root: Path, dt: str, window: int | None = None) -> list[Path]:
+    """Serving files of `dt`, or of its `window`-day rolling window (one, or one per bucket)."""
+    return layer_files(serving_dir(root, dt, window), WINDOW_STEM if window else SERVING_STEM)
+
+def serving_column_map(out_dir: Path) -> dict[str, str]:
+    """Physical -> serving column renames readers must apply to files in `out_dir` ({} if none)."""
+    path = out_dir/COLUMN_MAP
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))["columns"]
+
+def apply_column_map(table: pa.Table, column_map: dict[str, str]) -> pa.Table:
+    if not column_map:
+        return table
+    return table.rename_columns([column_map.get(c, c) for c in table.column_names])
+
+def _renamed_schema(schema: pa.Schema) -> pa.Schema:
+    # same fields, new names: batches can be re-labelled without touching buffers
+    return pa.schema([f.with_name(SERVING_RENAMES.get(f.name, f.name)) for f in schema], metadata=schema.metadata)
+
+def _layouts_match(curated: list[Path], policy: LayoutPolicy) -> bool:
+    """Curated files can be passed through 1:1 when they already have the serving sort and buckets."""
+    cur = layout_policy("curated")
+    return (len(curated) == policy.buckets and cur.buckets == policy.buckets
+            and cur.bucket_by == policy.bucket_by and cur.sort_by == policy.sort_by)
+
+def _stream_file(src: Path, dst: Path, policy: LayoutPolicy) -> int:
+    """Copy `src` to `dst` one row group at a time, renaming via the schema and casting only if needed."""
+    pf = pq.ParquetFile(src)
+    renamed = _renamed_schema(pf.schema_arrow)
+    needs_cast = not renamed.remove_metadata().equals(SERVING_SCHEMA)
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    with open_writer(tmp, SERVING_SCHEMA, policy, expected_rows=pf.metadata.num_rows) as w:
+        for rg in range(pf.num_row_groups):
+            t = pf.read_row_group(rg)
+            t = pa.Table.from_arrays(t.columns, schema=renamed)
+            if needs_cast:
+                t = t.select(SERVING_SCHEMA.names).cast(SERVING_SCHEMA, safe=False)
+            w.write_table(t, row_group_size=max(t.num_rows, 1))
+    os.replace(tmp, dst)
+    return pf.metadata.num_rows
+
+def _link_file(src: Path, dst: Path) -> int:
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    os.link(src, tmp)
+    os.replace(tmp, dst)
+    return pq.ParquetFile(dst).metadata.num_rows
+
+def _write_column_map(out_dir: Path) -> None:
+    tmp = out_dir/f".{COLUMN_MAP}.tmp"
+    tmp.write_text(json.dumps({"columns": SERVING_RENAMES}), encoding="utf-8")
+    os.replace(tmp, out_dir/COLUMN_MAP)
+
+def _run_serve_window(dt: str, days: int, force: bool) -> dict:
+    """Publish the `days`-day rolling window of `dt` (without its day mask) to serving."""
+    check_read("curated")
+    check_write("serving")
+    check_write("warehouse")
+
+    cfg = load_env_config()
+    source = window_files(cfg.root, days, dt)
+    if not source:
+        raise FileNotFoundError(f"Missing {days}-day window in: {window_dir(cfg.root, days, dt)}. "
+                                f"Run `govdemo curate --window {days}` first.")
+
+    run_id = start_run("serve_window", input_ref=str(window_dir(cfg.root, days, dt)))
+    out_dir = serving_dir(cfg.root, dt, days)
+    existing = serving_files(cfg.root, dt, days)
+    stage = f"serve_window_{days}d"
+
+    inputs = fingerprints(source)
+    if not force and existing and recorded_inputs(stage, dt) == inputs:
+        finish_run(run_id, "SKIPPED", output_ref=str(out_dir), details="inputs unchanged")
+        return {"run_id": run_id, "serving_path": str(out_dir), "serving_files": [str(p) for p in existing],
+                "rows": sum(pq.ParquetFile(p).metadata.num_rows for p in existing), "skipped": True}
+
+    with phase(run_id, "read"):
+        table = pa.concat_tables([pq.read_table(p, columns=WINDOW_SERVING_COLUMNS) for p in source])
+    with phase(run_id, "write"):
+        out_files = write_layout(table, out_dir, WINDOW_STEM, layout_policy("serving_windows"))
+    with phase(run_id, "index"):
+        forget_files(sorted(set(existing) - set(out_files)))
+        index_files("serving_windows", out_files)
+    count(run_id, rows_in=table.num_rows, rows_out=table.num_rows,
+          bytes_read=sum(p.stat().st_size for p in source), bytes_written=sum(p.stat().st_size for p in out_files))
+
+    emit_edges(run_id, "serve", [(s, o) for s in source for o in out_files])
+    record_inputs(stage, dt, run_id, inputs)
+    finish_run(run_id, "SUCCESS", output_ref=str(out_dir), details=f"rows={table.num_rows},files={len(out_files)},window={days}d")
+    return {"run_id": run_id, "serving_path": str(out_dir), "serving_files": [str(p) for p in out_files],
+            "rows": int(table.num_rows), "mode": f"window={days}d", "skipped": False}
+
+def run_serve(dt: str | None = None, force: bool = False, mode: str = "stream", window: int | None = None) -> dict:
+    """Publish curated facts as serving/user_metrics.
+
+    When the curated files already have the serving sort order and buckets,
+    each one is streamed row group by row group into its serving file, with
+    `last_event_time` renamed in the schema (no cast unless the types differ).
+    `mode="link"` goes further and hard-links the curated files, recording the
+    rename in a `_columns.json` sidecar that the serving readers apply. It falls
+    back to streaming if the types differ or the link fails. Other layouts are
+    read whole and re-laid out.
+
+    With `window`, the N-day rolling window of `dt` (see pipelines.windows) is
+    published to serving/user_activity_window instead.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown serve mode '{mode}'. Expected one of: {', '.join(MODES)}")
+    if window:
+        return _run_serve_window(dt or today_utc(), window, force)
     check_read("curated")
     check_write("serving")
     check_write("warehouse")
 
     cfg = load_env_config()
     dt = dt or today_utc()
-    curated_path = cfg.root/"curated"/"facts"/f"dt={dt}"/"fact_user_activity_daily.parquet"
-    if not curated_path.exists():
-        raise FileNotFoundError(f"Missing curated fact: {curated_path}. Run `govdemo curate` first.")
+    curated = curated_files(cfg.root, dt)
+    if not curated:
+        raise FileNotFoundError(f"Missing curated facts in: {curated_dir(cfg.root, dt)}. Run `govdemo curate` first.")
+
+    run_id = start_run("serve", input_ref=str(curated_dir(cfg.root, dt)))
 
-    run_id = start_run("serve", input_ref=str(curated_path))
+    out_dir = serving_dir(cfg.root, dt)
+    existing = serving_files(cfg.root, dt)
 
-    table = pq.ParquetFile(curated_path).read()
-    # rename last_event_time -> last_seen
-    names = table.column_names
-    if "last_event_time" in names:
-        table = table.rename_columns([("last_seen" if c == "last_event_time" else c) for c in names])
-    table = table.cast(SERVING_SCHEMA, safe=False)
+    inputs = fingerprints(curated)
+    if not force and existing and recorded_inputs("serve", dt) == inputs:
+        finish_run(run_id, "SKIPPED", output_ref=str(out_dir), details="inputs unchanged")
+        return {"run_id": run_id, "serving_path": str(out_dir), "serving_files": [str(p) for p in existing],
+                "rows": sum(pq.ParquetFile(p).metadata.num_rows for p in existing), "skipped": True}
 
-    out_dir = cfg.root/"serving"/"user_metrics"/f"dt={dt}"
+    policy = layout_policy("serving")
     out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir/"user_metrics.parquet"
-    pq.write_table(table, out_path, use_dictionary=False)
+    if _layouts_match(curated, policy):
+        out_files = [out_dir/name for name in file_names(SERVING_STEM, policy.buckets)]
+        linkable = mode == "link" and all(
+            _renamed_schema(pq.read_schema(p)).remove_metadata().equals(SERVING_SCHEMA) for p in curated)
+        rows = 0
+        with phase(run_id, "write"):
+            if linkable:
+                _write_column_map(out_dir)
+                try:
+                    rows = sum(_link_file(src, dst) for src, dst in zip(curated, out_files))
+                    served = "link"
+                except OSError:
+                    linkable = False
+            if not linkable:
+                rows = sum(_stream_file(src, dst, policy) for src, dst in zip(curated, out_files))
+                (out_dir/COLUMN_MAP).unlink(missing_ok=True)
+                served = "stream"
+        edges = list(zip(curated, out_files))
+    else:
+        with phase(run_id, "read"):
+            table = pa.concat_tables([pq.ParquetFile(p).read() for p in curated])
+        with phase(run_id, "transform"):
+            table = pa.Table.from_arrays(table.columns, schema=_renamed_schema(table.schema))
+            if not table.schema.remove_metadata().equals(SERVING_SCHEMA):
+                table = table.select(SERVING_SCHEMA.names).cast(SERVING_SCHEMA, safe=False)
+        with phase(run_id, "write"):
+            out_files = write_layout(table, out_dir, SERVING_STEM, policy)
+            (out_dir/COLUMN_MAP).unlink(missing_ok=True)
+        rows, served = table.num_rows, "relayout"
+        edges = [(c, o) for c in curated for o in out_files]
+    for stale in set(layer_files(out_dir, SERVING_STEM)) - set(out_files):
+        stale.unlink()
+    with phase(run_id, "index"):
+        forget_files(sorted(set(existing) - set(out_files)))
+        index_files("serving", out_files)
+    count(run_id, rows_in=rows, rows_out=rows,
+          bytes_read=sum(p.stat().st_size for p in curated), bytes_written=0 if served == "link" else sum(p.stat().st_size for p in out_files))
 
-    emit_edge(run_id, "serve", from_ref=str(curated_path), to_ref=str(out_path))
-    finish_run(run_id, "SUCCESS", output_ref=str(out_path), details=f"rows={table.num_rows}")
-    return {"run_id": run_id, "serving_path": str(out_path), "rows": int(table.num_rows)}
+    emit_edges(run_id, "serve", edges)
+    record_inputs("serve", dt, run_id, inputs)
+    finish_run(run_id, "SUCCESS", output_ref=str(out_dir), details=f"rows={rows},files={len(out_files)},mode={served}")
+    return {"run_id": run_id, "serving_path": str(out_dir), "serving_files": [str(p) for p in out_files],
+            "rows": int(rows), "mode": served, "skipped": False}
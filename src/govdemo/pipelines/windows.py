@@ -0,0 +1,167 @@
+from datetime import date, timedelta
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ..common.acl import check_read, check_write
+from ..common.config import load_env_config
+from ..common.audit import start_run, finish_run
+from ..common.engine import compute_connection, fetch_table
+from ..common.layout import layer_files, layout_policy, write_layout
+from ..common.lineage import emit_edges
+from ..common.locator import forget_files, index_files
+from ..common.metrics import count, phase
+from ..common.time import date_range, today_utc
+from ..common.watermark import fingerprints, record_inputs, recorded_inputs
+from .curate import curated_dir, curated_files
+
+WINDOW_SCHEMA = pa.schema([
+    ("dt", pa.string()),
+    ("window_days", pa.int32()),
+    ("user_id", pa.string()),
+    ("events", pa.int64()),
+    ("active_days", pa.int32()),
+    ("first_seen_dt", pa.string()),
+    ("last_seen", pa.string()),
+    ("active_days_mask", pa.string()),  # one '0'/'1' per day of the window, oldest first, dt last
+])
+
+WINDOW_STEM = "user_activity_window"
+MAX_WINDOW_DAYS = 366
+
+def window_dir(root: Path, days: int, dt: str) -> Path:
+    return root/"curated"/"windows"/f"window={days}d"/f"dt={dt}"
+
+def window_files(root: Path, days: int, dt: str) -> list[Path]:
+    """Rolling-window state files of `dt` for a `days`-day window."""
+    return layer_files(window_dir(root, days, dt), WINDOW_STEM)
+
+def _shift(dt: str, days: int) -> str:
+    return (date.fromisoformat(dt) + timedelta(days=days)).isoformat()
+
+def _paths(paths: list[Path]) -> list[str]:
+    return [str(p) for p in paths]
+
+# W(dt) = W(dt-1) + F(dt) - F(dt-N): each update reads three partitions whatever N is.
+# The mask shifts the leaving day out on the left and today's bit in on the right.
+_UPDATE = """
+with prev as (
+  select user_id, events, active_days_mask::BIT as mask, last_seen from read_parquet($prev)
+), today as (
+  select user_id, events, last_event_time from read_parquet($today) where user_id is not null
+), expired as (
+  select user_id, events from read_parquet($expired) where user_id is not null
+), merged as (
+  select coalesce(p.user_id, t.user_id) as user_id,
+         coalesce(p.events, 0) + coalesce(t.events, 0) - coalesce(e.events, 0) as events,
+         (coalesce(p.mask, bitstring('0', $days)) << 1)
+           | (case when t.user_id is null then bitstring('0', $days) else bitstring('1', $days) end) as mask,
+         greatest(p.last_seen, t.last_event_time) as last_seen
+  from prev p
+  full join today t on p.user_id = t.user_id
+  left join expired e on e.user_id = coalesce(p.user_id, t.user_id)
+)
+"""
+
+# Without yesterday's state the window is rebuilt from the N daily partitions once.
+_REBUILD = """
+with daily as (
+  select user_id, events, last_event_time,
+         (repeat('0', $days - 1 - ($dt::date - dt::date)) || '1' || repeat('0', $dt::date - dt::date))::BIT as bit
+  from read_parquet($facts, hive_partitioning = false) where user_id is not null
+), merged as (
+  select user_id, sum(events)::bigint as events, bit_or(bit) as mask, max(last_event_time) as last_seen
+  from daily group by user_id
+)
+"""
+
+_SELECT = """
+select $dt as dt, $days::integer as window_days, user_id, events,
+       bit_count(mask)::integer as active_days,
+       ($dt::date - ($days - bit_position('1'::BIT, mask)))::varchar as first_seen_dt,
+       coalesce(last_seen, '') as last_seen, mask::varchar as active_days_mask
+from merged where bit_count(mask) > 0
+order by user_id
+"""
+
+def _empty_facts(con) -> str:
+    # read_parquet needs at least one file; a missing day reads as an empty table instead
+    con.execute("create temp table if not exists no_facts (dt varchar, user_id varchar, events bigint, last_event_time varchar)")
+    return "no_facts"
+
+def _plan(root: Path, days: int, dt: str, rebuild: bool) -> tuple[str, dict[str, list[Path]]]:
+    """Inputs of one window update: yesterday's state plus the day entering and the day leaving."""
+    prev = [] if rebuild else window_files(root, days, _shift(dt, -1))
+    if prev:
+        return "incremental", {"prev": prev, "today": curated_files(root, dt),
+                               "expired": curated_files(root, _shift(dt, -days))}
+    return "rebuild", {"facts": [p for d in date_range(_shift(dt, 1 - days), dt) for p in curated_files(root, d)]}
+
+def _compute(con, mode: str, inputs: dict[str, list[Path]], days: int, dt: str) -> pa.Table:
+    sql = (_UPDATE if mode == "incremental" else _REBUILD) + _SELECT
+    params = {"days": days, "dt": dt}
+    for name, paths in inputs.items():
+        if paths:
+            params[name] = _paths(paths)
+        else:
+            sql = sql.replace(f"read_parquet(${name})", _empty_facts(con))
+    return fetch_table(con.execute(sql, params)).cast(WINDOW_SCHEMA)
+
+def run_windows(dt: str | None = None, windows: list[int] | None = None, rebuild: bool = False) -> dict:
+    """Maintain rolling N-day activity windows over curated daily facts.
+
+    The state for (N, dt) is derived from the state of dt-1 by adding dt's
+    facts and subtracting those of dt-N, so an update costs the same for a
+    7- or a 90-day window. When dt-1 has no state (first run, gap) or
+    `rebuild` is set, the window is recomputed from its N daily partitions.
+    Updates assume the daily facts of a window did not change after they
+    were added; rebuild after re-curating or erasing a single old dt.
+    """
+    check_read("curated")
+    check_write("curated")
+    check_write("warehouse")
+
+    windows = sorted(set(windows or [7, 30, 90]))
+    bad = [w for w in windows if not 1 <= w <= MAX_WINDOW_DAYS]
+    if bad:
+        raise ValueError(f"Window lengths must be 1..{MAX_WINDOW_DAYS} days, got: {', '.join(map(str, bad))}")
+
+    cfg = load_env_config()
+    dt = dt or today_utc()
+    if not curated_files(cfg.root, dt):
+        raise FileNotFoundError(f"Missing curated facts in: {curated_dir(cfg.root, dt)}. Run `govdemo curate` first.")
+
+    run_id = start_run("curate_windows", input_ref=f"{curated_dir(cfg.root, dt)} windows={','.join(map(str, windows))}")
+    policy = layout_policy("curated_windows")
+    results = []
+    con = compute_connection()
+    try:
+        for days in windows:
+            stage = f"window_{days}d"
+            out_dir = window_dir(cfg.root, days, dt)
+            existing = window_files(cfg.root, days, dt)
+            mode, parts = _plan(cfg.root, days, dt, rebuild)
+            inputs = [p for paths in parts.values() for p in paths]
+            fps = fingerprints(inputs)
+            if not rebuild and existing and recorded_inputs(stage, dt) == fps:
+                results.append({"window_days": days, "path": str(out_dir), "rows": sum(
+                    pq.ParquetFile(p).metadata.num_rows for p in existing), "mode": "skipped"})
+                continue
+            with phase(run_id, "aggregate"):
+                table = _compute(con, mode, parts, days, dt)
+            with phase(run_id, "write"):
+                out_files = write_layout(table, out_dir, WINDOW_STEM, policy)
+            with phase(run_id, "index"):
+                forget_files(sorted(set(existing) - set(out_files)))
+                index_files("curated_windows", out_files)
+            count(run_id, rows_in=sum(pq.ParquetFile(p).metadata.num_rows for p in inputs), rows_out=table.num_rows,
+                  bytes_read=sum(p.stat().st_size for p in inputs),
+                  bytes_written=sum(p.stat().st_size for p in out_files))
+            emit_edges(run_id, "curate_windows", [(p, o) for p in inputs for o in out_files])
+            record_inputs(stage, dt, run_id, fps)
+            results.append({"window_days": days, "path": str(out_dir), "rows": table.num_rows, "mode": mode})
+    finally:
+        con.close()
+
+    finish_run(run_id, "SUCCESS", output_ref=str(cfg.root/"curated"/"windows"),
+               details=f"dt={dt}," + ",".join(f"{r['window_days']}d={r['rows']}:{r['mode']}" for r in results))
+    return {"run_id": run_id, "dt": dt, "windows": results}
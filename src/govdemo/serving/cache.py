@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+import os
+import threading
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ..common.acl import check_read
+from ..common.config import load_env_config
+from ..common.time import today_utc
+from ..pipelines.serve import apply_column_map, serving_column_map, serving_dir, serving_files
+
+RECHECK_S = float(os.environ.get("GOVDEMO_SERVING_RECHECK_S", "1"))
+
+@dataclass(frozen=True)
+class _Snapshot:
+    dt: str
+    window: int | None
+    stat_key: tuple
+    columns: tuple[str, ...]
+    rows: dict[str, tuple]
+    loaded_at: float
+
+def _stat_key(files: list[Path]) -> tuple:
+    # serve swaps files in with os.replace (or a fresh hard link), so a new run always changes the inode
+    out = []
+    for p in files:
+        st = p.stat()
+        out.append((p.name, st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(out)
+
+class UserMetricsCache:
+    """In-memory user_id -> row index over serving/user_metrics, one snapshot per dt.
+
+    Rolling windows published by `govdemo serve --window N` get their own
+    snapshots, keyed by (dt, window).
+
+    A snapshot is a plain dict of user_id -> tuple of the other columns, so a
+    lookup is one dict probe. Serving files are re-stat'ed at most every
+    `recheck_s` seconds and a dt is reloaded when a serve run replaced them.
+    Snapshots are swapped whole, so readers never see a half-loaded dt. At most
+    `max_dts` dts are kept, least recently used first out.
+    """
+
+    def __init__(self, max_dts: int = 4, recheck_s: float = RECHECK_S):
+        check_read("serving")
+        self.root = load_env_config().root
+        self.max_dts = max(max_dts, 1)
+        self.recheck_s = recheck_s
+        self._lock = threading.Lock()
+        self._snapshots: OrderedDict[tuple[str, int | None], _Snapshot] = OrderedDict()
+        self._checked_at: dict[tuple[str, int | None], float] = {}
+        self.loads = 0
+
+    def _load(self, dt: str, window: int | None, files: list[Path], stat_key: tuple) -> _Snapshot:
+        table = pa.concat_tables([pq.ParquetFile(p).read() for p in files])
+        table = apply_column_map(table, serving_column_map(serving_dir(self.root, dt, window)))
+        columns = tuple(c for c in table.column_names if c != "user_id")
+        values = [table[c].to_pylist() for c in columns]
+        rows = dict(zip(table["user_id"].to_pylist(), zip(*values)))
+        rows.pop(None, None)
+        self.loads += 1
+        return _Snapshot(dt, window, stat_key, columns, rows, time.time())
+
+    def snapshot(self, dt: str | None = None, window: int | None = None) -> _Snapshot:
+        key = (dt or today_utc(), window or None)
+        snap = self._snapshots.get(key)
+        if snap is not None and time.monotonic() - self._checked_at.get(key, 0.0) < self.recheck_s:
+            return snap
+        with self._lock:
+            snap = self._snapshots.get(key)
+            files = serving_files(self.root, *key)
+            if not files:
+                hint = f"govdemo serve --window {window}" if window else "govdemo serve"
+                raise FileNotFoundError(f"No serving files for dt={key[0]}. Run `{hint}` first.")
+            stat_key = _stat_key(files)
+            if snap is None or snap.stat_key != stat_key:
+                snap = self._load(*key, files, stat_key)
+            self._snapshots[key] = snap
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.max_dts:
+                old, _ = self._snapshots.popitem(last=False)
+                self._checked_at.pop(old, None)
+            self._checked_at[key] = time.monotonic()
+            return snap
+
+    def get(self, user_id: str, dt: str | None = None, window: int | None = None) -> dict | None:
+        snap = self.snapshot(dt, window)
+        row = snap.rows.get(user_id)
+        return None if row is None else {"user_id": user_id, **dict(zip(snap.columns, row))}
+
+    def get_many(self, user_ids: list[str], dt: str | None = None,
+                 window: int | None = None) -> dict[str, dict | None]:
+        """Batched lookup against one snapshot; unknown user_ids map to None."""
+        snap = self.snapshot(dt, window)
+        out = {}
+        for u in user_ids:
+            row = snap.rows.get(u)
+            out[u] = None if row is None else {"user_id": u, **dict(zip(snap.columns, row))}
+        return out
+
+    def dts(self) -> list[str]:
+        return [dt if window is None else f"{dt}/window={window}d" for dt, window in self._snapshots]
+
+    def invalidate(self, dt: str | None = None) -> None:
+        """Force a re-stat on the next lookup (of `dt`, or of every dt)."""
+        with self._lock:
+            for key in list(self._checked_at):
+                if dt is None or key[0] == dt:
+                    del self._checked_at[key]
+
+_CACHE: UserMetricsCache | None = None
+
+def user_metrics_cache() -> UserMetricsCache:
+    """Process-wide cache, created on first use."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = UserMetricsCache()
+    return _CACHE
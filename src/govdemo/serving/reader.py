@@ -0,0 +1,93 @@
+from pathlib import Path
+import re
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from ..common.acl import check_read
+from ..common.config import load_env_config
+from ..common.layout import bucket_for, stats_row_groups
+from ..common.time import today_utc
+from ..pipelines.serve import apply_column_map, serving_column_map, serving_dir, serving_files
+
+_BUCKET = re.compile(r"-b(\d{3})\.parquet$")
+
+class UserMetricsReader:
+    """Point and range reads over serving/user_metrics (or a rolling window) for one dt.
+
+    Lookups only open the bucket files a user_id hashes to and only read the
+    row groups whose user_id statistics can match; `row_groups_read` counts
+    what was actually touched.
+    """
+
+    def __init__(self, dt: str | None = None, window: int | None = None):
+        check_read("serving")
+        self.dt = dt or today_utc()
+        self.window = window
+        root = load_env_config().root
+        self.files = serving_files(root, self.dt, window)
+        if not self.files:
+            hint = f"govdemo serve --window {window}" if window else "govdemo serve"
+            raise FileNotFoundError(f"No serving files for dt={self.dt}. Run `{hint}` first.")
+        # linked serve outputs keep curated column names; see run_serve(mode="link")
+        self.column_map = serving_column_map(serving_dir(root, self.dt, window))
+        self._physical = {v: k for k, v in self.column_map.items()}
+        self._bucketed = all(_BUCKET.search(p.name) for p in self.files)
+        self._handles: dict[Path, pq.ParquetFile] = {}
+        self.row_groups_read = 0
+
+    def _file(self, path: Path) -> pq.ParquetFile:
+        pf = self._handles.get(path)
+        if pf is None:
+            pf = self._handles[path] = pq.ParquetFile(path)
+        return pf
+
+    def _read(self, path: Path, row_groups: list[int], columns: list[str] | None) -> pa.Table | None:
+        if not row_groups:
+            return None
+        pf = self._file(path)
+        cols = None if columns is None else [self._physical.get(c, c) for c in dict.fromkeys(["user_id", *columns])]
+        self.row_groups_read += len(row_groups)
+        return apply_column_map(pf.read_row_groups(row_groups, columns=cols), self.column_map)
+
+    def _empty(self, columns: list[str] | None) -> pa.Table:
+        empty = apply_column_map(self._file(self.files[0]).schema_arrow.empty_table(), self.column_map)
+        return empty if columns is None else empty.select(list(dict.fromkeys(["user_id", *columns])))
+
+    def get(self, user_ids: list[str], columns: list[str] | None = None) -> pa.Table:
+        """Rows for `user_ids` (batched: one pass per touched file)."""
+        wanted = {u for u in user_ids if u}
+        by_file: dict[Path, set[str]] = {}
+        if self._bucketed:
+            for u in wanted:
+                by_file.setdefault(self.files[bucket_for(u, len(self.files))], set()).add(u)
+        else:
+            by_file = {p: wanted for p in self.files}
+        value_set = pa.array(sorted(wanted), pa.string())
+        tables = []
+        for path, users in by_file.items():
+            t = self._read(path, stats_row_groups(self._file(path), "user_id", values=users), columns)
+            if t is not None:
+                tables.append(t.filter(pc.fill_null(pc.is_in(t["user_id"], value_set=value_set), False)))
+        return pa.concat_tables(tables) if tables else self._empty(columns)
+
+    def range(self, lo: str | None = None, hi: str | None = None, columns: list[str] | None = None) -> pa.Table:
+        """Rows with lo <= user_id <= hi (either bound optional)."""
+        tables = []
+        for path in self.files:
+            t = self._read(path, stats_row_groups(self._file(path), "user_id", lo=lo, hi=hi), columns)
+            if t is None:
+                continue
+            mask = pc.is_valid(t["user_id"])
+            if lo is not None:
+                mask = pc.and_(mask, pc.greater_equal(t["user_id"], lo))
+            if hi is not None:
+                mask = pc.and_(mask, pc.less_equal(t["user_id"], hi))
+            tables.append(t.filter(pc.fill_null(mask, False)))
+        return pa.concat_tables(tables) if tables else self._empty(columns)
+
+def read_user_metrics(dt: str | None = None, user_ids: list[str] | None = None,
+                      lo: str | None = None, hi: str | None = None, columns: list[str] | None = None,
+                      window: int | None = None) -> pa.Table:
+    """One-shot read of serving/user_metrics (or a `window`-day window) with user_id pushdown."""
+    reader = UserMetricsReader(dt, window)
+    return reader.get(user_ids, columns) if user_ids is not None else reader.range(lo, hi, columns)
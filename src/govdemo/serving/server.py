@@ -0,0 +1,64 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import json
+from ..common.acl import AccessDenied, check_read
+from .cache import UserMetricsCache
+
+MAX_BATCH = 1000
+
+class _Handler(BaseHTTPRequestHandler):
+    """GET /users/<user_id>?dt=..., GET /users?user_id=a&user_id=b&dt=..., GET /healthz
+
+    Add window=N to read the N-day rolling window instead of the daily metrics.
+    """
+
+    cache: UserMetricsCache
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        dt = query.get("dt", [None])[0]
+        try:
+            # the server's role is re-checked per request so a roles.local.yaml change takes effect
+            check_read("serving")
+            window = int(query["window"][0]) if "window" in query else None
+            if url.path == "/healthz":
+                self._send(200, {"status": "ok", "dts": self.cache.dts()})
+            elif url.path.startswith("/users/"):
+                user_id = unquote(url.path[len("/users/"):])
+                row = self.cache.get(user_id, dt, window)
+                self._send(200 if row else 404, row or {"error": f"user_id '{user_id}' not found"})
+            elif url.path == "/users":
+                user_ids = query.get("user_id", [])
+                if len(user_ids) > MAX_BATCH:
+                    self._send(400, {"error": f"at most {MAX_BATCH} user_id per request"})
+                else:
+                    self._send(200, {"rows": self.cache.get_many(user_ids, dt, window)})
+            else:
+                self._send(404, {"error": f"unknown path {url.path}"})
+        except AccessDenied as e:
+            self._send(403, {"error": str(e)})
+        except FileNotFoundError as e:
+            self._send(404, {"error": str(e)})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, cache: UserMetricsCache | None = None) -> ThreadingHTTPServer:
+    """HTTP lookup endpoint over a UserMetricsCache; requires read access to the serving layer."""
+    check_read("serving")
+    handler = type("UserMetricsHandler", (_Handler,), {"cache": cache or UserMetricsCache()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,40 @@
+import json
+import shutil
+from pathlib import Path
+import pytest
+from govdemo.common.acl import reload_roles
+from govdemo.common.config import load_env_config
+from govdemo.common.context import reset_context
+from govdemo.pipelines.init import run_init
+
+REPO = Path(__file__).resolve().parents[1]
+DT = "2026-01-05"
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A fresh, initialized project directory as the cwd, with role data_engineer."""
+    (tmp_path/"configs").mkdir()
+    shutil.copy(REPO/"configs"/"roles.local.yaml", tmp_path/"configs")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GOVDEMO_ROLE", "data_engineer")
+    monkeypatch.setenv("PII_TOKEN_SECRET", "test-secret")
+    reset_context()
+    reload_roles()
+    run_init()
+    yield load_env_config()
+    reset_context()
+
+@pytest.fixture
+def landing(project):
+    """Replace the landing file with the given records (dicts, or raw lines as str)."""
+    def write(records: list) -> Path:
+        path = project.root/"landing"/"events.jsonl"
+        with path.open("w", encoding="utf-8") as f:
+            for r in records:
+                f.write((r if isinstance(r, str) else json.dumps(r)) + "\n")
+        return path
+    return write
+
+def event(event_id: str, user_id: str, at: str = f"{DT}T10:00:00Z") -> dict:
+    return {"event_id": event_id, "user_id": user_id, "event_time": at,
+            "email": f"{user_id}@example.com", "ip_address": "1.1.1.1", "source": "app"}
@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+import pytest
+from govdemo.common import audit
+from govdemo.common.audit import AuditSession, audit_session, start_run
+from govdemo.common.watermark import recorded_inputs
+
+def _session(tmp_path) -> AuditSession:
+    session = AuditSession(tmp_path/"audit.duckdb", tmp_path/"spool")
+    session.execute("create table if not exists t (x integer)")
+    session.flush()
+    return session
+
+def _insert(x: int) -> dict:
+    return {"sql": "insert into t values (?)", "params": [x], "tables": {}}
+
+def test_spooled_writes_are_replayed(tmp_path):
+    session = _session(tmp_path)
+    session._spool([_insert(1)])
+    assert session.flush() is True
+    assert session.query("select x from t") == [(1,)]
+    assert not list((tmp_path/"spool").iterdir())
+
+def test_failed_flush_hands_claimed_spool_back(tmp_path):
+    session = _session(tmp_path)
+    session._spool([_insert(1)])
+    session.execute("insert into missing_table values (1)")
+    with pytest.raises(Exception):
+        session.flush()
+    assert [p.suffix for p in (tmp_path/"spool").iterdir()] == [".jsonl"]
+    session._pending = []
+    session.flush()
+    assert session.query("select x from t") == [(1,)]
+
+def test_spool_claimed_by_a_dead_process_is_readopted(tmp_path):
+    session = _session(tmp_path)
+    (tmp_path/"spool").mkdir()
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    (tmp_path/"spool"/f"{dead.pid}-abc.claimed").write_text(json.dumps(_insert(2)) + "\n")
+    session.flush()
+    assert session.query("select x from t") == [(2,)]
+
+def test_reads_degrade_while_the_audit_db_is_locked(project, monkeypatch):
+    run_id = start_run("ingest")
+    assert audit_session().query("select status from audit_runs where run_id = ?", [run_id]) == [("RUNNING",)]
+    holder = subprocess.Popen(
+        [sys.executable, "-c", "import duckdb, sys, time; c = duckdb.connect(sys.argv[1]); print('ready', flush=True); "
+                               "time.sleep(30)", str(project.duckdb_path)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "ready"
+        monkeypatch.setattr(audit, "READ_LOCK_TIMEOUT_S", 0.2)
+        assert recorded_inputs("curate", "2026-01-05") == {}
+    finally:
+        holder.kill()
+        holder.wait()
@@ -0,0 +1,31 @@
+import shutil
+from pathlib import Path
+import pyarrow.parquet as pq
+from conftest import DT, event
+from govdemo.pipelines.clean import clean_parts, run_clean, uncovered_parts
+from govdemo.pipelines.compact import run_compact
+from govdemo.pipelines.ingest import run_ingest
+
+def test_uncovered_parts_drops_merged_members():
+    parts = [Path(n) for n in ["part-app-00001.parquet", "part-app-00002.parquet", "part-app-00001-00002.parquet",
+                               "part-app-00003.parquet", "part-web-00001.parquet"]]
+    assert [p.name for p in uncovered_parts(parts)] == [
+        "part-app-00001-00002.parquet", "part-app-00003.parquet", "part-web-00001.parquet"]
+
+def test_compacted_clean_partition_is_never_double_counted(project, landing):
+    landing([event(f"e{i}", f"u{i % 7}") for i in range(40)])
+    run_ingest(dt=DT, part_bytes=1024)
+    run_clean(dt=DT)
+    members = clean_parts(project.root, DT)
+    assert len(members) > 1
+    kept = project.root/"kept.parquet"
+    shutil.copy(members[0], kept)
+
+    assert run_compact(layers=["clean"], dt=DT)["compacted"] == 1
+    # a member still on disk next to its merged part, as between publish and unlink
+    shutil.copy(kept, members[0])
+    parts = clean_parts(project.root, DT)
+    assert len(parts) == 1
+    assert sum(pq.ParquetFile(p).metadata.num_rows for p in parts) == 40
+    run_clean(dt=DT)
+    assert not members[0].exists()
@@ -0,0 +1,35 @@
+import pyarrow.parquet as pq
+from conftest import DT, event
+from govdemo.pipelines.clean import run_clean
+from govdemo.pipelines.curate import curated_files, run_curate
+from govdemo.pipelines.ingest import run_ingest
+
+def _facts(root) -> dict:
+    rows = [r for p in curated_files(root, DT) for r in pq.read_table(p).to_pylist()]
+    return {r["user_id"]: (r["events"], r["last_event_time"]) for r in rows}
+
+def test_curate_skips_unchanged_inputs(project, landing):
+    landing([event("e1", "u1"), event("e2", "u2")])
+    run_ingest(dt=DT)
+    run_clean(dt=DT)
+    assert run_curate(dt=DT)["skipped"] is False
+    assert run_curate(dt=DT)["skipped"] is True
+
+def test_incremental_curate_matches_full_recompute(project, landing):
+    landing([event("e1", "u1"), event("e2", "u2")])
+    run_ingest(dt=DT)
+    run_clean(dt=DT)
+    run_curate(dt=DT)
+
+    # a dedupe ingest appends a raw part, so clean and curate only process the new part
+    landing([event("e1", "u1"), event("e3", "u1", f"{DT}T12:00:00Z"), event("e4", "u3")])
+    run_ingest(dt=DT, dedupe=True)
+    run_clean(dt=DT)
+    res = run_curate(dt=DT)
+    assert res["skipped"] is False
+    incremental = _facts(project.root)
+
+    run_curate(dt=DT, force=True)
+    assert incremental == _facts(project.root)
+    assert incremental["u1"] == (2, f"{DT}T12:00:00Z")
+    assert set(incremental) == {"u1", "u2", "u3"}
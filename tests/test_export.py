@@ -0,0 +1,25 @@
+from pathlib import Path
+from conftest import DT, event
+from govdemo.pipelines.clean import run_clean
+from govdemo.pipelines.curate import run_curate
+from govdemo.pipelines.export import ExportSegment, run_export_segments
+from govdemo.pipelines.identity import run_build_identity
+from govdemo.pipelines.ingest import run_ingest
+
+def test_segments_report_their_own_missing_dts(project, landing):
+    landing([event("e1", "u1"), event("e2", "u1"), event("e3", "u2")])
+    run_ingest(dt=DT)
+    run_clean(dt=DT)
+    run_curate(dt=DT)
+    run_build_identity(dt=DT)
+
+    res = run_export_segments([ExportSegment("active"), ExportSegment("engaged", min_events=2),
+                               ExportSegment("engaged_30d", min_events=2, window=30)],
+                              start="2026-01-04", end=DT)
+    by_name = {s["segment"]: s for s in res["segments"]}
+    assert res["skipped"] == ["engaged_30d"]
+    assert by_name["engaged_30d"]["missing_dts"] == ["2026-01-04", DT]
+    assert "output_path" not in by_name["engaged_30d"]
+    assert by_name["active"]["missing_dts"] == ["2026-01-04"]
+    assert (by_name["active"]["rows"], by_name["engaged"]["rows"]) == (2, 1)
+    assert Path(by_name["engaged"]["evidence"]).exists()
@@ -0,0 +1,67 @@
+import pyarrow.parquet as pq
+import pytest
+from conftest import DT, event
+from govdemo.common.locator import UserLocator, index_files
+from govdemo.pipelines.clean import run_clean
+from govdemo.pipelines.curate import run_curate
+from govdemo.pipelines.gdpr import LAYER_FILES, request_delete, request_delete_batch
+from govdemo.pipelines.identity import run_build_identity
+from govdemo.pipelines.ingest import run_ingest
+from govdemo.pipelines.serve import run_serve
+
+def _users_by_layer(root) -> dict[str, set[str]]:
+    out = {}
+    for layer, (_, prefix, name) in LAYER_FILES.items():
+        files = sorted(root.glob(f"{prefix}/dt={DT}/{name}"))
+        out[layer] = {u for p in files for u in pq.read_table(p, columns=["user_id"])["user_id"].to_pylist()}
+    return out
+
+@pytest.fixture
+def lake(project, landing):
+    landing([event("e1", "u1"), event("e2", "u1"), event("e3", "u2"), event("e4", "u3")])
+    run_ingest(dt=DT)
+    return project
+
+def _build(compression: str | None = None) -> None:
+    run_clean(dt=DT, compression=compression, force=True)
+    run_curate(dt=DT, force=True)
+    run_serve(dt=DT, force=True)
+    run_build_identity(dt=DT)
+
+def test_delete_removes_only_the_requested_user(lake):
+    _build()
+    res = request_delete("u1")
+    assert (res.cleaned_files, res.curated_files, res.serving_files, res.identity_files) == (1, 1, 1, 1)
+    for layer, users in _users_by_layer(lake.root).items():
+        if layer.endswith("_windows"):
+            continue
+        assert users == {"u2", "u3"}, layer
+
+def test_delete_rewrites_uncompressed_files(lake):
+    _build(compression="none")
+    request_delete_batch(["u1", "u2"])
+    assert _users_by_layer(lake.root)["clean"] == {"u3"}
+
+def test_delete_of_unknown_user_changes_nothing(lake):
+    _build()
+    res = request_delete("nobody")
+    assert (res.cleaned_files, res.curated_files, res.serving_files, res.identity_files) == (0, 0, 0, 0)
+
+def test_delete_requires_a_user_id(lake):
+    with pytest.raises(ValueError):
+        request_delete("")
+
+def test_locator_prunes_row_groups(lake):
+    _build()
+    clean = sorted(lake.root.glob(f"clean/events/dt={DT}/part-*.parquet"))[0]
+    # rewrite the part with one user per row group and index it
+    table = pq.read_table(clean).sort_by("user_id")
+    pq.write_table(table, clean, row_group_size=1)
+    index_files("clean", [clean])
+    groups = {rg: pq.ParquetFile(clean).read_row_group(rg)["user_id"][0].as_py()
+              for rg in range(pq.ParquetFile(clean).num_row_groups)}
+    hits = UserLocator({"u2"}).row_groups(clean)
+    assert hits and {groups[rg] for rg in hits} == {"u2"}
+    # a file changed since it was indexed falls back to statistics, which still prune
+    clean.touch()
+    assert {groups[rg] for rg in UserLocator({"u2"}).row_groups(clean)} == {"u2"}
@@ -0,0 +1,62 @@
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from conftest import DT, event
+from govdemo.common.eventindex import EventIndex
+from govdemo.common.jsonl import RollingPartWriter
+from govdemo.pipelines.ingest import raw_parts, run_ingest
+
+def _lines(paths: list[Path]) -> int:
+    return sum(len(p.read_bytes().splitlines()) for p in paths)
+
+def _quarantined(root: Path, reason: str, dt: str = DT) -> int:
+    return _lines(sorted((root/"quarantine"/"events"/f"dt={dt}"/f"reason={reason}").glob("part-*.jsonl")))
+
+def test_dedupe_after_plain_ingest_appends_nothing(project, landing):
+    landing([event("e1", "u1"), event("e2", "u2")])
+    run_ingest(dt=DT)
+    res = run_ingest(dt=DT, dedupe=True)
+    assert res["good"] == 0 and res["duplicates"] == 2
+    assert _lines(raw_parts(project.root, DT)) == 2
+
+def test_dedupe_after_plain_reingest_keeps_raw(project, landing):
+    landing([event("e1", "u1"), event("e2", "u2")])
+    run_ingest(dt=DT, dedupe=True)
+    # a plain ingest replaces the dt's raw; the index must not keep treating the ids as extra copies
+    run_ingest(dt=DT)
+    landing([event("e1", "u1"), event("e2", "u2"), event("e3", "u3")])
+    res = run_ingest(dt=DT, dedupe=True, workers=2)
+    assert res["good"] == 1 and res["duplicates"] == 2
+    assert _lines(raw_parts(project.root, DT)) == 3
+
+def test_dedupe_checks_other_dts(project, landing):
+    landing([event("e1", "u1")])
+    run_ingest(dt=DT)
+    res = run_ingest(dt="2026-01-06", dedupe=True)
+    assert res["good"] == 0 and res["duplicates"] == 1
+
+def test_dedupe_replay_does_not_requarantine_invalid_records(project, landing):
+    landing([event("e1", "u1"), {"user_id": "u2", "event_time": f"{DT}T10:00:00Z"}])
+    first = run_ingest(dt=DT, dedupe=True)
+    replay = run_ingest(dt=DT, dedupe=True)
+    assert (first["bad"], replay["bad"]) == (1, 0)
+    assert _quarantined(project.root, "MISSING_EVENT_ID") == 1
+    assert _quarantined(project.root, "DUPLICATE") == 1
+
+def test_write_duplicates_quotes_the_path(tmp_path):
+    out = tmp_path/"it's"
+    out.mkdir()
+    with EventIndex(out/"index.duckdb") as index:
+        ids = pa.table({"pos": pa.array([0, 1, 2], pa.int64()), "event_id": ["a", "b", "a"]})
+        assert index.check({0: ids}) == {0: 1}
+        index.write_duplicates(0, out/"dups.parquet")
+    assert pq.read_table(out/"dups.parquet")["pos"].to_pylist() == [2]
+
+def test_rolling_part_writer_splits_large_writes(tmp_path):
+    lines = [f'{{"n": {i}, "pad": "{"x" * (i % 50)}"}}\n'.encode() for i in range(2000)]
+    with RollingPartWriter(tmp_path, max_bytes=4096) as w:
+        w.write(b"".join(lines[:1500]))
+        w.write(b"".join(lines[1500:]))
+    assert b"".join(p.read_bytes() for p in w.parts) == b"".join(lines)
+    assert len(w.parts) > 1
+    assert all(p.stat().st_size <= 4096 and p.read_bytes().endswith(b"\n") for p in w.parts)
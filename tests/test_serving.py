@@ -0,0 +1,53 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from conftest import DT, event
+from govdemo.common.time import check_dt
+from govdemo.pipelines.clean import run_clean
+from govdemo.pipelines.curate import run_curate
+from govdemo.pipelines.ingest import run_ingest
+from govdemo.pipelines.serve import run_serve, serving_files
+from govdemo.serving.cache import UserMetricsCache
+from govdemo.serving.reader import UserMetricsReader
+from govdemo.serving.server import make_server
+
+TRAVERSAL = f"{DT}/../../../curated/facts/dt={DT}"
+
+@pytest.fixture
+def served(project, landing):
+    landing([event("e1", "u1"), event("e2", "u1"), event("e3", "u2")])
+    run_ingest(dt=DT)
+    run_clean(dt=DT)
+    run_curate(dt=DT)
+    run_serve(dt=DT)
+    return project
+
+@pytest.mark.parametrize("dt", [TRAVERSAL, "2026-1-5", "20260105", "2026-02-30", ""])
+def test_check_dt_rejects_non_dates(dt):
+    with pytest.raises(ValueError):
+        check_dt(dt)
+
+def test_reader_and_cache_reject_path_dts(served):
+    with pytest.raises(ValueError):
+        serving_files(served.root, TRAVERSAL, 3)
+    with pytest.raises(ValueError):
+        UserMetricsReader(TRAVERSAL)
+    with pytest.raises(ValueError):
+        UserMetricsCache().get("u1", TRAVERSAL)
+    assert UserMetricsReader(DT).get(["u1"]).to_pylist()[0]["events"] == 2
+
+def test_http_answers_400_for_a_bad_dt(served):
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{base}/users/u1?dt={TRAVERSAL}")
+        assert e.value.code == 400
+        with urllib.request.urlopen(f"{base}/users/u1?dt={DT}") as r:
+            assert json.loads(r.read())["events"] == 2
+    finally:
+        server.shutdown()
+        server.server_close()